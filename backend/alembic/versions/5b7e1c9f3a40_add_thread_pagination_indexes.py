@@ -0,0 +1,31 @@
+"""Add thread pagination indexes
+
+Revision ID: 5b7e1c9f3a40
+Revises: d863efa0b2d0
+Create Date: 2026-10-18 14:03:27.412960
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7e1c9f3a40'
+down_revision: Union[str, None] = 'd863efa0b2d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_threads_user_id_created_at_id', 'threads',
+                    ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_thread_messages_thread_id_created_at_id', 'thread_messages',
+                    ['thread_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_thread_messages_thread_id_created_at_id', table_name='thread_messages')
+    op.drop_index('ix_threads_user_id_created_at_id', table_name='threads')
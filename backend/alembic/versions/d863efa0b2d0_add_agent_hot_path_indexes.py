@@ -0,0 +1,46 @@
+"""Add agent hot path indexes
+
+Revision ID: d863efa0b2d0
+Revises: 02a267591fce
+Create Date: 2026-10-18 09:12:41.538102
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd863efa0b2d0'
+down_revision: Union[str, None] = '02a267591fce'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_threads_user_id_status_created_at', 'threads',
+                    ['user_id', 'status', 'created_at'], unique=False)
+    op.create_index('ix_thread_tasks_thread_id_status', 'thread_tasks',
+                    ['thread_id', 'status'], unique=False)
+    op.create_index('ix_thread_tasks_thread_id_created_at', 'thread_tasks',
+                    ['thread_id', 'created_at'], unique=False)
+    op.create_index('ix_thread_task_plans_thread_task_id_status', 'thread_task_plans',
+                    ['thread_task_id', 'status'], unique=False)
+    op.create_index('ix_plan_subtasks_plan_id_status_ordering', 'plan_subtasks',
+                    ['thread_task_plan_id', 'status', 'ordering'], unique=False)
+    op.create_index('ix_thread_messages_task_id_chat_type_created_at', 'thread_messages',
+                    ['thread_task_id', 'thread_chat_type', 'created_at'], unique=False)
+    op.create_index('ix_thread_task_memory_entries_thread_task_id', 'thread_task_memory_entries',
+                    ['thread_task_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_thread_task_memory_entries_thread_task_id', table_name='thread_task_memory_entries')
+    op.drop_index('ix_thread_messages_task_id_chat_type_created_at', table_name='thread_messages')
+    op.drop_index('ix_plan_subtasks_plan_id_status_ordering', table_name='plan_subtasks')
+    op.drop_index('ix_thread_task_plans_thread_task_id_status', table_name='thread_task_plans')
+    op.drop_index('ix_thread_tasks_thread_id_created_at', table_name='thread_tasks')
+    op.drop_index('ix_thread_tasks_thread_id_status', table_name='thread_tasks')
+    op.drop_index('ix_threads_user_id_status_created_at', table_name='threads')
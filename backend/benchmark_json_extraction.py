@@ -0,0 +1,80 @@
+"""
+Microbenchmark of JSON extraction from model output: the greedy regex extract_json used to run
+(re.search(r"\{.*\}", raw, re.DOTALL) then json.loads) against the bracket scanner in
+utils.procedures, on whole responses and on responses streamed in small chunks.
+
+    python benchmark_json_extraction.py --actions 5 50 500 --chunk-size 16
+"""
+import argparse
+import json
+import re
+import timeit
+from utils.procedures import JSONActionStreamParser, extract_json
+
+
+def regex_extract_json(raw: str):
+    match = re.search(r"\{.*\}", raw, re.DOTALL)
+    if not match:
+        raise ValueError("No valid JSON found in model response.")
+    return json.loads(match.group(0))
+
+
+def model_response(actions: int) -> str:
+    response = {
+        'current_state': {'evaluation_previous_goal': 'Success', 'next_goal': 'Fill in the form {step 2}'},
+        'actions': [
+            {'action': 'type', 'params': {'text': f'Value "{i}" with {{braces}} and \\ backslash'}}
+            for i in range(actions)
+        ],
+    }
+    # No braces in the prose: the regex would start its match there and fail
+    return 'I will fill in the form now.\n```json\n' + json.dumps(response, indent=2) + '\n```'
+
+
+def chunks(text: str, chunk_size: int) -> list:
+    return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+
+def regex_stream(parts: list):
+    # Without an incremental parser the accumulated text is re-extracted as chunks arrive
+    text = ''
+    for part in parts:
+        text += part
+        try:
+            regex_extract_json(text)
+        except ValueError:
+            pass
+
+
+def scanner_stream(parts: list):
+    parser = JSONActionStreamParser()
+    for part in parts:
+        parser.feed(part)
+
+
+def best_ms(function, repeat: int) -> float:
+    return min(timeit.repeat(function, number=1, repeat=repeat)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--actions', type=int, nargs='+', default=[5, 50, 500])
+    parser.add_argument('--chunk-size', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"actions":>8} {"chars":>8} | {"whole: regex":>13} {"scanner":>9} | '
+          f'{"streamed: regex":>16} {"scanner":>9}')
+    for actions in args.actions:
+        raw = model_response(actions)
+        assert regex_extract_json(raw) == extract_json(raw)
+        parts = chunks(raw, args.chunk_size)
+        print(f'{actions:8d} {len(raw):8d} | '
+              f'{best_ms(lambda: regex_extract_json(raw), args.repeat):11.3f}ms '
+              f'{best_ms(lambda: extract_json(raw), args.repeat):7.3f}ms | '
+              f'{best_ms(lambda: regex_stream(parts), args.repeat):14.3f}ms '
+              f'{best_ms(lambda: scanner_stream(parts), args.repeat):7.3f}ms')
+
+
+if __name__ == '__main__':
+    main()
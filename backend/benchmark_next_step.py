@@ -0,0 +1,133 @@
+"""
+Load test for POST /aiagent/{tid}/next_step: --concurrency clients send --requests steps in total
+through httpx.AsyncClient, and the script reports p50/p95 latency and throughput.
+
+The app from main.py runs in-process against a fresh SQLite database with one seeded working
+thread. The model is replaced by a stub that waits --llm-latency-ms (asyncio.sleep when awaited,
+time.sleep when called synchronously), so the numbers measure the request path and how many steps
+one worker keeps in flight. Only main.app, get_llm and the models are used, so the same script runs
+unchanged on an older checkout to get the "before" numbers:
+
+    python benchmark_next_step.py --concurrency 20 --requests 400 --llm-latency-ms 200
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import tempfile
+import time
+
+DB_DIR = tempfile.mkdtemp(prefix='neuralagent-bench-')
+# db.database reads the connection string at import time
+os.environ['DB_CONNECTION_STRING'] = f'sqlite:///{DB_DIR}/bench.db'
+
+import httpx
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import RunnableLambda
+from sqlmodel import SQLModel, Session
+from db.database import engine
+from db.models import (User, Thread, ThreadStatus, ThreadTask, ThreadTaskPlan, PlanSubtask, SubtaskType)
+from dependencies.auth_dependencies import get_current_user_dependency
+from main import app
+from utils import llm_provider
+
+STEP_RESPONSE = '{"current_state": {"evaluation_previous_goal": "Success"}, "actions": [{"action": "wait", "params": {"duration": 1}}]}'
+USAGE = {'input_tokens': 1000, 'output_tokens': 40, 'total_tokens': 1040}
+
+
+def stub_llm(latency_seconds):
+    def invoke(prompt_value):
+        time.sleep(latency_seconds)
+        return AIMessage(content=STEP_RESPONSE, usage_metadata=USAGE)
+
+    async def ainvoke(prompt_value):
+        await asyncio.sleep(latency_seconds)
+        return AIMessage(content=STEP_RESPONSE, usage_metadata=USAGE)
+
+    return RunnableLambda(invoke, afunc=ainvoke)
+
+
+def seed():
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as db:
+        user = User(name='Bench', email='bench@example.com')
+        db.add(user)
+        db.commit()
+        thread = Thread(title='Bench', user_id=user.id, status=ThreadStatus.WORKING)
+        db.add(thread)
+        db.commit()
+        task = ThreadTask(thread_id=thread.id, task_text='Open the calculator')
+        db.add(task)
+        db.commit()
+        plan = ThreadTaskPlan(thread_task_id=task.id)
+        db.add(plan)
+        db.commit()
+        db.add(PlanSubtask(thread_task_plan_id=plan.id, subtask_text='Open the calculator',
+                           subtask_type=SubtaskType.DESKTOP, ordering=1))
+        db.commit()
+        return User(id=user.id, name=user.name, email=user.email), thread.id
+
+
+def observation(step):
+    return {
+        'current_os': 'Windows',
+        'current_running_apps': [{'name': 'explorer.exe'}],
+        'current_interactive_elements': [
+            {'id': i, 'type': 'ButtonControl', 'name': f'Button {i} ({step})', 'x': i * 10, 'y': 20,
+             'width': 80, 'height': 24}
+            for i in range(40)
+        ],
+    }
+
+
+async def run(client, tid, concurrency, total):
+    latencies = []
+    failures = 0
+    remaining = iter(range(total))
+
+    async def worker():
+        nonlocal failures
+        for step in remaining:
+            started = time.perf_counter()
+            response = await client.post(f'/aiagent/{tid}/next_step', json=observation(step))
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                failures += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, failures, time.perf_counter() - started
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=400)
+    parser.add_argument('--llm-latency-ms', type=float, default=200, help='simulated model response time')
+    args = parser.parse_args()
+
+    os.environ.setdefault('COMPUTER_USE_AGENT_MODEL_TYPE', 'bench')
+    os.environ.setdefault('COMPUTER_USE_AGENT_MODEL_ID', 'bench')
+    llm = stub_llm(args.llm_latency_ms / 1000)
+    llm_provider.get_llm = lambda *a, **kw: llm
+
+    user, tid = seed()
+    app.dependency_overrides[get_current_user_dependency] = lambda: user
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+        # The endpoints print token usage per step; keep that out of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            await run(client, tid, 1, 3)
+            latencies, failures, elapsed = await run(client, tid, args.concurrency, args.requests)
+
+    cut_points = statistics.quantiles(latencies, n=100)
+    print(f'{args.requests} requests, concurrency {args.concurrency}, model latency {args.llm_latency_ms}ms')
+    print(f'p50 {cut_points[49]:.1f}ms  p95 {cut_points[94]:.1f}ms  max {max(latencies):.1f}ms  '
+          f'{args.requests / elapsed:.1f} req/s  {failures} failed')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
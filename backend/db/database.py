@@ -1,6 +1,13 @@
 from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from dotenv import load_dotenv
+import threading
+import time
 import os
 
 load_dotenv()
@@ -19,10 +26,140 @@ if not connection_string:
         # Local developer-friendly fallback
         connection_string = 'sqlite:///./neuralagent.db'
 
-engine = create_engine(connection_string, echo=True)
+# Pool / driver tuning, configurable per environment
+DB_ECHO = os.getenv('DB_ECHO', 'false').lower() == 'true'
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '30000'))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+
+_pool_stats_lock = threading.Lock()
+_pool_stats = {}
+
+
+def _record_checkout_wait(pool_name: str, waited: float) -> None:
+    with _pool_stats_lock:
+        stats = _pool_stats.setdefault(pool_name, {'checkouts': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0})
+        stats['checkouts'] += 1
+        stats['wait_seconds_total'] += waited
+        stats['wait_seconds_max'] = max(stats['wait_seconds_max'], waited)
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long callers waited for a connection."""
+    pool_name = 'sync'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _record_checkout_wait(self.pool_name, time.perf_counter() - started)
+
+
+class TimedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    pool_name = 'async'
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _record_checkout_wait(self.pool_name, time.perf_counter() - started)
+
+
+def _engine_kwargs(url: str, poolclass) -> dict:
+    parsed = make_url(url)
+    kwargs = {'echo': DB_ECHO}
+    if parsed.get_backend_name() == 'sqlite':
+        kwargs['connect_args'] = {'timeout': SQLITE_BUSY_TIMEOUT_MS / 1000}
+        if parsed.database in (None, '', ':memory:'):
+            # In-memory databases live in a single connection; pool settings do not apply
+            return kwargs
+    elif parsed.get_backend_name() == 'postgresql':
+        if parsed.get_driver_name() == 'asyncpg':
+            kwargs['connect_args'] = {'server_settings': {'statement_timeout': str(DB_STATEMENT_TIMEOUT_MS)}}
+        else:
+            kwargs['connect_args'] = {'options': f'-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}'}
+
+    kwargs.update(
+        poolclass=poolclass,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    return kwargs
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}')
+    cursor.close()
+
+
+engine = create_engine(connection_string, **_engine_kwargs(connection_string, TimedQueuePool))
 
 SessionLocal = sessionmaker(class_=Session, bind=engine, autocommit=False, autoflush=False)
 
+# Async drivers used by the agent step endpoints so a single worker can keep many LLM calls in flight
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def get_async_connection_string(url: str) -> str:
+    parsed = make_url(url)
+    async_driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if not async_driver:
+        raise ValueError(f"No async driver configured for database backend '{parsed.get_backend_name()}'")
+    return parsed.set(drivername=async_driver).render_as_string(hide_password=False)
+
+
+async_connection_string = get_async_connection_string(connection_string)
+async_engine = create_async_engine(async_connection_string,
+                                   **_engine_kwargs(async_connection_string, TimedAsyncAdaptedQueuePool))
+
+if make_url(connection_string).get_backend_name() == 'sqlite':
+    event.listen(engine, 'connect', _set_sqlite_pragmas)
+    event.listen(async_engine.sync_engine, 'connect', _set_sqlite_pragmas)
+
+# expire_on_commit is disabled because expired attributes would trigger implicit (sync) lazy loads
+AsyncSessionLocal = async_sessionmaker(class_=AsyncSession, bind=async_engine, autoflush=False,
+                                       expire_on_commit=False)
+
+
+def _pool_metrics(pool_name: str, pool) -> dict:
+    metrics = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        metrics.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+            max_overflow=DB_MAX_OVERFLOW,
+            utilisation=round(pool.checkedout() / max(1, pool.size() + DB_MAX_OVERFLOW), 3),
+        )
+    with _pool_stats_lock:
+        stats = dict(_pool_stats.get(pool_name, {'checkouts': 0, 'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0}))
+    stats['wait_seconds_avg'] = stats['wait_seconds_total'] / stats['checkouts'] if stats['checkouts'] else 0.0
+    metrics.update(stats)
+    return metrics
+
+
+def get_pool_metrics() -> dict:
+    return {
+        'sync': _pool_metrics(TimedQueuePool.pool_name, engine.pool),
+        'async': _pool_metrics(TimedAsyncAdaptedQueuePool.pool_name, async_engine.sync_engine.pool),
+    }
+
 
 def get_session():
     session = SessionLocal()
@@ -30,3 +167,8 @@ def get_session():
         yield session
     finally:
         session.close()
+
+
+async def get_async_session():
+    async with AsyncSessionLocal() as session:
+        yield session
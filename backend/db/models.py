@@ -2,7 +2,7 @@ from sqlmodel import SQLModel, Field, Relationship
 from typing import Optional, List
 import datetime
 from enum import Enum
-from sqlalchemy import Column, Text
+from sqlalchemy import Column, Text, Index
 from utils.procedures import generate_user_id, generate_ver_token, generate_random_number, generate_thread_id
 
 
@@ -81,6 +81,10 @@ class ThreadStatus(str, Enum):
 
 class Thread(SQLModel, table=True):
     __tablename__ = 'threads'
+    __table_args__ = (
+        Index('ix_threads_user_id_status_created_at', 'user_id', 'status', 'created_at'),
+        Index('ix_threads_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+    )
 
     id: Optional[str] = Field(primary_key=True, index=True, nullable=False, default_factory=generate_thread_id)
     title: str = Field(nullable=False)
@@ -105,6 +109,10 @@ class ThreadTaskStatus(str, Enum):
 
 class ThreadTask(SQLModel, table=True):
     __tablename__ = 'thread_tasks'
+    __table_args__ = (
+        Index('ix_thread_tasks_thread_id_status', 'thread_id', 'status'),
+        Index('ix_thread_tasks_thread_id_created_at', 'thread_id', 'created_at'),
+    )
 
     id: Optional[int] = Field(primary_key=True, index=True, nullable=False)
     thread_id: str = Field(nullable=False, foreign_key='threads.id')
@@ -134,6 +142,9 @@ class ThreadTaskPlanStatus(str, Enum):
 
 class ThreadTaskPlan(SQLModel, table=True):
     __tablename__ = 'thread_task_plans'
+    __table_args__ = (
+        Index('ix_thread_task_plans_thread_task_id_status', 'thread_task_id', 'status'),
+    )
 
     id: Optional[int] = Field(primary_key=True, index=True, nullable=False)
     thread_task_id: Optional[int] = Field(nullable=True, foreign_key='thread_tasks.id')
@@ -161,6 +172,9 @@ class SubtaskType(str, Enum):
 
 class PlanSubtask(SQLModel, table=True):
     __tablename__ = 'plan_subtasks'
+    __table_args__ = (
+        Index('ix_plan_subtasks_plan_id_status_ordering', 'thread_task_plan_id', 'status', 'ordering'),
+    )
 
     id: Optional[int] = Field(primary_key=True, index=True, nullable=False)
     thread_task_plan_id: Optional[int] = Field(nullable=True, foreign_key='thread_task_plans.id')
@@ -179,6 +193,9 @@ class PlanSubtask(SQLModel, table=True):
 
 class ThreadTaskMemoryEntry(SQLModel, table=True):
     __tablename__ = 'thread_task_memory_entries'
+    __table_args__ = (
+        Index('ix_thread_task_memory_entries_thread_task_id', 'thread_task_id'),
+    )
 
     id: Optional[int] = Field(primary_key=True, index=True, nullable=False)
     thread_task_id: Optional[int] = Field(nullable=True, foreign_key='thread_tasks.id')
@@ -211,6 +228,10 @@ class ThreadChatFromChoices(str, Enum):
 
 class ThreadMessage(SQLModel, table=True):
     __tablename__ = 'thread_messages'
+    __table_args__ = (
+        Index('ix_thread_messages_task_id_chat_type_created_at', 'thread_task_id', 'thread_chat_type', 'created_at'),
+        Index('ix_thread_messages_thread_id_created_at_id', 'thread_id', 'created_at', 'id'),
+    )
 
     id: Optional[int] = Field(primary_key=True, index=True, nullable=False)
     thread_id: str = Field(nullable=False, foreign_key='threads.id')
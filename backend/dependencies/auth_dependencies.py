@@ -1,10 +1,11 @@
 from fastapi import Depends, status
 from utils.auth_helper import decode_token
 from fastapi.security import OAuth2PasswordBearer
-from db.database import get_session
+from db.database import get_session, SessionLocal
 from sqlmodel import Session, select
 from db.models import User, LoginSession, UserType
 from utils.procedures import CustomError
+from typing import Optional
 import os
 from dotenv import load_dotenv
 
@@ -31,32 +32,56 @@ def _get_or_create_local_user(db: Session) -> User:
     return user
 
 
-def get_current_user_dependency(token: str = Depends(oauth2_scheme) if not PRIVATE_MODE else None, db: Session = Depends(get_session)):
-    if PRIVATE_MODE:
-        # Bypass auth, return or create a single local user
-        return _get_or_create_local_user(db)
+def _authenticate_token(token: str, db: Session) -> User:
+    payload = decode_token(token)
+    user_id = payload.get('user_id')
 
-    try:
-        payload = decode_token(token)
-        user_id = payload.get('user_id')
+    u_query = select(User).where(User.id == user_id)
+    user = db.exec(u_query).first()
 
-        u_query = select(User).where(User.id == user_id)
-        user = db.exec(u_query).first()
+    if not user:
+        raise CustomError(status_code=status.HTTP_401_UNAUTHORIZED, message='Invalid_Token')
 
-        if not user:
-            raise CustomError(status_code=status.HTTP_401_UNAUTHORIZED, message='Invalid_Token')
+    session_id = payload.get('session_id')
+    s_query = select(LoginSession).where(LoginSession.id == session_id)
+    login_session = db.exec(s_query).first()
 
-        session_id = payload.get('session_id')
-        s_query = select(LoginSession).where(LoginSession.id == session_id)
-        login_session = db.exec(s_query).first()
+    if not login_session or login_session.is_logged_out is True:
+        raise CustomError(status_code=status.HTTP_401_UNAUTHORIZED, message='Invalid_Token')
 
-        if not login_session or login_session.is_logged_out is True:
-            raise CustomError(status_code=status.HTTP_401_UNAUTHORIZED, message='Invalid_Token')
+    if user.is_blocked is True:
+        raise CustomError(status_code=status.HTTP_403_FORBIDDEN, message='You_Are_Blocked')
 
-        if user.is_blocked is True:
-            raise CustomError(status_code=status.HTTP_403_FORBIDDEN, message='You_Are_Blocked')
+    return user
 
-        return user
 
+def get_current_user_dependency(token: str = Depends(oauth2_scheme) if not PRIVATE_MODE else None, db: Session = Depends(get_session)):
+    if PRIVATE_MODE:
+        # Bypass auth, return or create a single local user
+        return _get_or_create_local_user(db)
+
+    try:
+        return _authenticate_token(token, db)
     except Exception:
         raise CustomError(status_code=status.HTTP_401_UNAUTHORIZED, message='Invalid_Token')
+
+
+def get_admin_user_dependency(user: User = Depends(get_current_user_dependency)):
+    if user.user_type != UserType.ADMIN_USER:
+        raise CustomError(status_code=status.HTTP_403_FORBIDDEN, message='Not_Allowed')
+    return user
+
+
+def get_websocket_user(token: Optional[str]) -> Optional[User]:
+    """
+    Authenticate a WebSocket connection once, at handshake time. Browsers cannot set headers on
+    WebSocket requests, so the access token is passed as a query parameter instead.
+    Returns None when the token is invalid.
+    """
+    with SessionLocal() as db:
+        if PRIVATE_MODE:
+            return _get_or_create_local_user(db)
+        try:
+            return _authenticate_token(token, db)
+        except Exception:
+            return None
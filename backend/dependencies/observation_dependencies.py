@@ -0,0 +1,43 @@
+import base64
+import json
+from typing import Type
+from fastapi import Request, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from utils.procedures import CustomError
+
+
+def observation_body(model: Type[BaseModel]):
+    """
+    Dependency that reads a step request either as the usual JSON body or as multipart/form-data
+    with the JSON in a "payload" part and the screenshot as a binary "screenshot" file part, which
+    spares the client base64-encoding the image (a third larger on the wire). The file part fills
+    screenshot_b64, and screenshot_media_type from the part's content type when the payload has none.
+    """
+    async def parse_observation_body(request: Request) -> BaseModel:
+        content_type = request.headers.get('content-type', '')
+        try:
+            if content_type.startswith('multipart/form-data'):
+                form = await request.form()
+                payload = form.get('payload') or '{}'
+                if not isinstance(payload, str):
+                    payload = await payload.read()
+                data = json.loads(payload)
+                screenshot = form.get('screenshot')
+                if screenshot is not None and not isinstance(screenshot, str):
+                    data['screenshot_b64'] = base64.b64encode(await screenshot.read()).decode('utf-8')
+                    if not data.get('screenshot_media_type'):
+                        data['screenshot_media_type'] = screenshot.content_type
+            else:
+                data = await request.json()
+        except ValueError:
+            raise CustomError(status.HTTP_400_BAD_REQUEST, 'Invalid_Request_Body')
+
+        if not isinstance(data, dict):
+            raise CustomError(status.HTTP_400_BAD_REQUEST, 'Invalid_Request_Body')
+        try:
+            return model(**data)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+
+    return parse_observation_body
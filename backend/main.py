@@ -1,22 +1,35 @@
 import datetime
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Depends
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from routers.apps.auth import router as userauth_router
 from routers.aiagent.generic import router as aiagent_router
+from routers.aiagent.session import router as agent_session_router
 from routers.apps.threads import router as threads_router
+from routers.apps.thread_events import router as thread_events_router
 from routers.aiagent.suggestor import router as suggestor_aiagent_router
 from routers.aiagent.background import router as bg_mode_aiagent_router
 from routers.apps.voice import router as voice_router
 from utils.procedures import CustomError
+from dependencies.auth_dependencies import get_admin_user_dependency
+from utils.content_encoding import RequestDecompressionMiddleware
+from db.database import get_pool_metrics
+from utils.llm_provider import get_usage_metrics, close_llm_clients
+from utils import classifier_cache
+from utils.realtime import thread_event_broker
 
 from dotenv import load_dotenv
+import os
 load_dotenv()
 
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+
 app = FastAPI(
     title='NeuralAgent'
 )
 
+# Registered before CORS so it runs inside it (the last one added is outermost) and its rejections get CORS headers
+app.add_middleware(RequestDecompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -38,21 +51,36 @@ async def custom_http_exception_handler(request: Request, exc: CustomError):
 
 app.include_router(userauth_router)
 app.include_router(threads_router)
+app.include_router(thread_events_router)
 app.include_router(suggestor_aiagent_router)
 app.include_router(bg_mode_aiagent_router)
 app.include_router(aiagent_router)
+app.include_router(agent_session_router)
 app.include_router(voice_router)
 
-# @app.on_event('startup')
-# async def startup():
-#     await broadcast.connect()
-#
-#
-# @app.on_event('shutdown')
-# async def shutdown():
-#     await broadcast.disconnect()
+
+@app.on_event('startup')
+async def startup():
+    await thread_event_broker.connect()
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    await thread_event_broker.disconnect()
+    await close_llm_clients()
 
 
 @app.get('/')
 async def index():
     return {'message': datetime.datetime.now()}
+
+
+# Internal stats, only mounted when enabled and only for admin users
+if METRICS_ENABLED:
+    @app.get('/metrics', dependencies=[Depends(get_admin_user_dependency)])
+    async def metrics():
+        return {
+            'db_pool': get_pool_metrics(),
+            'llm_usage': get_usage_metrics(),
+            'classifier_cache': classifier_cache.get_metrics(),
+        }
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, UploadFile, File, status
-from sqlmodel import Session, select, and_
-from db.database import get_session
+from fastapi.responses import StreamingResponse
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db.database import get_async_session, AsyncSessionLocal
 from typing import Optional
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
@@ -10,14 +11,18 @@ from langchain_aws import ChatBedrockConverse
 from langchain_openai import AzureChatOpenAI
 import json
 from utils import ai_prompts
-from utils.procedures import CustomError, extract_json, extract_json_array
+from utils.procedures import CustomError, extract_json, extract_json_array, JSONActionStreamParser
 from dependencies.auth_dependencies import get_current_user_dependency
-from db.models import (User, Thread, ThreadStatus, ThreadTask, ThreadTaskStatus, ThreadMessage,
+from dependencies.observation_dependencies import observation_body
+from db.models import (User, ThreadStatus, ThreadTaskStatus, ThreadMessage,
                        ThreadChatType, ThreadChatFromChoices, ThreadTaskPlan, ThreadTaskPlanStatus,
                        PlanSubtask, SubtaskStatus, ThreadTaskMemoryEntry, SubtaskType)
 from schemas.aiagent import NextStepRequest, CurrentSubtaskRequestObj
-from utils.agentic_tools import run_tool_server_side
+from utils.agentic_tools import arun_tool_server_side
 from utils import llm_provider
+from utils.screenshots import screenshot_block, resolve_screenshot
+from utils.step_context import StepContext, load_step_context, load_previous_tasks
+from utils.element_codec import resolve_elements, format_elements_for_prompt
 
 
 router = APIRouter(
@@ -28,49 +33,49 @@ router = APIRouter(
 
 
 @router.post('/{tid}/current_subtask')
-def current_subtask_request(tid: str, current_subtask_request_obj: CurrentSubtaskRequestObj,
-                            db: Session = Depends(get_session), user: User = Depends(get_current_user_dependency)):
-    instance = db.exec(select(Thread).where(and_(
-        Thread.id == tid,
-        Thread.user_id == user.id,
-        Thread.status == ThreadStatus.WORKING
-    ))).first()
-
-    if not instance:
-        raise CustomError(status.HTTP_404_NOT_FOUND, 'Thread not found')
-
-    task = db.exec(select(ThreadTask).where(and_(
-        ThreadTask.thread_id == tid,
-        ThreadTask.status == ThreadTaskStatus.WORKING,
-    ))).first()
-
-    if not task:
-        raise CustomError(status.HTTP_404_NOT_FOUND, 'Thread has no running task')
-
-    current_plan = db.exec(select(ThreadTaskPlan).where(and_(
-        ThreadTaskPlan.thread_task_id == task.id,
-        ThreadTaskPlan.status == ThreadTaskPlanStatus.ACTIVE,
-    ))).first()
+async def current_subtask_request(tid: str, current_subtask_request_obj: CurrentSubtaskRequestObj,
+                                  db: AsyncSession = Depends(get_async_session),
+                                  user: User = Depends(get_current_user_dependency)):
+    return await run_current_subtask(db, tid, user, current_subtask_request_obj)
+
+
+async def run_current_subtask(db: AsyncSession, tid: str, user: User,
+                              current_subtask_request_obj: CurrentSubtaskRequestObj) -> dict:
+    step_context = await load_step_context(db, tid, user.id)
+    # Resolved once the thread is known to belong to the user
+    resolve_elements(tid, current_subtask_request_obj)
+    return await _advance_plan(db, step_context, user, current_subtask_request_obj)
+
+
+def _subtask_summary(subtask: PlanSubtask) -> dict:
+    return {
+        'id': subtask.id,
+        'subtask_text': subtask.subtask_text,
+        'subtask_type': subtask.subtask_type,
+        'status': subtask.status,
+    }
+
+
+async def _advance_plan(db: AsyncSession, step_context: StepContext, user: User, observation) -> dict:
+    """
+    Plan the task if it has no plan yet and return the current subtask, or complete the task when
+    no subtask is left. `observation` is any request carrying current_os, interactive elements and apps.
+    """
+    current_subtask_request_obj = observation
+    instance = step_context.thread
+    task = step_context.task
+    current_plan = step_context.plan
+    current_subtask = step_context.subtask
 
     if not current_plan:
-        previous_tasks = db.exec(select(ThreadTask).where(and_(
-            ThreadTask.thread.has(Thread.user_id == user.id),
-            ThreadTask.thread.has(Thread.status != ThreadStatus.DELETED),
-            ThreadTask.status != ThreadTaskStatus.WORKING,
-        )).order_by(ThreadTask.created_at.desc()).limit(10)).all()
-        previous_tasks_arr = []
-        for previous_task in previous_tasks:
-            previous_tasks_arr.append({
-                'task': previous_task.task_text,
-                'status': previous_task.status,
-            })
+        previous_tasks_arr = list(await load_previous_tasks(db, user.id, limit=10, only_finished=True))
 
         llm = llm_provider.get_llm(agent='planner', temperature=0.3)
 
         plan_user_message = [
             {
                 'type': 'text',
-                'text': f'Current OS: {current_subtask_request_obj.current_os} \n\nCurrent Visible OS Native Interactive Elements: {json.dumps(current_subtask_request_obj.current_interactive_elements)}'
+                'text': f'Current OS: {current_subtask_request_obj.current_os} \n\nCurrent Visible OS Native Interactive Elements: \n{format_elements_for_prompt(current_subtask_request_obj.current_interactive_elements)}'
             },
             {
                 'type': 'text',
@@ -90,12 +95,15 @@ def current_subtask_request(tid: str, current_subtask_request_obj: CurrentSubtas
         })
 
         plan_prompt = ChatPromptTemplate.from_messages([
-            SystemMessage(ai_prompts.PLANNER_AGENT_PROMPT),
+            SystemMessage(llm_provider.with_cache_breakpoint('planner', [
+                {'type': 'text', 'text': ai_prompts.PLANNER_AGENT_PROMPT},
+            ])),
             HumanMessage(content=plan_user_message),
         ])
 
         chain = plan_prompt | llm
-        plan_response = chain.invoke({})
+        plan_response = await chain.ainvoke({})
+        llm_provider.record_usage('planner', plan_response.usage_metadata)
         plan_response_data = extract_json(plan_response.content)
 
         plan = plan_response_data.get('subtasks')
@@ -107,49 +115,36 @@ def current_subtask_request(tid: str, current_subtask_request_obj: CurrentSubtas
             text=json.dumps(plan_response_data),
         )
         db.add(plan_ai_message)
-        db.commit()
-        db.refresh(plan_ai_message)
 
         current_plan = ThreadTaskPlan(
             thread_task_id=task.id,
         )
         db.add(current_plan)
-        db.commit()
-        db.refresh(current_plan)
+        # Only the plan id is needed up front; the subtasks go out with the step's single commit
+        await db.flush()
 
         for i, subtask_item in enumerate(plan):
             subtask = PlanSubtask(
                 thread_task_plan_id=current_plan.id,
                 subtask_text=subtask_item.get('subtask'),
                 subtask_type=SubtaskType.DESKTOP,
-                # subtask_type=SubtaskType.DESKTOP if subtask_item.get(
-                #     'type') == 'desktop_subtask' else SubtaskType.BROWSER,
                 ordering=i + 1,
             )
             db.add(subtask)
-            db.commit()
-            db.refresh(subtask)
+            if current_subtask is None:
+                current_subtask = subtask
 
-    current_subtask = db.exec(select(PlanSubtask).where(and_(
-        PlanSubtask.status == SubtaskStatus.ACTIVE,
-        PlanSubtask.thread_task_plan_id == current_plan.id
-    )).order_by(PlanSubtask.ordering.asc())).first()
+        await db.commit()
 
     if not current_subtask:
         current_plan.status = ThreadTaskPlanStatus.COMPLETED
         db.add(current_plan)
-        db.commit()
-        db.refresh(current_plan)
 
         task.status = ThreadTaskStatus.COMPLETED
         db.add(task)
-        db.commit()
-        db.refresh(task)
 
         instance.status = ThreadStatus.STANDBY
         db.add(instance)
-        db.commit()
-        db.refresh(instance)
 
         ai_message = ThreadMessage(
             thread_id=instance.id,
@@ -159,131 +154,69 @@ def current_subtask_request(tid: str, current_subtask_request_obj: CurrentSubtas
             text=json.dumps({'actions': [{'action': 'task_completed'}]}),
         )
         db.add(ai_message)
-        db.commit()
-        db.refresh(ai_message)
+        await db.commit()
 
         return {'action': 'task_completed'}
 
-    return {
-        'id': current_subtask.id,
-        'subtask_text': current_subtask.subtask_text,
-        'subtask_type': current_subtask.subtask_type,
-        'status': current_subtask.status,
-    }
+    return _subtask_summary(current_subtask)
 
 
-@router.post('/{tid}/next_step')
-def next_step(tid: str, next_step_req: NextStepRequest, db: Session = Depends(get_session),
-              user: User = Depends(get_current_user_dependency)):
-    instance = db.exec(select(Thread).where(and_(
-        Thread.id == tid,
-        Thread.user_id == user.id,
-        Thread.status == ThreadStatus.WORKING
-    ))).first()
-
-    if not instance:
-        raise CustomError(status.HTTP_404_NOT_FOUND, 'Thread not found')
-
-    task = db.exec(select(ThreadTask).where(and_(
-        ThreadTask.thread_id == tid,
-        ThreadTask.status == ThreadTaskStatus.WORKING,
-    ))).first()
-
-    if not task:
-        raise CustomError(status.HTTP_404_NOT_FOUND, 'Thread has no running task')
-
-    current_plan = db.exec(select(ThreadTaskPlan).where(and_(
-        ThreadTaskPlan.thread_task_id == task.id,
-        ThreadTaskPlan.status == ThreadTaskPlanStatus.ACTIVE,
-    ))).first()
-
-    current_subtask = db.exec(select(PlanSubtask).where(and_(
-        PlanSubtask.status == SubtaskStatus.ACTIVE,
-        PlanSubtask.thread_task_plan_id == current_plan.id
-    )).order_by(PlanSubtask.ordering.asc())).first()
+async def _load_desktop_step_context(db: AsyncSession, tid: str, user: User) -> StepContext:
+    step_context = await load_step_context(
+        db, tid, user.id,
+        action_chat_type=ThreadChatType.DESKTOP_USE,
+        include_previous_subtasks=True,
+        include_memory=True,
+    )
+    current_subtask = step_context.subtask
     if not current_subtask or current_subtask.subtask_type != SubtaskType.DESKTOP:
         raise CustomError(status.HTTP_404_NOT_FOUND, 'No Current Desktop Task!')
 
+    return step_context
+
+
+def _build_next_step_chain(step_context: StepContext, next_step_req: NextStepRequest):
+    task = step_context.task
+    current_subtask = step_context.subtask
+
     if task.extended_thinking_mode is True:
         llm = llm_provider.get_llm(agent='computer_use', temperature=1.0, thinking_enabled=True)
     else:
         llm = llm_provider.get_llm(agent='computer_use', temperature=0.0)
 
-    previous_subtasks = db.exec(select(PlanSubtask).where(and_(
-        PlanSubtask.status != SubtaskStatus.ACTIVE,
-        PlanSubtask.plan.has(ThreadTaskPlan.thread_task_id == task.id)
-    )).order_by(PlanSubtask.ordering.asc())).all()
-    previous_subtasks_arr = []
-    for previous_subtask in previous_subtasks:
-        previous_subtasks_arr.append({
-            'subtask_text': previous_subtask.subtask_text,
-            'status': previous_subtask.status,
-        })
+    previous_subtasks_arr = list(step_context.previous_subtasks)
 
     screenshot_user_message_block = None
     if next_step_req.screenshot_b64:
-        screenshot_user_message_block = {
-            "type": "image",
-            "source": {
-                "type": "base64",
-                "media_type": "image/png",
-                "data": next_step_req.screenshot_b64
-            }
-        }
+        screenshot_user_message_block = screenshot_block(next_step_req.screenshot_b64, next_step_req.screenshot_media_type)
 
-    action_history = []
-    task_previous_messages = db.exec(
-        select(ThreadMessage)
-        .where(
-            and_(
-                ThreadMessage.thread_task_id == task.id,
-                ThreadMessage.thread_chat_type == ThreadChatType.DESKTOP_USE,
-            )
-        )
-        .order_by(ThreadMessage.created_at.desc())  # Adjust if your timestamp column is named differently
-        .limit(5)
-    ).all()
-    for previous_message in task_previous_messages:
-        previous_action_dict = json.loads(previous_message.text)
-        # previous_action_dict.pop("current_state", None)
-        action_history.append(previous_action_dict)
-
-    if task.needs_memory_from_previous_tasks is True:
-        tasks_for_memory = db.exec(select(ThreadTask).where(and_(
-            ThreadTask.thread.has(Thread.user_id == user.id),
-            ThreadTask.thread.has(Thread.status != ThreadStatus.DELETED),
-        )).order_by(ThreadTask.created_at.desc()).limit(5)).all()
-        tasks_for_memory_ids = [task.id for task in tasks_for_memory]
-        memory_items = db.exec(
-            select(ThreadTaskMemoryEntry).where(
-                ThreadTaskMemoryEntry.thread_task_id.in_(tasks_for_memory_ids)
-            )
-        ).all()
-    else:
-        memory_items = db.exec(select(ThreadTaskMemoryEntry).where(
-            ThreadTaskMemoryEntry.thread_task_id == task.id
-        )).all()
-
-    memory_items_arr = []
-    for memory_item in memory_items:
-        memory_items_arr.append({
-            'memory_item_text': memory_item.text,
-        })
+    action_history = list(step_context.action_history)
+    memory_items_arr = list(step_context.memory_items)
 
+    # Stable prefix first (unchanged for every step of the subtask) so it can be served from the prompt cache
     computer_use_user_message = [
         {
             'type': 'text',
             'text': f'Current Subtask: {current_subtask.subtask_text}'
         },
+    ]
+    if len(previous_subtasks_arr) > 0:
+        computer_use_user_message.append({
+            'type': 'text',
+            'text': f'Previous Subtasks: \n {json.dumps(previous_subtasks_arr)}'
+        })
+    computer_use_user_message = llm_provider.with_cache_breakpoint('computer_use', computer_use_user_message)
+
+    computer_use_user_message.extend([
         {
             'type': 'text',
-            'text': f'Current OS: {next_step_req.current_os} \n\nCurrent Visible OS Native Interactive Elements: {json.dumps(next_step_req.current_interactive_elements)}'
+            'text': f'Current OS: {next_step_req.current_os} \n\nCurrent Visible OS Native Interactive Elements: \n{format_elements_for_prompt(next_step_req.current_interactive_elements)}'
         },
         {
             'type': 'text',
             'text': f'Current Running Apps: {json.dumps(next_step_req.current_running_apps)}'
         }
-    ]
+    ])
 
     if len(memory_items_arr) > 0:
         computer_use_user_message.append({
@@ -295,43 +228,53 @@ def next_step(tid: str, next_step_req: NextStepRequest, db: Session = Depends(ge
             'type': 'text',
             'text': f'Previous Actions: \n {json.dumps(action_history)}'
         })
-    if len(previous_subtasks_arr) > 0:
-        computer_use_user_message.append({
-            'type': 'text',
-            'text': f'Previous Subtasks: \n {json.dumps(previous_subtasks_arr)}'
-        })
     
     if screenshot_user_message_block:
         computer_use_user_message.append(screenshot_user_message_block)
 
     prompt = ChatPromptTemplate.from_messages([
-        SystemMessage(content=ai_prompts.COMPUTER_USE_SYSTEM_PROMPT),
+        SystemMessage(content=llm_provider.with_cache_breakpoint('computer_use', [
+            {'type': 'text', 'text': ai_prompts.COMPUTER_USE_SYSTEM_PROMPT},
+        ])),
         HumanMessage(content=computer_use_user_message),
     ])
 
-    chain = prompt | llm
-    response = chain.invoke({})
+    return prompt | llm
 
-    print('Token Usage: ', response.usage_metadata)
 
-    response_data = None
-    if task.extended_thinking_mode is True:
-        for response_item in response.content:
-            if response_item.get('type') == 'reasoning_content':
-                thinking_message = ThreadMessage(
-                    thread_id=instance.id,
-                    thread_task_id=task.id,
-                    thread_chat_type=ThreadChatType.THINKING,
-                    thread_chat_from=ThreadChatFromChoices.FROM_AI,
-                    chain_of_thought=response_item.get('reasoning_content', {}).get('text'),
-                )
-                db.add(thinking_message)
-                db.commit()
-                db.refresh(thinking_message)
-            elif response_item.get('type') == 'text':
-                response_data = extract_json(response_item.get('text'))
-    else:
-        response_data = extract_json(response.content)
+def _split_response_content(content):
+    """Split a model message (or stream chunk) into its answer text and any reasoning texts."""
+    if isinstance(content, str):
+        return content, []
+
+    text_parts = []
+    reasoning_parts = []
+    for response_item in content:
+        if isinstance(response_item, str):
+            text_parts.append(response_item)
+        elif response_item.get('type') == 'reasoning_content':
+            reasoning_parts.append(response_item.get('reasoning_content', {}).get('text') or '')
+        elif response_item.get('type') == 'text':
+            text_parts.append(response_item.get('text') or '')
+    return ''.join(text_parts), reasoning_parts
+
+
+async def _persist_next_step(db: AsyncSession, step_context: StepContext, response_data: dict,
+                             reasoning_texts: list):
+    instance = step_context.thread
+    task = step_context.task
+    current_plan = step_context.plan
+    current_subtask = step_context.subtask
+
+    for reasoning_text in reasoning_texts:
+        thinking_message = ThreadMessage(
+            thread_id=instance.id,
+            thread_task_id=task.id,
+            thread_chat_type=ThreadChatType.THINKING,
+            thread_chat_from=ThreadChatFromChoices.FROM_AI,
+            chain_of_thought=reasoning_text,
+        )
+        db.add(thinking_message)
 
     ai_message = ThreadMessage(
         thread_id=instance.id,
@@ -342,8 +285,6 @@ def next_step(tid: str, next_step_req: NextStepRequest, db: Session = Depends(ge
         text=json.dumps(response_data),
     )
     db.add(ai_message)
-    db.commit()
-    db.refresh(ai_message)
 
     if response_data.get('current_state', {}).get('save_to_memory', False):
         memory_text = response_data['current_state'].get('memory')
@@ -353,8 +294,6 @@ def next_step(tid: str, next_step_req: NextStepRequest, db: Session = Depends(ge
                 text=memory_text,
             )
             db.add(memory_entry)
-            db.commit()
-            db.refresh(memory_entry)
 
     # Iterate over all actions
     actions_arr = response_data.get('actions', [])
@@ -364,25 +303,17 @@ def next_step(tid: str, next_step_req: NextStepRequest, db: Session = Depends(ge
         if action_type == 'subtask_completed' and len(actions_arr) == 1:
             current_subtask.status = SubtaskStatus.COMPLETED
             db.add(current_subtask)
-            db.commit()
-            db.refresh(current_subtask)
 
         elif action_type == 'subtask_failed':
             # Mark plan, task, and thread as failed
             current_plan.status = ThreadTaskPlanStatus.FAILED
             db.add(current_plan)
-            db.commit()
-            db.refresh(current_plan)
 
             task.status = ThreadTaskStatus.FAILED
             db.add(task)
-            db.commit()
-            db.refresh(task)
 
             instance.status = ThreadStatus.STANDBY
             db.add(instance)
-            db.commit()
-            db.refresh(instance)
 
             ai_message = ThreadMessage(
                 thread_id=instance.id,
@@ -392,8 +323,6 @@ def next_step(tid: str, next_step_req: NextStepRequest, db: Session = Depends(ge
                 text=json.dumps({'actions': [{'action': 'task_failed'}]}),
             )
             db.add(ai_message)
-            db.commit()
-            db.refresh(ai_message)
 
         elif action_type == 'tool_use':
             tool = act['params'].get('tool')
@@ -405,17 +334,178 @@ def next_step(tid: str, next_step_req: NextStepRequest, db: Session = Depends(ge
                     text=args.get('text', ''),
                 )
                 db.add(memory_entry)
-                db.commit()
-                db.refresh(memory_entry)
 
             elif tool in ['read_pdf', 'fetch_url', 'summarize_youtube_video']:
-                tool_output_text = run_tool_server_side(tool, args)
+                tool_output_text = await arun_tool_server_side(tool, args)
                 memory_entry = ThreadTaskMemoryEntry(
                     thread_task_id=task.id,
                     text=tool_output_text,
                 )
                 db.add(memory_entry)
-                db.commit()
-                db.refresh(memory_entry)
+
+    await db.commit()
+
+
+async def prepare_next_step(db: AsyncSession, tid: str, user: User, next_step_req: NextStepRequest):
+    step_context = await _load_desktop_step_context(db, tid, user)
+    resolve_elements(tid, next_step_req)
+    await resolve_screenshot(tid, next_step_req)
+    return step_context, _build_next_step_chain(step_context, next_step_req)
+
+
+async def stream_next_step(db: AsyncSession, step_context: StepContext, chain):
+    """
+    Run a prepared step with a streaming model call. Yields {"type": "action"} events as soon as each
+    action has been fully generated, then a single {"type": "done"} event once the step is persisted.
+    """
+    action_parser = JSONActionStreamParser()
+    text_parts = []
+    reasoning_parts = []
+    response = None
+    action_index = 0
+
+    async for chunk in chain.astream({}):
+        response = chunk if response is None else response + chunk
+        chunk_text, chunk_reasoning = _split_response_content(chunk.content)
+        reasoning_parts.extend(chunk_reasoning)
+        if chunk_text:
+            text_parts.append(chunk_text)
+            for action in action_parser.feed(chunk_text):
+                yield {'type': 'action', 'index': action_index, 'action': action}
+                action_index += 1
+
+    usage_metadata = response.usage_metadata if response is not None else None
+    print('Token Usage: ', usage_metadata)
+    llm_provider.record_usage('computer_use', usage_metadata)
+
+    response_data = extract_json(''.join(text_parts))
+    # Whatever the incremental parser missed still reaches the client before it is persisted
+    actions = response_data.get('actions') if isinstance(response_data, dict) else None
+    if isinstance(actions, list):
+        for action in actions[action_index:]:
+            yield {'type': 'action', 'index': action_index, 'action': action}
+            action_index += 1
+
+    reasoning_text = ''.join(reasoning_parts)
+    await _persist_next_step(db, step_context, response_data, [reasoning_text] if reasoning_text else [])
+
+    yield {'type': 'done', 'response': response_data}
+
+
+async def stream_step(db: AsyncSession, tid: str, user: User, step_req: NextStepRequest):
+    """
+    One round-trip per agent step: advance the plan if needed (planning on the first call), then
+    run the next step against the same observation. Yields a {"type": "subtask"} event, the streamed
+    actions and a final {"type": "done"} event. When the task is finished the only action is task_completed.
+    """
+    step_context = await load_step_context(
+        db, tid, user.id,
+        action_chat_type=ThreadChatType.DESKTOP_USE,
+        include_previous_subtasks=True,
+        include_memory=True,
+    )
+    resolve_elements(tid, step_req)
+    await resolve_screenshot(tid, step_req)
+
+    if step_context.plan is None or step_context.subtask is None:
+        subtask_response = await _advance_plan(db, step_context, user, step_req)
+        if subtask_response.get('action') == 'task_completed':
+            yield {'type': 'subtask', 'subtask': subtask_response}
+            yield {'type': 'action', 'index': 0, 'action': subtask_response}
+            yield {'type': 'done', 'response': {'actions': [subtask_response]}}
+            return
+        # The plan was just created, reload so the new subtask is part of the context
+        step_context = await _load_desktop_step_context(db, tid, user)
+    elif step_context.subtask.subtask_type != SubtaskType.DESKTOP:
+        raise CustomError(status.HTTP_404_NOT_FOUND, 'No Current Desktop Task!')
+
+    yield {'type': 'subtask', 'subtask': _subtask_summary(step_context.subtask)}
+    async for step_event in stream_next_step(db, step_context, _build_next_step_chain(step_context, step_req)):
+        yield step_event
+
+
+@router.post('/{tid}/step')
+async def step(tid: str, step_req: NextStepRequest = Depends(observation_body(NextStepRequest)),
+               db: AsyncSession = Depends(get_async_session),
+               user: User = Depends(get_current_user_dependency)):
+    subtask_response = None
+    response_data = None
+    async for step_event in stream_step(db, tid, user, step_req):
+        if step_event['type'] == 'subtask':
+            subtask_response = step_event['subtask']
+        elif step_event['type'] == 'done':
+            response_data = step_event['response']
+
+    return {**response_data, 'subtask': subtask_response}
+
+
+@router.post('/{tid}/step/stream')
+async def step_stream(tid: str, step_req: NextStepRequest = Depends(observation_body(NextStepRequest)),
+                      user: User = Depends(get_current_user_dependency)):
+    """Streaming variant of step, with the same NDJSON framing as next_step/stream."""
+    db = AsyncSessionLocal()
+    step_events = stream_step(db, tid, user, step_req)
+    try:
+        # Resolve the first event up front so a missing thread or task is still an HTTP error
+        first_event = await step_events.__anext__()
+    except Exception:
+        await db.close()
+        raise
+
+    async def event_stream():
+        try:
+            yield json.dumps(first_event) + '\n'
+            async for step_event in step_events:
+                yield json.dumps(step_event) + '\n'
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'message': str(e)}) + '\n'
+        finally:
+            await db.close()
+
+    return StreamingResponse(event_stream(), media_type='application/x-ndjson')
+
+
+@router.post('/{tid}/next_step')
+async def next_step(tid: str, next_step_req: NextStepRequest = Depends(observation_body(NextStepRequest)),
+                    db: AsyncSession = Depends(get_async_session),
+                    user: User = Depends(get_current_user_dependency)):
+    step_context, chain = await prepare_next_step(db, tid, user, next_step_req)
+    response = await chain.ainvoke({})
+
+    print('Token Usage: ', response.usage_metadata)
+    llm_provider.record_usage('computer_use', response.usage_metadata)
+
+    response_text, reasoning_texts = _split_response_content(response.content)
+    response_data = extract_json(response_text)
+
+    await _persist_next_step(db, step_context, response_data, reasoning_texts)
 
     return response_data
+
+
+@router.post('/{tid}/next_step/stream')
+async def next_step_stream(tid: str, next_step_req: NextStepRequest = Depends(observation_body(NextStepRequest)),
+                           user: User = Depends(get_current_user_dependency)):
+    """
+    Streaming variant of next_step. Emits NDJSON lines: one {"type": "action"} line per action as soon as
+    the model has finished writing it, then a final {"type": "done"} line with the full response once it
+    has been persisted (or {"type": "error"}).
+    """
+    # The session outlives the request handler, so it is owned by the stream instead of a dependency
+    db = AsyncSessionLocal()
+    try:
+        step_context, chain = await prepare_next_step(db, tid, user, next_step_req)
+    except Exception:
+        await db.close()
+        raise
+
+    async def event_stream():
+        try:
+            async for step_event in stream_next_step(db, step_context, chain):
+                yield json.dumps(step_event) + '\n'
+        except Exception as e:
+            yield json.dumps({'type': 'error', 'message': str(e)}) + '\n'
+        finally:
+            await db.close()
+
+    return StreamingResponse(event_stream(), media_type='application/x-ndjson')
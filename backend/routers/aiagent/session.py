@@ -0,0 +1,173 @@
+import asyncio
+import os
+import secrets
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlmodel import select, and_
+from db.database import AsyncSessionLocal
+from db.models import User, Thread, ThreadStatus
+from dependencies.auth_dependencies import get_websocket_user
+from routers.aiagent.generic import run_current_subtask, prepare_next_step, stream_next_step, stream_step
+from routers.apps.thread_events import reject_websocket
+from schemas.aiagent import NextStepRequest, CurrentSubtaskRequestObj
+from utils.procedures import CustomError
+
+# How long a disconnected session can still be resumed
+AGENT_SESSION_TTL_SECONDS = int(os.getenv('AGENT_SESSION_TTL_SECONDS', '900'))
+
+WS_CLOSE_UNAUTHORIZED = 4401
+WS_CLOSE_NOT_FOUND = 4404
+
+# Authentication happens once per connection at handshake time, so there is no HTTP auth dependency
+router = APIRouter(
+    prefix='/aiagent',
+    tags=['aiagent'],
+)
+
+
+@dataclass
+class AgentSession:
+    """
+    Server-side state of one desktop agent run. The user and thread are resolved once; the replies to
+    the last request are kept so a client that reconnects can collect the result of a step that was
+    still running when the connection dropped, instead of running it twice.
+    """
+    session_id: str
+    user: User
+    thread_id: str
+    last_seq: int = 0
+    last_replies: list = field(default_factory=list)
+    last_step_done: asyncio.Event = field(default_factory=asyncio.Event)
+    connections: int = 0
+    expires_at: Optional[float] = None
+
+
+_sessions = {}
+
+
+def _purge_expired_sessions() -> None:
+    now = time.monotonic()
+    for session_id in [sid for sid, s in _sessions.items() if s.expires_at is not None and s.expires_at < now]:
+        del _sessions[session_id]
+
+
+async def _thread_exists(tid: str, user_id: str) -> bool:
+    async with AsyncSessionLocal() as db:
+        return (await db.exec(select(Thread.id).where(and_(
+            Thread.id == tid,
+            Thread.user_id == user_id,
+            Thread.status != ThreadStatus.DELETED,
+        )))).first() is not None
+
+
+async def _run_request(session: AgentSession, request: dict, send) -> None:
+    request_type = request.get('type')
+    observation = request.get('observation') or {}
+    try:
+        async with AsyncSessionLocal() as db:
+            if request_type == 'current_subtask':
+                response = await run_current_subtask(
+                    db, session.thread_id, session.user, CurrentSubtaskRequestObj(**observation),
+                )
+                await send({'type': 'done', 'response': response})
+            elif request_type == 'step':
+                step_events = stream_step(db, session.thread_id, session.user, NextStepRequest(**observation))
+                async for step_event in step_events:
+                    await send(step_event)
+            elif request_type == 'next_step':
+                step_context, chain = await prepare_next_step(
+                    db, session.thread_id, session.user, NextStepRequest(**observation),
+                )
+                async for step_event in stream_next_step(db, step_context, chain):
+                    await send(step_event)
+            else:
+                await send({'type': 'error', 'status': status.HTTP_400_BAD_REQUEST,
+                            'message': f'Unknown request type: {request_type}'})
+    except CustomError as e:
+        await send({'type': 'error', 'status': e.status_code, 'message': e.message})
+    except ValidationError as e:
+        await send({'type': 'error', 'status': status.HTTP_422_UNPROCESSABLE_ENTITY, 'message': str(e)})
+    except Exception as e:
+        await send({'type': 'error', 'status': status.HTTP_500_INTERNAL_SERVER_ERROR, 'message': str(e)})
+
+
+@router.websocket('/{tid}/session')
+async def agent_session(websocket: WebSocket, tid: str, token: Optional[str] = None,
+                        session_id: Optional[str] = None):
+    """
+    Long-lived agent session. After the {"type": "session"} greeting the client sends
+    {"type": "step" | "current_subtask" | "next_step", "seq": n, "observation": {...}} with increasing
+    seq; every reply carries the same seq and a request ends with a "done" or "error" reply. step and
+    next_step additionally stream {"type": "action", "index": i} replies as actions are generated.
+
+    To resume, reconnect with session_id and resend the unanswered request with its original seq:
+    the step is not run again, its replies are sent once it has finished.
+    """
+    user = await run_in_threadpool(get_websocket_user, token)
+    if not user:
+        await reject_websocket(websocket, WS_CLOSE_UNAUTHORIZED)
+        return
+
+    _purge_expired_sessions()
+    session = _sessions.get(session_id) if session_id else None
+    if session is None or session.user.id != user.id or session.thread_id != tid:
+        if not await _thread_exists(tid, user.id):
+            await reject_websocket(websocket, WS_CLOSE_NOT_FOUND)
+            return
+        session = AgentSession(session_id=secrets.token_urlsafe(24), user=user, thread_id=tid)
+        session.last_step_done.set()
+        _sessions[session.session_id] = session
+    session.connections += 1
+    session.expires_at = None
+
+    connected = True
+
+    async def send(reply: dict, record: bool = True) -> None:
+        nonlocal connected
+        if record:
+            session.last_replies.append(reply)
+        if not connected:
+            return
+        try:
+            await websocket.send_json(reply)
+        except Exception:
+            # Keep running the step so its result can be collected after a reconnect
+            connected = False
+
+    try:
+        await websocket.accept()
+        await websocket.send_json({'type': 'session', 'session_id': session.session_id, 'last_seq': session.last_seq})
+
+        while connected:
+            request = await websocket.receive_json()
+            if request.get('type') == 'ping':
+                await send({'type': 'pong'}, record=False)
+                continue
+
+            seq = request.get('seq') or 0
+            if seq < session.last_seq:
+                continue
+            if seq == session.last_seq:
+                # A resent request: wait for the original run and replay its replies
+                await session.last_step_done.wait()
+                for reply in list(session.last_replies):
+                    await send(reply, record=False)
+                continue
+
+            session.last_seq = seq
+            session.last_replies = []
+            session.last_step_done = asyncio.Event()
+            try:
+                await _run_request(session, request, lambda reply: send({**reply, 'seq': seq}))
+            finally:
+                session.last_step_done.set()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        session.connections -= 1
+        if session.connections == 0:
+            session.expires_at = time.monotonic() + AGENT_SESSION_TTL_SECONDS
@@ -9,9 +9,12 @@ import json
 from utils import ai_prompts
 from utils.procedures import CustomError, extract_json, extract_json_array
 from dependencies.auth_dependencies import get_current_user_dependency
+from dependencies.observation_dependencies import observation_body
 from db.models import (User, Thread, ThreadStatus, ThreadTask)
 from schemas.aiagent import SuggestorRequest
 from utils import llm_provider
+from utils.screenshots import screenshot_block
+from utils.element_codec import resolve_elements, format_elements_for_prompt
 
 
 router = APIRouter(
@@ -22,11 +25,14 @@ router = APIRouter(
 
 
 @router.post('')
-def get_suggestions(request: SuggestorRequest, db: Session = Depends(get_session),
+def get_suggestions(request: SuggestorRequest = Depends(observation_body(SuggestorRequest)),
+                    db: Session = Depends(get_session),
                     user: User = Depends(get_current_user_dependency)):
+    # No thread here, so only full (non-delta) compact payloads are accepted
+    resolve_elements(None, request)
     prompt_blocks = [
         {"type": "text", "text": f"Current OS: {request.current_os}"},
-        {"type": "text", "text": f"Current Visible UI Elements: {json.dumps(request.current_interactive_elements)}"},
+        {"type": "text", "text": f"Current Visible UI Elements: \n{format_elements_for_prompt(request.current_interactive_elements)}"},
         {"type": "text", "text": f"Current Running Apps: {json.dumps(request.current_running_apps)}"},
     ]
 
@@ -48,14 +54,7 @@ def get_suggestions(request: SuggestorRequest, db: Session = Depends(get_session
         })
 
     if request.screenshot_b64:
-        prompt_blocks.append({
-            "type": "image",
-            "source": {
-                "type": "base64",
-                "media_type": "image/png",
-                "data": request.screenshot_b64
-            }
-        })
+        prompt_blocks.append(screenshot_block(request.screenshot_b64, request.screenshot_media_type))
 
     llm = llm_provider.get_llm(agent='suggestor', temperature=0.6)
 
@@ -0,0 +1,190 @@
+import asyncio
+from collections import deque
+from typing import Optional
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from sqlmodel import select, and_
+from db.database import AsyncSessionLocal
+from db.models import Thread, ThreadStatus, ThreadMessage
+from dependencies.auth_dependencies import get_websocket_user
+from utils.pagination import decode_cursor, keyset_after, row_cursor
+from utils.procedures import CustomError
+from utils.realtime import thread_event_broker, serialize_message, thread_status_event
+
+REPLAY_PAGE_SIZE = 200
+# Ids of the most recent messages sent on a connection, remembered to skip duplicates
+DELIVERED_IDS_SIZE = 1024
+
+# Application-defined close codes (4000-4999), mirroring the HTTP status of the failure
+WS_CLOSE_UNAUTHORIZED = 4401
+WS_CLOSE_NOT_FOUND = 4404
+WS_CLOSE_BAD_REQUEST = 4400
+
+# Authentication happens at handshake time, so this router has no HTTP auth dependency
+router = APIRouter(
+    prefix='/apps/threads',
+    tags=['apps', 'threads'],
+)
+
+
+async def _get_owned_thread(tid: str, user_id: str) -> Optional[Thread]:
+    async with AsyncSessionLocal() as db:
+        return (await db.exec(select(Thread).where(and_(
+            Thread.id == tid,
+            Thread.user_id == user_id,
+            Thread.status != ThreadStatus.DELETED,
+        )))).first()
+
+
+async def _latest_cursor(tid: str) -> Optional[str]:
+    async with AsyncSessionLocal() as db:
+        latest = (await db.exec(
+            select(ThreadMessage)
+            .where(ThreadMessage.thread_id == tid)
+            .order_by(ThreadMessage.created_at.desc(), ThreadMessage.id.desc())
+            .limit(1)
+        )).first()
+    return row_cursor(latest) if latest else None
+
+
+class DeliveredMessages:
+    """
+    Ids of the last messages sent on one connection. Live events that a catch-up already replayed
+    are skipped by id: comparing cursors would also drop messages whose transaction committed after
+    one with a later created_at.
+    """
+
+    def __init__(self, size: int = DELIVERED_IDS_SIZE):
+        self._order = deque()
+        self._ids = set()
+        self._size = size
+
+    def __contains__(self, message_id) -> bool:
+        return message_id in self._ids
+
+    def add(self, message_id) -> None:
+        if message_id in self._ids:
+            return
+        self._order.append(message_id)
+        self._ids.add(message_id)
+        if len(self._order) > self._size:
+            self._ids.discard(self._order.popleft())
+
+
+async def reject_websocket(websocket: WebSocket, code: int) -> None:
+    """
+    Accept, then close with an application code. Closing before the handshake is accepted makes
+    Starlette answer with HTTP 403, which clients only see as close code 1006.
+    """
+    await websocket.accept()
+    await websocket.close(code=code)
+
+
+def _later_cursor(cursor: Optional[str], other: str) -> str:
+    return other if not cursor or decode_cursor(other) > decode_cursor(cursor) else cursor
+
+
+async def _catch_up(websocket: WebSocket, tid: str, user_id: str, cursor: Optional[str],
+                    delivered: DeliveredMessages) -> Optional[str]:
+    """
+    Send the current thread status and every message created after `cursor`, page by page.
+    A short-lived session is used so an idle connection never holds a pooled DB connection.
+    Returns the cursor of the last message sent.
+    """
+    thread = await _get_owned_thread(tid, user_id)
+    if not thread:
+        return cursor
+    await websocket.send_json(thread_status_event(thread))
+
+    if not cursor:
+        return cursor
+
+    while True:
+        async with AsyncSessionLocal() as db:
+            messages = (await db.exec(
+                select(ThreadMessage)
+                .where(and_(
+                    ThreadMessage.thread_id == tid,
+                    keyset_after(ThreadMessage.created_at, ThreadMessage.id, cursor),
+                ))
+                .order_by(ThreadMessage.created_at.asc(), ThreadMessage.id.asc())
+                .limit(REPLAY_PAGE_SIZE)
+            )).all()
+        for message in messages:
+            thread_event = serialize_message(message)
+            if message.id not in delivered:
+                delivered.add(message.id)
+                await websocket.send_json(thread_event)
+            cursor = thread_event['cursor']
+        if len(messages) < REPLAY_PAGE_SIZE:
+            return cursor
+
+
+async def _wait_for_disconnect(websocket: WebSocket) -> None:
+    try:
+        while True:
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        return
+
+
+@router.websocket('/{tid}/ws')
+async def thread_events(websocket: WebSocket, tid: str, token: Optional[str] = None, since: Optional[str] = None):
+    """
+    Live thread updates: `thread_message`, `thread_status` and `task_status` events as JSON.
+
+    Reconnect with `since` set to the cursor of the last `thread_message` received (or the `since`
+    of the last thread_messages page) to receive everything that was missed in between.
+    """
+    user = await run_in_threadpool(get_websocket_user, token)
+    if not user:
+        await reject_websocket(websocket, WS_CLOSE_UNAUTHORIZED)
+        return
+
+    if since:
+        try:
+            decode_cursor(since)
+        except CustomError:
+            await reject_websocket(websocket, WS_CLOSE_BAD_REQUEST)
+            return
+
+    if not await _get_owned_thread(tid, user.id):
+        await reject_websocket(websocket, WS_CLOSE_NOT_FOUND)
+        return
+
+    if not since:
+        # Taken before subscribing, so anything committed in between is still replayed
+        since = await _latest_cursor(tid)
+
+    await websocket.accept()
+    disconnected = asyncio.create_task(_wait_for_disconnect(websocket))
+    delivered = DeliveredMessages()
+
+    try:
+        # Subscribe before catching up so nothing committed in between is lost; duplicates are skipped by id
+        async with thread_event_broker.subscribe(tid) as subscription:
+            cursor = await _catch_up(websocket, tid, user.id, since, delivered)
+
+            while True:
+                next_event = asyncio.create_task(subscription.get())
+                done, _ = await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    next_event.cancel()
+                    return
+
+                thread_event = next_event.result()
+                if thread_event is None:
+                    # This connection fell behind and its buffered events were dropped
+                    cursor = await _catch_up(websocket, tid, user.id, cursor, delivered)
+                    continue
+
+                if thread_event['type'] == 'thread_message':
+                    if thread_event['message']['id'] in delivered:
+                        continue
+                    delivered.add(thread_event['message']['id'])
+                    cursor = _later_cursor(cursor, thread_event['cursor'])
+                await websocket.send_json(thread_event)
+    except WebSocketDisconnect:
+        return
+    finally:
+        disconnected.cancel()
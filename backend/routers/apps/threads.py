@@ -1,20 +1,30 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
+from fastapi import APIRouter, Depends, status, UploadFile, File, Response, Query
 from sqlmodel import Session, select, and_, update
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy.orm import selectinload
 from dependencies.auth_dependencies import get_current_user_dependency
-from db.database import get_session
+from db.database import get_session, get_async_session
 from db.models import (User, Thread, ThreadStatus, ThreadTask, ThreadMessage, ThreadChatType, ThreadChatFromChoices,
                        ThreadTaskStatus, ThreadTaskPlan, ThreadTaskPlanStatus, PlanSubtask, SubtaskStatus, ThreadTaskMemoryEntry)
-from schemas.threads import ListThread, CreateThread, UpdateThread, ListThreadMessage, RetrieveThread, SendMessageObj
-from typing import List
+from schemas.threads import (CreateThread, UpdateThread, RetrieveThread, SendMessageObj, ThreadPage,
+                             ThreadMessagePage)
+from typing import Optional
 from utils.procedures import CustomError, extract_json
 from utils import ai_helpers
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage
-from utils import ai_prompts, llm_provider
+from utils import ai_prompts, llm_provider, classifier_cache
+from utils.step_context import load_previous_tasks
+from utils.timing import StageTimer
+from utils.pagination import keyset_after, keyset_before, row_cursor
+import asyncio
 import json
 import os
 
 PRIVATE_MODE = os.getenv('PRIVATE_MODE', 'false').lower() == 'true'
+THREADS_PAGE_SIZE = int(os.getenv('THREADS_PAGE_SIZE', '50'))
+THREAD_MESSAGES_PAGE_SIZE = int(os.getenv('THREAD_MESSAGES_PAGE_SIZE', '100'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '500'))
 
 router = APIRouter(
     prefix='/apps/threads',
@@ -23,63 +33,90 @@ router = APIRouter(
 )
 
 
-@router.get('', response_model=List[ListThread])
-def list_threads(db: Session = Depends(get_session), user: User = Depends(get_current_user_dependency)):
+@router.get('', response_model=ThreadPage)
+async def list_threads(limit: int = Query(THREADS_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                       db: AsyncSession = Depends(get_async_session),
+                       user: User = Depends(get_current_user_dependency)):
     query = select(Thread).where(and_(
         Thread.user_id == user.id,
         Thread.status != ThreadStatus.DELETED
-    )).order_by(Thread.created_at.desc())
-    return db.exec(query)
+    ))
+    if cursor:
+        query = query.where(keyset_before(Thread.created_at, Thread.id, cursor))
+    # One extra row tells whether another page exists without a COUNT query
+    rows = (await db.exec(query.order_by(Thread.created_at.desc(), Thread.id.desc()).limit(limit + 1))).all()
+
+    items = rows[:limit]
+    return ThreadPage(
+        items=items,
+        next_cursor=row_cursor(items[-1]) if len(rows) > limit else None,
+    )
 
 
-@router.post('')
-def create_thread(create_thread_obj: CreateThread, db: Session = Depends(get_session),
-                  user: User = Depends(get_current_user_dependency)):
-
-    working_threads = db.exec(select(Thread).where(and_(
-        Thread.user_id == user.id,
-        Thread.status == ThreadStatus.WORKING
-    )))
-    if len(working_threads.all()) > 0:
-        raise CustomError(status.HTTP_400_BAD_REQUEST, 'Running_Thread')
+async def _classify_task(task_text: str, previous_tasks_arr: list, timer: StageTimer) -> dict:
+    cache_key = classifier_cache.make_key(task_text)
+    with timer.stage('classifier_cache'):
+        cached = await classifier_cache.lookup(cache_key)
+    if cached is not None:
+        return cached
 
     llm = llm_provider.get_llm(agent='classifier', temperature=0.1)
 
-    previous_tasks = db.exec(select(ThreadTask).where(and_(
-        ThreadTask.thread.has(Thread.user_id == user.id),
-        ThreadTask.thread.has(Thread.status != ThreadStatus.DELETED),
-    )).order_by(ThreadTask.created_at.desc()).limit(10)).all()
-    previous_tasks_arr = []
-    for previous_task in previous_tasks:
-        previous_tasks_arr.append({
-            'task': previous_task.task_text,
-            'status': previous_task.status,
-        })
-
     prompt = ChatPromptTemplate.from_messages([
         ('system', ai_prompts.CLASSIFIER_AGENT_PROMPT),
         HumanMessage(f'Previous Tasks (Limited to 10): \n {json.dumps(previous_tasks_arr)}'),
-        ('user', create_thread_obj.task),
+        ('user', task_text),
     ])
 
     chain = prompt | llm
 
-    response = chain.invoke({})
+    response = await timer.run('classifier', chain.ainvoke({}))
     response_data = extract_json(response.content)
 
+    if classifier_cache.is_cacheable(response_data):
+        await classifier_cache.store(cache_key, response_data)
+    return response_data
+
+
+@router.post('')
+async def create_thread(create_thread_obj: CreateThread, response: Response,
+                        db: AsyncSession = Depends(get_async_session),
+                        user: User = Depends(get_current_user_dependency)):
+    timer = StageTimer()
+
+    with timer.stage('db_load'):
+        working_thread = (await db.exec(select(Thread.id).where(and_(
+            Thread.user_id == user.id,
+            Thread.status == ThreadStatus.WORKING
+        )).limit(1))).first()
+        if working_thread:
+            raise CustomError(status.HTTP_400_BAD_REQUEST, 'Running_Thread')
+
+        previous_tasks_arr = list(await load_previous_tasks(db, user.id, limit=10))
+
+    # The title does not depend on the classification, so both run concurrently
+    response_data, title = await asyncio.gather(
+        _classify_task(create_thread_obj.task, previous_tasks_arr, timer),
+        timer.run('title', ai_helpers.agenerate_thread_title(create_thread_obj.task)),
+        return_exceptions=True,
+    )
+    if isinstance(response_data, BaseException):
+        raise response_data
+    if isinstance(title, BaseException):
+        print('Thread title generation failed: ', title)
+        title = ''
+
     if response_data.get('type') == 'desktop_task':
         if create_thread_obj.background_mode is True or response_data.get('is_background_mode_requested', False) is True:
             if response_data.get('is_browser_task') is False:
                 raise CustomError(status.HTTP_400_BAD_REQUEST, 'Not_Browser_Task_BG_Mode')
 
     instance = Thread(
-        title=ai_helpers.generate_thread_title(create_thread_obj.task),
+        title=title,
         user_id=user.id,
         current_task=create_thread_obj.task,
     )
     db.add(instance)
-    db.commit()
-    db.refresh(instance)
 
     user_message = ThreadMessage(
         thread_id=instance.id,
@@ -88,8 +125,6 @@ def create_thread(create_thread_obj: CreateThread, db: Session = Depends(get_ses
         text=create_thread_obj.task,
     )
     db.add(user_message)
-    db.commit()
-    db.refresh(user_message)
 
     response_data['thread_id'] = instance.id
 
@@ -102,37 +137,25 @@ def create_thread(create_thread_obj: CreateThread, db: Session = Depends(get_ses
             extended_thinking_mode=create_thread_obj.extended_thinking_mode or response_data.get('is_extended_thinking_mode_requested', False),
         )
         db.add(thread_task)
-        db.commit()
-        db.refresh(thread_task)
-
-        ai_message = ThreadMessage(
-            thread_id=instance.id,
-            thread_chat_type=ThreadChatType.CLASSIFICATION,
-            thread_chat_from=ThreadChatFromChoices.FROM_AI,
-            text=json.dumps(response_data),
-        )
-        db.add(ai_message)
-        db.commit()
-        db.refresh(ai_message)
 
         instance.status = ThreadStatus.WORKING
         db.add(instance)
-        db.commit()
-        db.refresh(instance)
 
-        return response_data
-    else:
-        ai_message = ThreadMessage(
-            thread_id=instance.id,
-            thread_chat_type=ThreadChatType.CLASSIFICATION,
-            thread_chat_from=ThreadChatFromChoices.FROM_AI,
-            text=json.dumps(response_data),
-        )
-        db.add(ai_message)
-        db.commit()
-        db.refresh(ai_message)
+    ai_message = ThreadMessage(
+        thread_id=instance.id,
+        thread_chat_type=ThreadChatType.CLASSIFICATION,
+        thread_chat_from=ThreadChatFromChoices.FROM_AI,
+        text=json.dumps(response_data),
+    )
+    db.add(ai_message)
 
-        return response_data
+    with timer.stage('db_commit'):
+        await db.commit()
+
+    response.headers['Server-Timing'] = timer.server_timing()
+    print('create_thread timings (ms): ', timer.as_dict())
+
+    return response_data
 
 
 @router.put('/{tid}')
@@ -190,24 +213,58 @@ def retrieve_thread(tid: str, db: Session = Depends(get_session), user: User = D
     return instance
 
 
-@router.get('/{tid}/thread_messages', response_model=List[ListThreadMessage])
-def thread_messages(tid: str, db: Session = Depends(get_session), user: User = Depends(get_current_user_dependency)):
-    query = select(ThreadMessage).where(and_(
+@router.get('/{tid}/thread_messages', response_model=ThreadMessagePage)
+async def thread_messages(tid: str, limit: int = Query(THREAD_MESSAGES_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                          before: Optional[str] = None, since: Optional[str] = None,
+                          db: AsyncSession = Depends(get_async_session),
+                          user: User = Depends(get_current_user_dependency)):
+    """
+    Messages in chronological order. Without cursors this is the latest page; `before` walks back
+    through older pages and `since` returns only what was created after a previous response.
+    """
+    query = select(ThreadMessage).join(Thread, Thread.id == ThreadMessage.thread_id).where(and_(
         ThreadMessage.thread_id == tid,
-        ThreadMessage.thread.has(Thread.user_id == user.id),
-    )).order_by(ThreadMessage.created_at.asc())
-    return db.exec(query)
+        Thread.user_id == user.id,
+    )).options(selectinload(ThreadMessage.thread_task))
+
+    if since:
+        query = query.where(keyset_after(ThreadMessage.created_at, ThreadMessage.id, since))
+        query = query.order_by(ThreadMessage.created_at.asc(), ThreadMessage.id.asc())
+    else:
+        if before:
+            query = query.where(keyset_before(ThreadMessage.created_at, ThreadMessage.id, before))
+        query = query.order_by(ThreadMessage.created_at.desc(), ThreadMessage.id.desc())
+
+    rows = (await db.exec(query.limit(limit + 1))).all()
+    has_more = len(rows) > limit
+    items = rows[:limit]
+
+    if since:
+        return ThreadMessagePage(
+            items=items,
+            # More new messages than fit in one page: keep polling from the last one returned
+            since=row_cursor(items[-1]) if items else since,
+            next_cursor=None,
+        )
+
+    items.reverse()
+    return ThreadMessagePage(
+        items=items,
+        next_cursor=row_cursor(items[0]) if has_more else None,
+        since=row_cursor(items[-1]) if items else None,
+    )
 
 
 @router.post('/cancel_all_running_tasks')
 def cancel_all_running_tasks(db: Session = Depends(get_session), user: User = Depends(get_current_user_dependency)):
-    db.exec(update(Thread).where(Thread.status == ThreadStatus.WORKING).values(
-        status=ThreadStatus.STANDBY,
-    ))
+    # Threads and tasks go through the ORM so their status changes are published to live clients
+    for instance in db.exec(select(Thread).where(Thread.status == ThreadStatus.WORKING)).all():
+        instance.status = ThreadStatus.STANDBY
+        db.add(instance)
 
-    db.exec(update(ThreadTask).where(ThreadTask.status == ThreadTaskStatus.WORKING).values(
-        status=ThreadTaskStatus.CANCELED,
-    ))
+    for running_task in db.exec(select(ThreadTask).where(ThreadTask.status == ThreadTaskStatus.WORKING)).all():
+        running_task.status = ThreadTaskStatus.CANCELED
+        db.add(running_task)
 
     db.exec(update(ThreadTaskPlan).where(ThreadTaskPlan.status == ThreadTaskPlanStatus.ACTIVE).values(
         status=ThreadTaskPlanStatus.CANCELED,
@@ -275,47 +332,31 @@ def cancel_running_task(tid: str, db: Session = Depends(get_session), user: User
 
 
 @router.post('/{tid}/send_message')
-def send_message(tid: str, obj: SendMessageObj, db: Session = Depends(get_session),
-                 user: User = Depends(get_current_user_dependency)):
-    instance = db.exec(select(Thread).where(and_(
-        Thread.id == tid,
-        Thread.user_id == user.id,
-        Thread.status != ThreadStatus.DELETED
-    ))).first()
-
-    if not instance:
-        raise CustomError(status.HTTP_404_NOT_FOUND, 'Thread not found')
+async def send_message(tid: str, obj: SendMessageObj, response: Response,
+                       db: AsyncSession = Depends(get_async_session),
+                       user: User = Depends(get_current_user_dependency)):
+    timer = StageTimer()
 
-    working_threads = db.exec(select(Thread).where(and_(
-        Thread.user_id == user.id,
-        Thread.status == ThreadStatus.WORKING
-    )))
-    if len(working_threads.all()) > 0:
-        raise CustomError(status.HTTP_400_BAD_REQUEST, 'Running_Thread')
+    with timer.stage('db_load'):
+        instance = (await db.exec(select(Thread).where(and_(
+            Thread.id == tid,
+            Thread.user_id == user.id,
+            Thread.status != ThreadStatus.DELETED
+        )))).first()
 
-    llm = llm_provider.get_llm(agent='classifier', temperature=0.1)
+        if not instance:
+            raise CustomError(status.HTTP_404_NOT_FOUND, 'Thread not found')
 
-    previous_tasks = db.exec(select(ThreadTask).where(and_(
-        ThreadTask.thread.has(Thread.user_id == user.id),
-        ThreadTask.thread.has(Thread.status != ThreadStatus.DELETED),
-    )).order_by(ThreadTask.created_at.desc()).limit(10)).all()
-    previous_tasks_arr = []
-    for previous_task in previous_tasks:
-        previous_tasks_arr.append({
-            'task': previous_task.task_text,
-            'status': previous_task.status,
-        })
-
-    prompt = ChatPromptTemplate.from_messages([
-        ('system', ai_prompts.CLASSIFIER_AGENT_PROMPT),
-        HumanMessage(f'Previous Tasks (Limited to 10): \n {json.dumps(previous_tasks_arr)}'),
-        ('user', obj.text),
-    ])
+        working_thread = (await db.exec(select(Thread.id).where(and_(
+            Thread.user_id == user.id,
+            Thread.status == ThreadStatus.WORKING
+        )).limit(1))).first()
+        if working_thread:
+            raise CustomError(status.HTTP_400_BAD_REQUEST, 'Running_Thread')
 
-    chain = prompt | llm
+        previous_tasks_arr = list(await load_previous_tasks(db, user.id, limit=10))
 
-    response = chain.invoke({})
-    response_data = extract_json(response.content)
+    response_data = await _classify_task(obj.text, previous_tasks_arr, timer)
 
     if response_data.get('type') == 'desktop_task':
         if obj.background_mode is True or response_data.get('is_background_mode_requested', False) is True:
@@ -329,8 +370,6 @@ def send_message(tid: str, obj: SendMessageObj, db: Session = Depends(get_sessio
         text=obj.text,
     )
     db.add(user_message)
-    db.commit()
-    db.refresh(user_message)
 
     if response_data.get('type') == 'desktop_task':
         thread_task = ThreadTask(
@@ -341,37 +380,25 @@ def send_message(tid: str, obj: SendMessageObj, db: Session = Depends(get_sessio
             extended_thinking_mode=obj.extended_thinking_mode or response_data.get('is_extended_thinking_mode_requested', False),
         )
         db.add(thread_task)
-        db.commit()
-        db.refresh(thread_task)
-
-        ai_message = ThreadMessage(
-            thread_id=instance.id,
-            thread_chat_type=ThreadChatType.CLASSIFICATION,
-            thread_chat_from=ThreadChatFromChoices.FROM_AI,
-            text=json.dumps(response_data),
-        )
-        db.add(ai_message)
-        db.commit()
-        db.refresh(ai_message)
 
         instance.status = ThreadStatus.WORKING
         db.add(instance)
-        db.commit()
-        db.refresh(instance)
 
-        return response_data
-    else:
-        ai_message = ThreadMessage(
-            thread_id=instance.id,
-            thread_chat_type=ThreadChatType.CLASSIFICATION,
-            thread_chat_from=ThreadChatFromChoices.FROM_AI,
-            text=json.dumps(response_data),
-        )
-        db.add(ai_message)
-        db.commit()
-        db.refresh(ai_message)
+    ai_message = ThreadMessage(
+        thread_id=instance.id,
+        thread_chat_type=ThreadChatType.CLASSIFICATION,
+        thread_chat_from=ThreadChatFromChoices.FROM_AI,
+        text=json.dumps(response_data),
+    )
+    db.add(ai_message)
+
+    with timer.stage('db_commit'):
+        await db.commit()
+
+    response.headers['Server-Timing'] = timer.server_timing()
+    print('send_message timings (ms): ', timer.as_dict())
 
-        return response_data
+    return response_data
 
 
 @router.post('/{tid}/upload_file')
@@ -1,28 +1,69 @@
 from pydantic import BaseModel, ConfigDict, Field
-from typing import Optional, List
+from typing import Optional, List, Union
+
+
+class CompactElements(BaseModel):
+    """
+    Columnar form of current_interactive_elements, see utils.element_codec. Either the full `rows`,
+    or `ops` applied to the observation identified by `base` (the previous one sent for the thread).
+    """
+    observation_id: str
+    types: list[str] = []
+    rows: list[list] = []
+    ids: dict[int, int] = {}
+    base: Optional[str] = None
+    ops: list[Union[int, list[list]]] = []
+
+
+class ScreenshotTiles(BaseModel):
+    """Changed tiles of a frame, to be pasted onto the frame identified by `base`; see utils.screenshots."""
+    base: Optional[str] = None
+    width: int = Field(gt=0, le=4096)
+    height: int = Field(gt=0, le=4096)
+    tile_width: int = Field(gt=0, le=4096)
+    tile_height: int = Field(gt=0, le=4096)
+    # [column, row, base64 image]
+    tiles: list[list] = []
+    media_type: Optional[str] = None
+    thumbnail_b64: str
+    thumbnail_media_type: Optional[str] = None
 
 
 class NextStepRequest(BaseModel):
     screenshot_b64: Optional[str] = None
+    screenshot_media_type: Optional[str] = None
+    # screenshot_id names an uploaded frame; screenshot_ref reuses the thread's last frame instead of uploading it
+    screenshot_id: Optional[str] = None
+    screenshot_ref: Optional[str] = None
+    screenshot_tiles: Optional[ScreenshotTiles] = None
     current_interactive_elements: list[dict] = []
+    interactive_elements: Optional[CompactElements] = None
     current_os: str
     current_running_apps: list[dict] = []
 
 
 class BackgroundNextStepRequest(BaseModel):
     screenshot_b64: Optional[str] = None
+    screenshot_media_type: Optional[str] = None
+    # screenshot_id names an uploaded frame; screenshot_ref reuses the thread's last frame instead of uploading it
+    screenshot_id: Optional[str] = None
+    screenshot_ref: Optional[str] = None
+    screenshot_tiles: Optional[ScreenshotTiles] = None
     current_open_tabs: list[dict] = []
     current_url: str
 
 
 class CurrentSubtaskRequestObj(BaseModel):
     current_interactive_elements: list[dict] = []
+    interactive_elements: Optional[CompactElements] = None
     current_os: str
     current_running_apps: list[dict] = []
 
 
 class SuggestorRequest(BaseModel):
     current_interactive_elements: list[dict] = []
+    interactive_elements: Optional[CompactElements] = None
     current_os: str
     current_running_apps: list[dict] = []
     screenshot_b64: Optional[str] = None
+    screenshot_media_type: Optional[str] = None
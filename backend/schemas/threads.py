@@ -65,3 +65,16 @@ class SendMessageObj(BaseModel):
     text: str
     background_mode: Optional[bool] = False
     extended_thinking_mode: Optional[bool] = False
+
+
+class ThreadPage(BaseModel):
+    items: List[ListThread]
+    next_cursor: Optional[str] = None
+
+
+class ThreadMessagePage(BaseModel):
+    items: List[ListThreadMessage]
+    # Pass as `before` to load the previous (older) page; None once the first message is reached
+    next_cursor: Optional[str] = None
+    # Pass as `since` to fetch only messages created after this page
+    since: Optional[str] = None
@@ -0,0 +1,36 @@
+import asyncio
+from utils import classifier_cache
+
+
+def test_key_normalizes_task_text():
+    assert classifier_cache.make_key('Open  Zoom.') == classifier_cache.make_key('open zoom')
+    assert classifier_cache.make_key('Open Zoom') != classifier_cache.make_key('Open Slack')
+
+
+def test_key_changes_with_model(monkeypatch):
+    key = classifier_cache.make_key('Open Zoom')
+    monkeypatch.setenv('CLASSIFIER_AGENT_MODEL_ID', 'another-model')
+    assert classifier_cache.make_key('Open Zoom') != key
+
+
+def test_only_standalone_desktop_tasks_are_cacheable():
+    assert classifier_cache.is_cacheable({'type': 'desktop_task', 'needs_memory_from_previous_tasks': False})
+    assert not classifier_cache.is_cacheable({'type': 'desktop_task', 'needs_memory_from_previous_tasks': True})
+    assert not classifier_cache.is_cacheable({'type': 'inquiry', 'needs_memory_from_previous_tasks': False})
+
+
+def test_repeated_tasks_hit_the_cache():
+    cache = classifier_cache.InMemoryClassifierCache(max_size=8, ttl_seconds=60)
+    classification = {'type': 'desktop_task', 'response': 'Got it.', 'needs_memory_from_previous_tasks': False}
+
+    async def classify_all(tasks):
+        hits = 0
+        for task_text in tasks:
+            key = classifier_cache.make_key(task_text)
+            if await cache.get(key) is not None:
+                hits += 1
+            else:
+                await cache.set(key, classification)
+        return hits
+
+    assert asyncio.run(classify_all(['Open Zoom', 'open zoom.', 'Open Slack', 'OPEN ZOOM'])) == 2
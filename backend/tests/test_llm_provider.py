@@ -0,0 +1,48 @@
+import asyncio
+import pytest
+
+pytest.importorskip('langchain_openai')
+
+from utils import llm_provider
+
+
+@pytest.fixture
+def openai_env(monkeypatch):
+    monkeypatch.setenv('PLANNER_AGENT_MODEL_TYPE', 'openai')
+    monkeypatch.setenv('PLANNER_AGENT_MODEL_ID', 'gpt-test')
+    monkeypatch.setenv('OPENAI_API_KEY', 'sk-first')
+    yield monkeypatch
+    asyncio.run(llm_provider.close_llm_clients())
+
+
+def test_replaced_pools_stay_open_for_in_flight_requests(openai_env):
+    async def scenario():
+        llm_provider.get_llm('planner')
+        http_client = llm_provider._shared_clients['http_client']
+        http_async_client = llm_provider._shared_clients['http_async_client']
+
+        # A provider change replaces the pools while a request may still be using the old ones
+        openai_env.setenv('OPENAI_API_KEY', 'sk-second')
+        llm_provider.get_llm('planner')
+        assert llm_provider._shared_clients['http_async_client'] is not http_async_client
+        assert not http_client.is_closed and not http_async_client.is_closed
+
+        openai_env.setattr(llm_provider, 'LLM_RETIRED_CLIENT_GRACE_SECONDS', 0)
+        llm_provider.get_llm('planner')
+        await asyncio.gather(*llm_provider._closing_tasks)
+        assert http_client.is_closed and http_async_client.is_closed
+        assert not llm_provider._shared_clients['http_async_client'].is_closed
+
+    asyncio.run(scenario())
+
+
+def test_close_llm_clients_closes_everything(openai_env):
+    llm_provider.get_llm('planner')
+    openai_env.setenv('OPENAI_API_KEY', 'sk-second')
+    llm_provider.get_llm('planner')
+    clients = [client for _, client in llm_provider._retired_clients]
+    clients.append(llm_provider._shared_clients['http_async_client'])
+
+    asyncio.run(llm_provider.close_llm_clients())
+    assert all(client.is_closed for client in clients)
+    assert llm_provider._retired_clients == []
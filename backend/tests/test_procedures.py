@@ -0,0 +1,91 @@
+import pytest
+from utils.procedures import (JSONActionStreamParser, IncrementalJSONExtractor, JSONExtractionError, extract_json,
+                              extract_json_array)
+
+
+def stream(text: str, chunk_size: int) -> list:
+    parser = JSONActionStreamParser()
+    actions = []
+    for i in range(0, len(text), chunk_size):
+        actions.extend(parser.feed(text[i:i + chunk_size]))
+    return actions
+
+
+ACTIONS = '{"actions":[{"action":"left_click","params":{"x":1,"y":2}},{"action":"type","params":{"text":"a}{"}}]}'
+
+
+@pytest.mark.parametrize('text', [
+    ACTIONS,
+    'Plan: use {x} then\n' + ACTIONS,
+    'Sure {thinking} here:\n```json\n' + ACTIONS + '\n```',
+    'I will {click} the {"Save"} button.\n' + ACTIONS,
+])
+@pytest.mark.parametrize('chunk_size', [1, 7, 4096])
+def test_stream_parser_matches_extract_json(text, chunk_size):
+    assert stream(text, chunk_size) == extract_json(text)['actions']
+
+
+def test_stream_parser_stops_after_actions_object():
+    text = '{"actions":[]} trailing {"actions":[{"action":"z"}]}'
+    assert stream(text, 3) == []
+    assert extract_json(text)['actions'] == []
+
+
+def test_stream_parser_ignores_nested_actions_key():
+    text = '{"thought":{"actions":[{"action":"nested"}]},"actions":[{"action":"top"}]}'
+    assert stream(text, 5) == [{'action': 'top'}]
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ('{"a": 1}', {'a': 1}),
+    ('Here you go:\n```json\n{"a": {"b": [1, 2]}}\n```', {'a': {'b': [1, 2]}}),
+    ('{"text": "braces } and \\" quotes {"}', {'text': 'braces } and " quotes {'}),
+    ('First {not json} then {"a": 1} and {"b": 2}', {'a': 1}),
+])
+def test_extract_json(raw, expected):
+    assert extract_json(raw) == expected
+
+
+def test_extract_json_array():
+    assert extract_json_array('Subtasks:\n[{"subtask": "Open [mail]"}, {"subtask": "Send"}] done') == [
+        {'subtask': 'Open [mail]'}, {'subtask': 'Send'},
+    ]
+
+
+@pytest.mark.parametrize('raw, message, position', [
+    ('no json here', 'No valid JSON found', None),
+    ('Result: {"a": 1', 'Unterminated JSON object', 8),
+    ('Result: {"a": 1,}', 'Invalid JSON object', 16),
+])
+def test_extract_json_errors(raw, message, position):
+    with pytest.raises(JSONExtractionError) as exc_info:
+        extract_json(raw)
+    assert exc_info.value.message.startswith(message)
+    assert exc_info.value.position == position
+
+
+def test_extract_json_array_error():
+    with pytest.raises(JSONExtractionError) as exc_info:
+        extract_json_array('{"a": 1}')
+    assert exc_info.value.message == 'No valid JSON array found in model response.'
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 4096])
+def test_incremental_extractor_feed_and_finish(chunk_size):
+    text = 'Thinking {out loud}... {"escaped": "a\\\\b\\"", "list": [1, {"x": "}"}]} trailing {"b": 2}'
+    extractor = IncrementalJSONExtractor()
+    results = [extractor.feed(text[i:i + chunk_size]) for i in range(0, len(text), chunk_size)]
+    value = {'escaped': 'a\\b"', 'list': [1, {'x': '}'}]}
+    # feed() returns the value from the chunk that completes it onwards
+    assert results[-1] == value
+    assert results.index(value) == (text.index('} trailing')) // chunk_size
+    assert extractor.done and extractor.finish() == value
+
+
+def test_incremental_extractor_finish_reports_unterminated_start():
+    extractor = IncrementalJSONExtractor()
+    assert extractor.feed('Answer: {"a": ') is None
+    assert extractor.feed('[1, 2') is None
+    with pytest.raises(JSONExtractionError) as exc_info:
+        extractor.finish()
+    assert exc_info.value.position == len('Answer: ')
@@ -0,0 +1,47 @@
+import pytest
+from sqlmodel import SQLModel, Session, create_engine, select
+
+pytest.importorskip('langchain_core')
+
+from db.models import User, Thread, ThreadStatus, ThreadTask, ThreadTaskStatus
+from routers.apps import threads
+from utils import realtime
+
+
+@pytest.fixture
+def db():
+    engine = create_engine('sqlite://')
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+
+
+@pytest.fixture
+def published(monkeypatch):
+    events = []
+    monkeypatch.setattr(realtime.thread_event_broker, 'publish',
+                        lambda thread_id, thread_event: events.append((thread_id, thread_event)))
+    return events
+
+
+def test_cancel_all_running_tasks_publishes_status_events(db, published):
+    user = User(name='Test', email='test@example.com')
+    db.add(user)
+    db.commit()
+    working = Thread(title='Working', user_id=user.id, status=ThreadStatus.WORKING)
+    idle = Thread(title='Idle', user_id=user.id, status=ThreadStatus.STANDBY)
+    db.add(working)
+    db.add(idle)
+    db.commit()
+    task = ThreadTask(thread_id=working.id, task_text='Do it', status=ThreadTaskStatus.WORKING)
+    db.add(task)
+    db.commit()
+    published.clear()
+
+    threads.cancel_all_running_tasks(db=db, user=user)
+
+    assert (working.id, {'type': 'thread_status', 'thread_id': working.id, 'status': ThreadStatus.STANDBY}) in published
+    assert (working.id, {'type': 'task_status', 'thread_id': working.id, 'task_id': task.id,
+                         'status': ThreadTaskStatus.CANCELED}) in published
+    assert all(thread_id != idle.id for thread_id, _ in published)
+    assert db.exec(select(ThreadTask)).one().status == ThreadTaskStatus.CANCELED
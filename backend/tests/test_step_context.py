@@ -0,0 +1,116 @@
+import asyncio
+import json
+import re
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import StaticPool
+from sqlmodel import SQLModel, select, and_
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+pytest.importorskip('aiosqlite')
+
+from db.models import (User, Thread, ThreadStatus, ThreadTask, ThreadTaskPlan, PlanSubtask, SubtaskStatus,
+                       ThreadMessage, ThreadChatType, ThreadChatFromChoices, ThreadTaskMemoryEntry)
+from utils.step_context import load_step_context
+
+
+async def _seed(db: AsyncSession) -> str:
+    user = User(name='Test', email='test@example.com')
+    db.add(user)
+    await db.commit()
+    thread = Thread(title='Thread', user_id=user.id, status=ThreadStatus.WORKING)
+    db.add(thread)
+    await db.commit()
+    task = ThreadTask(thread_id=thread.id, task_text='Send the report')
+    db.add(task)
+    await db.commit()
+    plan = ThreadTaskPlan(thread_task_id=task.id)
+    db.add(plan)
+    await db.commit()
+    db.add(PlanSubtask(thread_task_plan_id=plan.id, subtask_text='Open mail', ordering=1,
+                       status=SubtaskStatus.COMPLETED))
+    current = PlanSubtask(thread_task_plan_id=plan.id, subtask_text='Attach the report', ordering=2)
+    db.add(current)
+    await db.commit()
+    for i in range(7):
+        db.add(ThreadMessage(thread_id=thread.id, thread_task_id=task.id, plan_subtask_id=current.id,
+                             thread_chat_type=ThreadChatType.DESKTOP_USE,
+                             thread_chat_from=ThreadChatFromChoices.FROM_AI,
+                             text=json.dumps({'actions': [{'action': 'wait', 'step': i}]})))
+    db.add(ThreadTaskMemoryEntry(thread_task_id=task.id, text='Report is in Documents'))
+    await db.commit()
+    return user.id, thread.id
+
+
+async def _load_step_context_with_query_plans():
+    """
+    Load a full step context and run the running-thread check, returning the context, the number of
+    statements the load executed and the SQLite query plan of every statement.
+    """
+    engine = create_async_engine('sqlite+aiosqlite://', poolclass=StaticPool)
+    async with engine.begin() as connection:
+        await connection.run_sync(SQLModel.metadata.create_all)
+
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        user_id, tid = await _seed(db)
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, 'before_cursor_execute', record)
+    async with AsyncSession(engine) as db:
+        step_context = await load_step_context(
+            db, tid, user_id,
+            action_chat_type=ThreadChatType.DESKTOP_USE,
+            include_previous_subtasks=True,
+            include_memory=True,
+            previous_tasks_limit=10,
+        )
+        round_trips = len(statements)
+        # The running-thread check of create_thread and continue_thread
+        await db.exec(select(Thread.id).where(and_(
+            Thread.user_id == user_id,
+            Thread.status == ThreadStatus.WORKING,
+        )).limit(1))
+    event.remove(engine.sync_engine, 'before_cursor_execute', record)
+
+    query_plans = []
+    async with engine.connect() as connection:
+        for statement, parameters in statements:
+            rows = (await connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters)).all()
+            query_plans.append(' | '.join(row[-1] for row in rows))
+    await engine.dispose()
+    return step_context, round_trips, query_plans
+
+
+def test_load_step_context_uses_two_round_trips():
+    step_context, round_trips, _ = asyncio.run(_load_step_context_with_query_plans())
+
+    assert round_trips == 2
+    assert step_context.subtask.subtask_text == 'Attach the report'
+    assert step_context.previous_subtasks == ({'subtask_text': 'Open mail', 'status': SubtaskStatus.COMPLETED},)
+    assert [a['actions'][0]['step'] for a in step_context.action_history] == [6, 5, 4, 3, 2]
+    assert step_context.memory_items == ({'memory_item_text': 'Report is in Documents'},)
+    assert [t['task'] for t in step_context.previous_tasks] == ['Send the report']
+
+
+def test_hot_path_queries_use_composite_indexes():
+    _, _, (state_plan, history_plan, working_thread_plan) = asyncio.run(_load_step_context_with_query_plans())
+
+    for index_name in ('ix_thread_tasks_thread_id_status', 'ix_thread_task_plans_thread_task_id_status',
+                       'ix_plan_subtasks_plan_id_status_ordering'):
+        assert index_name in state_plan
+    for index_name in ('ix_thread_messages_task_id_chat_type_created_at',
+                       'ix_thread_task_memory_entries_thread_task_id'):
+        assert index_name in history_plan
+    # Either (user_id, status, created_at) or the (user_id, created_at, id) pagination index serves the previous tasks
+    assert re.search(r'SEARCH threads USING (COVERING )?INDEX ix_threads_user_id_\w+ \(user_id=\?\)', history_plan)
+    assert 'ix_threads_user_id_status_created_at' in working_thread_plan
+
+    # Only subqueries are scanned, never a table
+    for query_plan in (state_plan, history_plan, working_thread_plan):
+        assert not re.search(r'\bSCAN (threads|thread_tasks|thread_task_plans|plan_subtasks|thread_messages|'
+                             r'thread_task_memory_entries)\b', query_plan), query_plan
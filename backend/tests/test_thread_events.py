@@ -0,0 +1,29 @@
+import pytest
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+pytest.importorskip('langchain_core')
+
+from routers.apps import thread_events
+
+
+def test_reject_websocket_delivers_application_close_code():
+    app = FastAPI()
+
+    @app.websocket('/ws')
+    async def endpoint(websocket: WebSocket):
+        await thread_events.reject_websocket(websocket, thread_events.WS_CLOSE_NOT_FOUND)
+
+    with TestClient(app).websocket_connect('/ws') as websocket:
+        with pytest.raises(WebSocketDisconnect) as exc_info:
+            websocket.receive_json()
+    assert exc_info.value.code == thread_events.WS_CLOSE_NOT_FOUND
+
+
+def test_delivered_messages_keeps_only_recent_ids():
+    delivered = thread_events.DeliveredMessages(size=2)
+    for message_id in ('a', 'b', 'b', 'c'):
+        delivered.add(message_id)
+    assert 'a' not in delivered
+    assert 'b' in delivered and 'c' in delivered
@@ -1,3 +1,5 @@
+import asyncio
+
 # Optional import for UnstructuredPDFLoader (heavy dependency). Fallback to PyPDF if missing.
 try:
     from langchain_community.document_loaders import UnstructuredPDFLoader  # type: ignore
@@ -97,4 +99,9 @@ def run_tool_server_side(tool_name: str, args: dict) -> str:
     if tool_name == "summarize_youtube_video":
         return summarize_youtube_video(args["url"]) if args.get("url") else "Missing url"
 
-    raise ValueError(f"Unsupported tool: {tool_name}")
\ No newline at end of file
+    raise ValueError(f"Unsupported tool: {tool_name}")
+
+
+async def arun_tool_server_side(tool_name: str, args: dict) -> str:
+    # Los loaders hacen I/O bloqueante (HTTP, parseo de PDF); se ejecutan fuera del event loop
+    return await asyncio.to_thread(run_tool_server_side, tool_name, args)
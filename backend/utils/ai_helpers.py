@@ -4,17 +4,17 @@ import json
 from utils import llm_provider
 
 
-def generate_thread_title(task):
+def _title_chain():
     llm = llm_provider.get_llm(agent='title', temperature=0.3)
 
     prompt = ChatPromptTemplate.from_messages([
         ('system', ai_prompts.TITLE_GENERATION_PROMPT),
     ])
 
-    chain = prompt | llm
+    return prompt | llm
 
-    response = chain.invoke({'task': task})
 
+def _parse_title(response):
     try:
         response_data = json.loads(response.content.split('```json')[1].split('```')[0])
     except:
@@ -24,3 +24,13 @@ def generate_thread_title(task):
             response_data = {'title': ''}
 
     return response_data.get('title')
+
+
+def generate_thread_title(task):
+    response = _title_chain().invoke({'task': task})
+    return _parse_title(response)
+
+
+async def agenerate_thread_title(task):
+    response = await _title_chain().ainvoke({'task': task})
+    return _parse_title(response)
@@ -393,6 +393,8 @@ scroll
 
 wait
 → { "action": "wait", "params": { "duration": 2, "reason": "Waiting for app to launch" } }
+→ { "action": "wait", "params": { "duration": 5, "until_screen_change": true, "reason": "Waiting for the app window to open" } }
+  (until_screen_change ends the wait early once the foreground window changes; do not use it for page loads)
 
 launch_browser
 → { "action": "launch_browser", "params": { "url": "https://www.google.com" } }
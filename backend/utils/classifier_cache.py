@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dotenv import load_dotenv
+from utils import ai_prompts
+
+load_dotenv()
+
+# memory: per-process LRU; redis: shared across workers through REDIS_CONNECTION; off: disabled
+CLASSIFIER_CACHE_BACKEND = os.getenv('CLASSIFIER_CACHE_BACKEND', 'memory').lower()
+CLASSIFIER_CACHE_TTL_SECONDS = int(os.getenv('CLASSIFIER_CACHE_TTL_SECONDS', '3600'))
+CLASSIFIER_CACHE_MAX_SIZE = int(os.getenv('CLASSIFIER_CACHE_MAX_SIZE', '1024'))
+CLASSIFIER_CACHE_KEY_PREFIX = 'neuralagent:classifier:'
+
+
+class InMemoryClassifierCache:
+    """Process-local TTL + LRU cache."""
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self._max_size = max_size
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    async def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    async def set(self, key: str, value: dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self._ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisClassifierCache:
+    """
+    Cache shared by every worker. Expiry is handled by Redis; LRU eviction follows the
+    server's maxmemory-policy (allkeys-lru is recommended for a dedicated instance).
+    """
+
+    def __init__(self, url: str, ttl_seconds: int):
+        import redis.asyncio as redis
+
+        self._client = redis.from_url(url)
+        self._ttl_seconds = ttl_seconds
+
+    async def get(self, key: str):
+        value = await self._client.get(CLASSIFIER_CACHE_KEY_PREFIX + key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: dict) -> None:
+        await self._client.set(CLASSIFIER_CACHE_KEY_PREFIX + key, json.dumps(value), ex=self._ttl_seconds)
+
+    def size(self):
+        return None
+
+
+def _build_backend():
+    if CLASSIFIER_CACHE_BACKEND == 'off':
+        return None
+    if CLASSIFIER_CACHE_BACKEND == 'redis':
+        redis_url = os.getenv('REDIS_CONNECTION')
+        if not redis_url:
+            raise ValueError('CLASSIFIER_CACHE_BACKEND=redis requires REDIS_CONNECTION')
+        return RedisClassifierCache(redis_url, CLASSIFIER_CACHE_TTL_SECONDS)
+    return InMemoryClassifierCache(CLASSIFIER_CACHE_MAX_SIZE, CLASSIFIER_CACHE_TTL_SECONDS)
+
+
+_backend = _build_backend()
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+
+def normalize_task_text(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip(' .!?')
+
+
+def make_key(task_text: str) -> str:
+    """
+    The key covers the normalized task and the classifier model and prompt, so changing either of
+    them never serves a stale classification. The previous tasks the classifier also sees are left
+    out, otherwise a key would hardly ever repeat; results that depend on them are not stored
+    (see is_cacheable).
+    """
+    fingerprint = json.dumps({
+        'task': normalize_task_text(task_text),
+        'model': [os.getenv('CLASSIFIER_AGENT_MODEL_TYPE'), os.getenv('CLASSIFIER_AGENT_MODEL_ID')],
+        'prompt': hashlib.sha256(ai_prompts.CLASSIFIER_AGENT_PROMPT.encode()).hexdigest(),
+    }, sort_keys=True)
+    return hashlib.sha256(fingerprint.encode()).hexdigest()
+
+
+def is_cacheable(classification: dict) -> bool:
+    """
+    Only desktop tasks that stand on their own are shared: inquiry answers and tasks that need
+    memory from previous tasks are written from the user's own history.
+    """
+    return (classification.get('type') == 'desktop_task'
+            and not classification.get('needs_memory_from_previous_tasks'))
+
+
+def _count(stat: str) -> None:
+    with _stats_lock:
+        _stats[stat] += 1
+
+
+async def lookup(key: str):
+    if _backend is None:
+        return None
+    try:
+        value = await _backend.get(key)
+    except Exception as e:
+        # A cache outage must never fail classification
+        print('Classifier cache read failed: ', e)
+        _count('errors')
+        return None
+    _count('hits' if value is not None else 'misses')
+    return dict(value) if value is not None else None
+
+
+async def store(key: str, value: dict) -> None:
+    if _backend is None:
+        return
+    try:
+        await _backend.set(key, dict(value))
+    except Exception as e:
+        print('Classifier cache write failed: ', e)
+        _count('errors')
+
+
+def get_metrics() -> dict:
+    with _stats_lock:
+        metrics = dict(_stats)
+    lookups = metrics['hits'] + metrics['misses']
+    metrics['hit_rate'] = round(metrics['hits'] / lookups, 3) if lookups else 0.0
+    metrics['backend'] = CLASSIFIER_CACHE_BACKEND
+    metrics['size'] = _backend.size() if _backend is not None else 0
+    return metrics
@@ -0,0 +1,116 @@
+import io
+import json
+import os
+import zlib
+from dotenv import load_dotenv
+from starlette.datastructures import Headers
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+load_dotenv()
+
+# Upper bound on a decompressed request body, so a small compressed upload cannot expand without limit
+MAX_DECOMPRESSED_BODY_BYTES = int(os.getenv('MAX_DECOMPRESSED_BODY_BYTES', str(50 * 1024 * 1024)))
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+def _inflate(data: bytes, wbits: int, limit: int) -> bytes:
+    decompressor = zlib.decompressobj(wbits)
+    body = decompressor.decompress(data, limit + 1)
+    if len(body) > limit or decompressor.unconsumed_tail:
+        raise BodyTooLarge()
+    return body
+
+
+def _decompress_zstd(data: bytes, limit: int) -> bytes:
+    with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)) as reader:
+        body = reader.read(limit + 1)
+    if len(body) > limit:
+        raise BodyTooLarge()
+    return body
+
+
+DECODERS = {
+    'gzip': lambda data, limit: _inflate(data, 16 + zlib.MAX_WBITS, limit),
+    'deflate': lambda data, limit: _inflate(data, zlib.MAX_WBITS, limit),
+}
+if zstandard is not None:
+    DECODERS['zstd'] = _decompress_zstd
+
+
+class RequestDecompressionMiddleware:
+    """
+    Decodes request bodies sent with Content-Encoding gzip, deflate or zstd (when zstandard is
+    installed) before they reach the routers, which then see a plain body. Unsupported encodings get
+    415, corrupt bodies 400 and bodies that decompress past MAX_DECOMPRESSED_BODY_BYTES 413.
+    """
+
+    def __init__(self, app, max_body_bytes: int = MAX_DECOMPRESSED_BODY_BYTES):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        encoding = Headers(scope=scope).get('content-encoding', '').strip().lower()
+        if encoding in ('', 'identity'):
+            await self.app(scope, receive, send)
+            return
+
+        decoder = DECODERS.get(encoding)
+        if decoder is None:
+            await self._reject(send, 415, 'Unsupported_Content_Encoding')
+            return
+
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            chunks.append(message.get('body', b''))
+            more_body = message.get('more_body', False)
+
+        try:
+            body = decoder(b''.join(chunks), self.max_body_bytes)
+        except BodyTooLarge:
+            await self._reject(send, 413, 'Request_Body_Too_Large')
+            return
+        except Exception:
+            await self._reject(send, 400, 'Invalid_Compressed_Body')
+            return
+
+        headers = [(name, value) for name, value in scope['headers']
+                   if name not in (b'content-encoding', b'content-length')]
+        headers.append((b'content-length', str(len(body)).encode('latin-1')))
+        scope = {**scope, 'headers': headers}
+
+        body_sent = False
+
+        async def receive_decoded():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {'type': 'http.request', 'body': body, 'more_body': False}
+            return await receive()
+
+        await self.app(scope, receive_decoded, send)
+
+    @staticmethod
+    async def _reject(send, status_code: int, message: str) -> None:
+        # Same {"message": ...} shape as the CustomError handler
+        content = json.dumps({'message': message}).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(content)).encode())],
+        })
+        await send({'type': 'http.response.body', 'body': content})
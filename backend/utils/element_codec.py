@@ -0,0 +1,112 @@
+import json
+import os
+from typing import Optional
+from fastapi import status
+from dotenv import load_dotenv
+from utils.procedures import CustomError
+from utils.observation_store import LatestPerThreadStore
+
+load_dotenv()
+
+# Last decoded element list per thread, kept as the base of the next delta payload
+ELEMENT_BASE_TTL_SECONDS = int(os.getenv('ELEMENT_BASE_TTL_SECONDS', '900'))
+ELEMENT_BASE_MAX_THREADS = int(os.getenv('ELEMENT_BASE_MAX_THREADS', '4096'))
+
+# x and y are the element center, as in the bounding boxes built by the desktop extractor
+PROMPT_COLUMNS_HEADER = 'one JSON array per element, columns: id, type, label, center_x, center_y, width, height'
+
+_bases = LatestPerThreadStore(ELEMENT_BASE_MAX_THREADS, ELEMENT_BASE_TTL_SECONDS)
+
+
+def _apply_delta(base_rows: list, ops: list) -> list:
+    """
+    ops is a list of edits applied to the base in order: a positive int keeps that many base rows,
+    a negative int skips that many base rows and a list inserts those rows.
+    """
+    rows = []
+    position = 0
+    for op in ops:
+        if isinstance(op, list):
+            rows.extend(op)
+        elif isinstance(op, int) and op > 0:
+            if position + op > len(base_rows):
+                raise CustomError(status.HTTP_400_BAD_REQUEST, 'Invalid_Element_Delta')
+            rows.extend(base_rows[position:position + op])
+            position += op
+        elif isinstance(op, int) and op < 0:
+            position -= op
+        else:
+            raise CustomError(status.HTTP_400_BAD_REQUEST, 'Invalid_Element_Delta')
+    return rows
+
+
+def _resolve_types(rows: list, types: list) -> list:
+    return [[types[row[0]] if isinstance(row[0], int) else row[0], *row[1:]] for row in rows]
+
+
+def _row_to_element(element_id: int, row: list) -> dict:
+    element_type, label, x, y, width, height = row
+    return {
+        'id': element_id,
+        'type': element_type,
+        'label': label,
+        'bounding_box': {'x': x, 'y': y, 'width': width, 'height': height} if x is not None else None,
+    }
+
+
+def _decode_delta(thread_id: Optional[str], payload) -> list:
+    if thread_id is None:
+        raise CustomError(status.HTTP_400_BAD_REQUEST, 'Element_Delta_Requires_Thread')
+    base_rows = _bases.get(thread_id, payload.base)
+    if base_rows is None:
+        raise CustomError(status.HTTP_409_CONFLICT, 'Stale_Element_Base')
+    ops = [_resolve_types(op, payload.types) if isinstance(op, list) else op for op in payload.ops]
+    return _apply_delta(base_rows, ops)
+
+
+def decode_elements(thread_id: Optional[str], payload) -> list:
+    """
+    Expand a compact element payload (schemas.aiagent.CompactElements) back into the
+    {id, type, label, bounding_box} dicts produced by the desktop extractor.
+
+    Rows are [type, label, x, y, width, height], where type indexes payload.types. Ids are
+    positional (1-based) unless overridden in payload.ids. A delta payload (base set) is applied to
+    the thread's previous observation; when that is unknown to this worker a 409 Stale_Element_Base
+    tells the client to send the full list again.
+    """
+    types = payload.types
+    try:
+        if payload.base is None:
+            rows = _resolve_types(payload.rows, types)
+        else:
+            rows = _decode_delta(thread_id, payload)
+    except (IndexError, TypeError):
+        raise CustomError(status.HTTP_400_BAD_REQUEST, 'Invalid_Element_Row')
+
+    if thread_id is not None:
+        _bases.set(thread_id, payload.observation_id, rows)
+
+    ids = payload.ids
+    try:
+        return [_row_to_element(ids.get(position, position), row) for position, row in enumerate(rows, start=1)]
+    except (ValueError, TypeError):
+        raise CustomError(status.HTTP_400_BAD_REQUEST, 'Invalid_Element_Row')
+
+
+def resolve_elements(thread_id: Optional[str], observation) -> None:
+    """Fill observation.current_interactive_elements from its compact payload, if one was sent."""
+    if observation.interactive_elements is not None:
+        observation.current_interactive_elements = decode_elements(thread_id, observation.interactive_elements)
+        observation.interactive_elements = None
+
+
+def format_elements_for_prompt(elements: list) -> str:
+    """Tabular rendering: a fraction of the tokens of json.dumps over the verbose dicts."""
+    lines = [f'({PROMPT_COLUMNS_HEADER})']
+    for element in elements:
+        bounding_box = element.get('bounding_box') or {}
+        lines.append(json.dumps([
+            element.get('id'), element.get('type'), element.get('label'),
+            bounding_box.get('x'), bounding_box.get('y'), bounding_box.get('width'), bounding_box.get('height'),
+        ], ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines)
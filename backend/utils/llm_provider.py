@@ -1,6 +1,12 @@
+import asyncio
 import os
+import threading
+import time
+from collections import OrderedDict
 from dotenv import load_dotenv
 from botocore.config import Config
+import boto3
+import httpx
 
 from langchain_openai import ChatOpenAI, AzureChatOpenAI
 from langchain_aws import ChatBedrockConverse
@@ -9,14 +15,144 @@ from langchain_core.language_models.chat_models import BaseChatModel
 
 load_dotenv()  # Load env variables from .env
 
+LLM_REGISTRY_MAX_SIZE = int(os.getenv("LLM_REGISTRY_MAX_SIZE", "32"))
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+# How long a replaced connection pool stays open for the requests still using it
+LLM_RETIRED_CLIENT_GRACE_SECONDS = float(os.getenv("LLM_RETIRED_CLIENT_GRACE_SECONDS", "600"))
+
+# Provider-level settings that, when changed, make every cached client stale
+PROVIDER_ENV_KEYS = (
+    "OPENAI_API_KEY", "OPENAI_API_VERSION", "AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_API_KEY",
+    "ANTHROPIC_API_KEY", "AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "BEDROCK_REGION",
+)
+
+_registry_lock = threading.Lock()
+_llm_registry: "OrderedDict[tuple, BaseChatModel]" = OrderedDict()
+_shared_clients = {
+    'fingerprint': None,
+    'http_client': None,
+    'http_async_client': None,
+    'bedrock': {},
+}
+# (retired at, client) for replaced pools not closed yet, and the background tasks closing AsyncClients
+_retired_clients = []
+_closing_tasks = set()
+
+
+def _provider_fingerprint() -> tuple:
+    return tuple(os.getenv(key) for key in PROVIDER_ENV_KEYS)
+
+
+def invalidate_llm_registry() -> None:
+    """
+    Drop every cached LLM client and shared connection pool.
+    Call this after changing model or provider configuration at runtime.
+    """
+    with _registry_lock:
+        _invalidate_locked()
+
+
+def _invalidate_locked() -> None:
+    _llm_registry.clear()
+    _retire_shared_clients_locked()
+    _shared_clients['fingerprint'] = _provider_fingerprint()
+
+
+def _retire_shared_clients_locked() -> None:
+    """
+    Stop handing out the shared pools. LLM objects built on them may still be in the middle of a
+    request, so the pools are only closed once LLM_RETIRED_CLIENT_GRACE_SECONDS have passed.
+    """
+    retired_at = time.monotonic()
+    clients = [_shared_clients['http_client'], _shared_clients['http_async_client'],
+               *_shared_clients['bedrock'].values()]
+    _retired_clients.extend((retired_at, client) for client in clients if client is not None)
+    _shared_clients['http_client'] = None
+    _shared_clients['http_async_client'] = None
+    _shared_clients['bedrock'] = {}
+
+
+def _close_retired_clients_locked(grace_seconds: float) -> None:
+    """
+    Close the pools retired more than grace_seconds ago. An AsyncClient can only be closed on an
+    event loop: without one running in this thread it is kept until a later call has one.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    now = time.monotonic()
+    remaining = []
+    for retired_at, client in _retired_clients:
+        if now - retired_at < grace_seconds:
+            remaining.append((retired_at, client))
+        elif isinstance(client, httpx.AsyncClient):
+            if loop is None:
+                remaining.append((retired_at, client))
+                continue
+            task = loop.create_task(client.aclose())
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+        else:
+            close = getattr(client, 'close', None)
+            if close is not None:
+                close()
+    _retired_clients[:] = remaining
+
+
+async def close_llm_clients() -> None:
+    """Close every shared and retired connection pool, e.g. on application shutdown."""
+    with _registry_lock:
+        _llm_registry.clear()
+        _retire_shared_clients_locked()
+        _close_retired_clients_locked(grace_seconds=0)
+        _shared_clients['fingerprint'] = None
+    if _closing_tasks:
+        await asyncio.gather(*_closing_tasks, return_exceptions=True)
+
+
+def _get_http_clients():
+    if _shared_clients['http_client'] is None:
+        limits = httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_CONNECTIONS,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        )
+        _shared_clients['http_client'] = httpx.Client(limits=limits, timeout=None)
+        _shared_clients['http_async_client'] = httpx.AsyncClient(limits=limits, timeout=None)
+    return _shared_clients['http_client'], _shared_clients['http_async_client']
+
+
+def _get_bedrock_client(region_name: str):
+    client = _shared_clients['bedrock'].get(region_name)
+    if client is None:
+        boto3_config = Config(
+            connect_timeout=300,
+            read_timeout=300,
+            retries={'max_attempts': 5},
+            region_name=region_name,
+            max_pool_connections=LLM_HTTP_MAX_CONNECTIONS,
+            tcp_keepalive=True,
+        )
+        client = boto3.client("bedrock-runtime", region_name=region_name, config=boto3_config)
+        _shared_clients['bedrock'][region_name] = client
+    return client
+
+
 def get_llm(agent: str, temperature: float = 0.0, max_tokens: int = None, thinking_enabled: bool = False) -> BaseChatModel:
     """
     Get an LLM instance based on agent name and environment variables.
 
+    Instances are long-lived and shared process-wide, keyed by agent, model, temperature,
+    token limit and thinking mode, so repeated calls reuse warm keep-alive connections.
+
     Args:
         agent (str): Logical name of the agent, e.g., "planner", "suggestor", "computer_use", "classifier", "title"
         temperature (float): Sampling temperature
         max_tokens (int): Optional token limit
+        thinking_enabled (bool): Enable extended thinking where the provider supports it
 
     Returns:
         langchain-compatible LLM object
@@ -27,24 +163,52 @@ def get_llm(agent: str, temperature: float = 0.0, max_tokens: int = None, thinki
     if not model_type or not model_id:
         raise ValueError(f"Missing model config for agent: {agent}")
 
+    key = (agent, model_type, model_id, temperature, max_tokens, thinking_enabled)
+
+    with _registry_lock:
+        if _shared_clients['fingerprint'] != _provider_fingerprint():
+            _invalidate_locked()
+        if _retired_clients:
+            _close_retired_clients_locked(LLM_RETIRED_CLIENT_GRACE_SECONDS)
+
+        llm = _llm_registry.get(key)
+        if llm is not None:
+            _llm_registry.move_to_end(key)
+            return llm
+
+        llm = _build_llm(agent, model_type, model_id, temperature, max_tokens, thinking_enabled)
+        _llm_registry[key] = llm
+        while len(_llm_registry) > LLM_REGISTRY_MAX_SIZE:
+            _llm_registry.popitem(last=False)
+        return llm
+
+
+def _build_llm(agent: str, model_type: str, model_id: str, temperature: float, max_tokens: int,
+               thinking_enabled: bool) -> BaseChatModel:
     if model_type == "azure_openai":
+        http_client, http_async_client = _get_http_clients()
         return AzureChatOpenAI(
             azure_deployment=model_id,
             api_version=os.getenv("OPENAI_API_VERSION", "2024-12-01-preview"),
             temperature=temperature,
             max_tokens=max_tokens,
             timeout=None,
-            max_retries=2
+            max_retries=2,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
     
     elif model_type == "openai":
+        http_client, http_async_client = _get_http_clients()
         return ChatOpenAI(
             model=model_id,
             openai_api_key=os.getenv("OPENAI_API_KEY"),
             temperature=temperature,
             max_tokens=max_tokens,
             timeout=None,
-            max_retries=2
+            max_retries=2,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
 
     elif model_type == "anthropic":
@@ -71,19 +235,15 @@ def get_llm(agent: str, temperature: float = 0.0, max_tokens: int = None, thinki
                 "budget_tokens": 2000
             }
         }
-        boto3_config = Config(
-            connect_timeout=300,
-            read_timeout=300,
-            retries={'max_attempts': 5},
-            region_name=os.getenv("BEDROCK_REGION", "us-east-1")
-        )
+        region_name = os.getenv("BEDROCK_REGION", "us-east-1")
+        bedrock_client = _get_bedrock_client(region_name)
         if thinking_enabled and 'claude' in model_id:
             return ChatBedrockConverse(
                 model=model_id,
                 temperature=temperature,
                 max_tokens=max_tokens,
-                config=boto3_config,
-                region_name=os.getenv("BEDROCK_REGION", "us-east-1"),
+                client=bedrock_client,
+                region_name=region_name,
                 additional_model_request_fields=thinking_params
             )
         else:
@@ -91,9 +251,73 @@ def get_llm(agent: str, temperature: float = 0.0, max_tokens: int = None, thinki
                 model=model_id,
                 temperature=temperature,
                 max_tokens=max_tokens,
-                config=boto3_config,
-                region_name=os.getenv("BEDROCK_REGION", "us-east-1")
+                client=bedrock_client,
+                region_name=region_name
             )
 
     else:
         raise ValueError(f"Unsupported model type '{model_type}' for agent '{agent}'")
+
+
+def get_prompt_cache_style(agent: str) -> str:
+    """
+    Return how prompt-cache breakpoints are expressed for the agent's provider:
+    "anthropic" (cache_control), "bedrock" (cachePoint) or "" when the provider caches implicitly / not at all.
+    """
+    model_type = os.getenv(f"{agent.upper()}_AGENT_MODEL_TYPE")
+    model_id = os.getenv(f"{agent.upper()}_AGENT_MODEL_ID") or ""
+
+    if model_type == "anthropic":
+        return "anthropic"
+    if model_type == "bedrock" and ('claude' in model_id or 'nova' in model_id):
+        return "bedrock"
+    return ""
+
+
+def with_cache_breakpoint(agent: str, blocks: list) -> list:
+    """
+    Mark the end of `blocks` as a prompt-cache breakpoint so everything up to it is
+    reused across requests. Blocks are returned unchanged for providers without explicit caching.
+    """
+    if not blocks:
+        return blocks
+
+    cache_style = get_prompt_cache_style(agent)
+    if cache_style == "anthropic":
+        return blocks[:-1] + [{**blocks[-1], 'cache_control': {'type': 'ephemeral'}}]
+    if cache_style == "bedrock":
+        return blocks + [{'cachePoint': {'type': 'default'}}]
+    return blocks
+
+
+_usage_lock = threading.Lock()
+_usage_stats = {}
+
+
+def record_usage(agent: str, usage_metadata: dict) -> None:
+    """Accumulate token usage, including prompt-cache reads and writes, per agent."""
+    if not usage_metadata:
+        return
+
+    details = usage_metadata.get('input_token_details') or {}
+    with _usage_lock:
+        stats = _usage_stats.setdefault(agent, {
+            'calls': 0,
+            'input_tokens': 0,
+            'output_tokens': 0,
+            'cache_read_tokens': 0,
+            'cache_creation_tokens': 0,
+            'cache_hits': 0,
+        })
+        stats['calls'] += 1
+        stats['input_tokens'] += usage_metadata.get('input_tokens', 0) or 0
+        stats['output_tokens'] += usage_metadata.get('output_tokens', 0) or 0
+        stats['cache_read_tokens'] += details.get('cache_read', 0) or 0
+        stats['cache_creation_tokens'] += details.get('cache_creation', 0) or 0
+        if details.get('cache_read'):
+            stats['cache_hits'] += 1
+
+
+def get_usage_metrics() -> dict:
+    with _usage_lock:
+        return {agent: dict(stats) for agent, stats in _usage_stats.items()}
@@ -0,0 +1,34 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LatestPerThreadStore:
+    """
+    Process-local TTL + LRU map of thread id -> the last observation part a client sent for it
+    (element rows, screenshot), looked up by the id the client gave it.
+    """
+
+    def __init__(self, max_threads: int, ttl_seconds: int):
+        self._max_threads = max_threads
+        self._ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, thread_id: str, value_id: str):
+        with self._lock:
+            entry = self._entries.get(thread_id)
+            if entry is None:
+                return None
+            expires_at, stored_id, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[thread_id]
+                return None
+            return value if stored_id == value_id else None
+
+    def set(self, thread_id: str, value_id: str, value) -> None:
+        with self._lock:
+            self._entries[thread_id] = (time.monotonic() + self._ttl_seconds, value_id, value)
+            self._entries.move_to_end(thread_id)
+            while len(self._entries) > self._max_threads:
+                self._entries.popitem(last=False)
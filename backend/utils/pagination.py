@@ -0,0 +1,36 @@
+import base64
+import datetime
+import json
+from fastapi import status
+from sqlalchemy import and_, or_
+from utils.procedures import CustomError
+
+
+def encode_cursor(created_at: datetime.datetime, row_id) -> str:
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.datetime.fromisoformat(created_at), row_id
+    except (ValueError, TypeError):
+        raise CustomError(status.HTTP_400_BAD_REQUEST, 'Invalid_Cursor')
+
+
+def row_cursor(row) -> str:
+    return encode_cursor(row.created_at, row.id)
+
+
+def keyset_after(created_at_col, id_col, cursor: str):
+    """Rows strictly newer than the cursor in (created_at, id) order."""
+    created_at, row_id = decode_cursor(cursor)
+    return or_(created_at_col > created_at, and_(created_at_col == created_at, id_col > row_id))
+
+
+def keyset_before(created_at_col, id_col, cursor: str):
+    """Rows strictly older than the cursor in (created_at, id) order."""
+    created_at, row_id = decode_cursor(cursor)
+    return or_(created_at_col < created_at, and_(created_at_col == created_at, id_col < row_id))
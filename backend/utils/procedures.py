@@ -38,15 +38,217 @@ def generate_api_key():
     return 'na-sk-' + secrets.token_urlsafe(64)
 
 
+class JSONExtractionError(ValueError):
+    def __init__(self, message: str, position: int = None):
+        super().__init__(message if position is None else f'{message} (at position {position})')
+        self.message = message
+        self.position = position
+
+
+class _BracketScanner:
+    """
+    Single-pass scanner over (possibly chunked) model output. Text before the first `opener` is
+    skipped as prose; from there on it yields every bracket outside of JSON string literals while
+    tracking the nesting depth, jumping straight from one structural character to the next.
+
+    Fed chunks are kept in a list and only joined when a subclass needs a slice of the text (or
+    rescans from an earlier position), so streaming n characters costs O(n), not O(n^2).
+    """
+    _STRUCTURAL = re.compile(r'[{}\[\]"]')
+    _STRING_SPECIAL = re.compile(r'["\\]')
+
+    def __init__(self, opener: str = '{'):
+        self._opener = opener
+        self._joined = ''
+        self._chunks = []
+        self._length = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+
+    @property
+    def _text(self) -> str:
+        """Everything fed so far."""
+        if self._chunks:
+            self._joined += ''.join(self._chunks)
+            self._chunks = []
+        return self._joined
+
+    def _scan(self, chunk: str):
+        chunk_start = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        while True:
+            # Positions are absolute; only a rescan of earlier text needs the joined buffer
+            if self._pos >= chunk_start:
+                text, offset = chunk, chunk_start
+            else:
+                text, offset = self._text, 0
+
+            if self._depth == 0:
+                start = text.find(self._opener, self._pos - offset)
+                if start < 0:
+                    self._pos = self._length
+                    return
+                start += offset
+                self._pos = start + 1
+                self._depth = 1
+                self._in_string = False
+                yield start, self._opener
+                continue
+
+            if self._in_string:
+                match = self._STRING_SPECIAL.search(text, self._pos - offset)
+                if not match:
+                    self._pos = self._length
+                    return
+                if match.group() == '\\':
+                    if match.end() >= len(text):
+                        # The escaped character is in the next chunk
+                        self._pos = match.start() + offset
+                        return
+                    self._pos = match.end() + offset + 1
+                else:
+                    self._in_string = False
+                    self._pos = match.end() + offset
+                continue
+
+            match = self._STRUCTURAL.search(text, self._pos - offset)
+            if not match:
+                self._pos = self._length
+                return
+            c = match.group()
+            self._pos = match.end() + offset
+            if c == '"':
+                self._in_string = True
+                continue
+            self._depth += 1 if c in '{[' else -1
+            yield match.start() + offset, c
+
+
+class IncrementalJSONExtractor(_BracketScanner):
+    """
+    Returns the first complete, valid top-level JSON object (or array, with opener='[') found in
+    model output. Chunks can be fed as they are streamed; feed() returns the value once it is complete.
+    Balanced candidates that fail to parse (e.g. braces in prose) are skipped and the scan resumes
+    right after their opening bracket.
+    """
+
+    def __init__(self, opener: str = '{'):
+        super().__init__(opener)
+        self._start = None
+        self._error = None
+        self.done = False
+        self.value = None
+
+    def feed(self, chunk: str):
+        if self.done:
+            return self.value
+
+        for i, c in self._scan(chunk):
+            if self._depth == 1 and c == self._opener and self._start is None:
+                self._start = i
+            elif self._depth == 0:
+                start, self._start = self._start, None
+                try:
+                    self.value = json.loads(self._text[start:i + 1])
+                except json.JSONDecodeError as e:
+                    self._error = (e.msg, start + e.pos)
+                    self._pos = start + 1
+                    continue
+                self.done = True
+                return self.value
+
+        return None
+
+    def finish(self):
+        if self.done:
+            return self.value
+
+        kind = 'array' if self._opener == '[' else 'object'
+        if self._start is not None:
+            raise JSONExtractionError(f'Unterminated JSON {kind} in model response', self._start)
+        if self._error:
+            raise JSONExtractionError(f'Invalid JSON {kind} in model response: {self._error[0]}', self._error[1])
+        if self._opener == '[':
+            raise JSONExtractionError('No valid JSON array found in model response.')
+        raise JSONExtractionError('No valid JSON found in model response.')
+
+
 def extract_json(raw: str):
-    match = re.search(r"\{.*\}", raw, re.DOTALL)
-    if not match:
-        raise ValueError("No valid JSON found in model response.")
-    return json.loads(match.group(0))
+    extractor = IncrementalJSONExtractor('{')
+    extractor.feed(raw)
+    return extractor.finish()
 
 
 def extract_json_array(raw: str):
-    match = re.search(r"\[.*\]", raw, re.DOTALL)
-    if not match:
-        raise ValueError("No valid JSON array found in model response.")
-    return json.loads(match.group(0))
+    extractor = IncrementalJSONExtractor('[')
+    extractor.feed(raw)
+    return extractor.finish()
+
+
+class JSONActionStreamParser(_BracketScanner):
+    """
+    Incrementally scans streamed model output and returns each element of the top-level
+    "actions" array as soon as its closing brace has arrived. Top-level objects that close without
+    such an array (e.g. braces in prose before the JSON) are skipped and the scan resumes, as in
+    IncrementalJSONExtractor.
+    """
+
+    def __init__(self, array_key: str = 'actions'):
+        super().__init__('{')
+        self._quoted_key = json.dumps(array_key)
+        self._array_state = 'pending'  # pending -> open -> closed
+        self._start = None
+        self._item_start = None
+        self._finished = False
+
+    def feed(self, chunk: str) -> list:
+        items = []
+        if self._finished:
+            return items
+
+        for i, c in self._scan(chunk):
+            depth = self._depth
+            if c == '{' and depth == 1:
+                self._start = i
+            elif (c == '[' and depth == 2 and self._array_state == 'pending'
+                    and self._follows_key(i)):
+                self._array_state = 'open'
+            elif c == '{' and depth == 3 and self._array_state == 'open':
+                self._item_start = i
+            elif c == '}' and depth == 2 and self._item_start is not None:
+                try:
+                    items.append(json.loads(self._text[self._item_start:i + 1]))
+                except ValueError:
+                    pass
+                self._item_start = None
+            elif c == ']' and depth == 1 and self._array_state == 'open':
+                self._array_state = 'closed'
+            elif depth == 0:
+                if self._array_state == 'closed':
+                    self._finished = True
+                    break
+                start, self._start = self._start, None
+                self._array_state = 'pending'
+                self._item_start = None
+                try:
+                    json.loads(self._text[start:i + 1])
+                except ValueError:
+                    # Not JSON: the object may start inside it
+                    self._pos = start + 1
+
+        return items
+
+    def _follows_key(self, i: int) -> bool:
+        """Whether the text before position i ends with `"<array_key>":`, give or take whitespace."""
+        text = self._text
+        end = i
+        while end > 0 and text[end - 1].isspace():
+            end -= 1
+        if end == 0 or text[end - 1] != ':':
+            return False
+        end -= 1
+        while end > 0 and text[end - 1].isspace():
+            end -= 1
+        return text.endswith(self._quoted_key, 0, end)
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from db.models import Thread, ThreadTask, ThreadMessage
+from utils.pagination import row_cursor
+
+load_dotenv()
+
+# memory: fan-out inside this worker only; redis: fan-out across workers through REDIS_CONNECTION
+REALTIME_BACKEND = os.getenv('REALTIME_BACKEND', 'memory').lower()
+# Events buffered per subscriber before it is considered too slow and has to catch up from the database
+REALTIME_QUEUE_SIZE = int(os.getenv('REALTIME_QUEUE_SIZE', '256'))
+
+
+def serialize_message(message: ThreadMessage) -> dict:
+    return {
+        'type': 'thread_message',
+        'cursor': row_cursor(message),
+        'message': {
+            'id': message.id,
+            'thread_id': message.thread_id,
+            'thread_task_id': message.thread_task_id,
+            'plan_subtask_id': message.plan_subtask_id,
+            'thread_chat_type': message.thread_chat_type,
+            'thread_chat_from': message.thread_chat_from,
+            'text': message.text,
+            'chain_of_thought': message.chain_of_thought,
+            'created_at': message.created_at.isoformat() if message.created_at else None,
+        },
+    }
+
+
+def thread_status_event(thread: Thread) -> dict:
+    return {'type': 'thread_status', 'thread_id': thread.id, 'status': thread.status}
+
+
+def task_status_event(task: ThreadTask) -> dict:
+    return {'type': 'task_status', 'thread_id': task.thread_id, 'task_id': task.id, 'status': task.status}
+
+
+class Subscription:
+    """
+    A bounded per-connection queue. When the consumer falls behind, pending events are dropped
+    and get() returns None once, telling the consumer to catch up from its last cursor.
+    """
+
+    def __init__(self, thread_id: str, max_size: int):
+        self.thread_id = thread_id
+        self._queue = asyncio.Queue(max_size)
+
+    def push(self, thread_event: dict) -> None:
+        try:
+            self._queue.put_nowait(thread_event)
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+
+    async def get(self):
+        return await self._queue.get()
+
+
+class ThreadEventBroker:
+    def __init__(self, backend: str, queue_size: int):
+        self._backend = backend
+        self._queue_size = queue_size
+        self._loop = None
+        self._broadcast = None
+        self._subscribers = defaultdict(set)
+        self._relays = {}
+
+    async def connect(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        if self._backend == 'redis':
+            from broadcaster import Broadcast
+
+            redis_url = os.getenv('REDIS_CONNECTION')
+            if not redis_url:
+                raise ValueError('REALTIME_BACKEND=redis requires REDIS_CONNECTION')
+            self._broadcast = Broadcast(redis_url)
+            await self._broadcast.connect()
+
+    async def disconnect(self) -> None:
+        for relay in self._relays.values():
+            relay.cancel()
+        self._relays.clear()
+        if self._broadcast is not None:
+            await self._broadcast.disconnect()
+            self._broadcast = None
+        self._loop = None
+
+    @staticmethod
+    def _channel(thread_id: str) -> str:
+        return f'neuralagent:thread:{thread_id}'
+
+    @asynccontextmanager
+    async def subscribe(self, thread_id: str):
+        subscription = Subscription(thread_id, self._queue_size)
+        self._subscribers[thread_id].add(subscription)
+        if self._broadcast is not None and thread_id not in self._relays:
+            self._relays[thread_id] = asyncio.create_task(self._relay(thread_id))
+        try:
+            yield subscription
+        finally:
+            subscribers = self._subscribers.get(thread_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[thread_id]
+                    relay = self._relays.pop(thread_id, None)
+                    if relay is not None:
+                        relay.cancel()
+
+    async def _relay(self, thread_id: str) -> None:
+        async with self._broadcast.subscribe(channel=self._channel(thread_id)) as subscriber:
+            async for broadcast_event in subscriber:
+                self._fan_out(thread_id, json.loads(broadcast_event.message))
+
+    def _fan_out(self, thread_id: str, thread_event: dict) -> None:
+        for subscription in list(self._subscribers.get(thread_id, ())):
+            subscription.push(thread_event)
+
+    def publish(self, thread_id: str, thread_event: dict) -> None:
+        """Safe to call from request threads as well as from the event loop."""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        if self._broadcast is not None:
+            asyncio.run_coroutine_threadsafe(
+                self._broadcast.publish(channel=self._channel(thread_id), message=json.dumps(thread_event)), loop,
+            )
+        else:
+            loop.call_soon_threadsafe(self._fan_out, thread_id, thread_event)
+
+
+thread_event_broker = ThreadEventBroker(REALTIME_BACKEND, REALTIME_QUEUE_SIZE)
+
+
+# Events are collected at flush time, while primary keys and attribute history are available,
+# and only published once the transaction has committed.
+@event.listens_for(Session, 'after_flush')
+def _collect_thread_events(session, flush_context):
+    pending = session.info.setdefault('thread_events', [])
+    for instance in session.new:
+        if isinstance(instance, ThreadMessage):
+            pending.append((instance.thread_id, serialize_message(instance)))
+        elif isinstance(instance, ThreadTask):
+            pending.append((instance.thread_id, task_status_event(instance)))
+        elif isinstance(instance, Thread):
+            pending.append((instance.id, thread_status_event(instance)))
+    for instance in session.dirty:
+        if isinstance(instance, (Thread, ThreadTask)) and inspect(instance).attrs.status.history.has_changes():
+            if isinstance(instance, Thread):
+                pending.append((instance.id, thread_status_event(instance)))
+            else:
+                pending.append((instance.thread_id, task_status_event(instance)))
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_thread_events(session):
+    for thread_id, thread_event in session.info.pop('thread_events', []):
+        thread_event_broker.publish(thread_id, thread_event)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_thread_events(session):
+    session.info.pop('thread_events', None)
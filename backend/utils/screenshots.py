@@ -0,0 +1,155 @@
+import base64
+import os
+from io import BytesIO
+from typing import Optional
+from fastapi import status
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image
+from dotenv import load_dotenv
+from utils.procedures import CustomError
+from utils.observation_store import LatestPerThreadStore
+
+load_dotenv()
+
+# Last screenshot per thread, reused when the client reports an unchanged screen
+SCREENSHOT_STORE_TTL_SECONDS = int(os.getenv('SCREENSHOT_STORE_TTL_SECONDS', '900'))
+SCREENSHOT_STORE_MAX_THREADS = int(os.getenv('SCREENSHOT_STORE_MAX_THREADS', '1024'))
+
+# Upper bound on the tiles of one frame, whatever the tile size
+MAX_SCREENSHOT_TILES = 512
+
+SUPPORTED_MEDIA_TYPES = {'image/png', 'image/jpeg', 'image/webp', 'image/gif'}
+
+# Leading base64 characters of each format's magic bytes
+_BASE64_SIGNATURES = (
+    ('iVBORw0KGgo', 'image/png'),
+    ('/9j/', 'image/jpeg'),
+    ('UklGR', 'image/webp'),
+    ('R0lGOD', 'image/gif'),
+)
+
+
+def detect_media_type(screenshot_b64: str) -> str:
+    for signature, media_type in _BASE64_SIGNATURES:
+        if screenshot_b64.startswith(signature):
+            return media_type
+    return 'image/png'
+
+
+def screenshot_media_type(screenshot_b64: str, declared: Optional[str] = None) -> str:
+    """
+    The media type sent to the model has to match the actual encoding. Clients that predate
+    screenshot_media_type (and the background agent, which always sent JPEG) are sniffed.
+    """
+    if declared in SUPPORTED_MEDIA_TYPES:
+        return declared
+    return detect_media_type(screenshot_b64)
+
+
+def screenshot_block(screenshot_b64: str, declared_media_type: Optional[str] = None) -> dict:
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": screenshot_media_type(screenshot_b64, declared_media_type),
+            "data": screenshot_b64,
+        }
+    }
+
+
+_screenshots = LatestPerThreadStore(SCREENSHOT_STORE_MAX_THREADS, SCREENSHOT_STORE_TTL_SECONDS)
+
+
+_PIL_FORMATS = {
+    'image/jpeg': 'JPEG',
+    'image/webp': 'WEBP',
+    'image/png': 'PNG',
+}
+
+
+def _open_image(image_b64: str, max_size: Optional[tuple] = None) -> Image.Image:
+    image = Image.open(BytesIO(base64.b64decode(image_b64)))
+    # The header is read lazily, so oversized images are rejected before their pixels are decoded
+    if max_size is not None and (image.width > max_size[0] or image.height > max_size[1]):
+        raise ValueError('Image larger than allowed')
+    return image.convert('RGB')
+
+
+def _check_tiles(screenshot_tiles) -> None:
+    """Tiles have to lie inside the frame, which the schema already caps in size."""
+    if (screenshot_tiles.tile_width > screenshot_tiles.width
+            or screenshot_tiles.tile_height > screenshot_tiles.height):
+        raise ValueError('Tile larger than the frame')
+    columns = -(-screenshot_tiles.width // screenshot_tiles.tile_width)
+    rows = -(-screenshot_tiles.height // screenshot_tiles.tile_height)
+    if len(screenshot_tiles.tiles) > min(columns * rows, MAX_SCREENSHOT_TILES):
+        raise ValueError('Too many tiles')
+    for tile in screenshot_tiles.tiles:
+        if len(tile) != 3:
+            raise ValueError('Malformed tile')
+        col, row, _ = tile
+        if not (isinstance(col, int) and isinstance(row, int) and 0 <= col < columns and 0 <= row < rows):
+            raise ValueError('Tile outside the frame')
+
+
+def reconstruct_from_tiles(screenshot_tiles, base: Optional[tuple]) -> tuple:
+    """
+    Paste the changed tiles onto the thread's previous frame. Without that frame (restart, another
+    worker) the low-resolution thumbnail is scaled up in its place, so unchanged regions are blurry
+    instead of the step failing. Returns (screenshot_b64, media_type) of the rebuilt frame.
+    """
+    _check_tiles(screenshot_tiles)
+    size = (screenshot_tiles.width, screenshot_tiles.height)
+    if base is not None:
+        frame = _open_image(base[0])
+    else:
+        frame = _open_image(screenshot_tiles.thumbnail_b64, size)
+    if frame.size != size:
+        frame = frame.resize(size, Image.BILINEAR)
+
+    tile_size = (screenshot_tiles.tile_width, screenshot_tiles.tile_height)
+    for col, row, tile_b64 in screenshot_tiles.tiles:
+        frame.paste(_open_image(tile_b64, tile_size), (col * screenshot_tiles.tile_width, row * screenshot_tiles.tile_height))
+
+    media_type = screenshot_tiles.media_type if screenshot_tiles.media_type in _PIL_FORMATS else 'image/jpeg'
+    buffer = BytesIO()
+    if media_type == 'image/png':
+        frame.save(buffer, format='PNG', compress_level=1)
+    else:
+        # Re-encoded at a high quality so pasted regions do not degrade over consecutive steps
+        frame.save(buffer, format=_PIL_FORMATS[media_type], quality=90)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8'), media_type
+
+
+async def resolve_screenshot(thread_id: str, observation) -> None:
+    """
+    Remember a screenshot sent with a screenshot_id, or fill in the stored one when the client sent
+    screenshot_ref because its screen did not change, or rebuild it from screenshot_tiles.
+    An unknown reference (restart, another worker) is a 409 Stale_Screenshot_Ref so the client
+    uploads the frame again. Tiles without their base are rebuilt on the thumbnail; that frame is
+    not stored, so the client's next reference fails and it falls back to a full upload.
+    """
+    if observation.screenshot_tiles is not None:
+        screenshot_tiles = observation.screenshot_tiles
+        base = _screenshots.get(thread_id, screenshot_tiles.base) if screenshot_tiles.base else None
+        try:
+            observation.screenshot_b64, observation.screenshot_media_type = await run_in_threadpool(
+                reconstruct_from_tiles, screenshot_tiles, base,
+            )
+        except (OSError, ValueError, TypeError):
+            raise CustomError(status.HTTP_400_BAD_REQUEST, 'Invalid_Screenshot_Tiles')
+        observation.screenshot_tiles = None
+        if base is None:
+            return
+
+    if observation.screenshot_ref:
+        stored = _screenshots.get(thread_id, observation.screenshot_ref)
+        if stored is None:
+            raise CustomError(status.HTTP_409_CONFLICT, 'Stale_Screenshot_Ref')
+        observation.screenshot_b64, observation.screenshot_media_type = stored
+        observation.screenshot_id, observation.screenshot_ref = observation.screenshot_ref, None
+        return
+
+    if observation.screenshot_b64 and observation.screenshot_id:
+        _screenshots.set(thread_id, observation.screenshot_id,
+                         (observation.screenshot_b64, observation.screenshot_media_type))
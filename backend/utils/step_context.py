@@ -0,0 +1,177 @@
+import json
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from fastapi import status
+from sqlalchemy import String, Integer, cast, func, literal_column, null, union_all
+from sqlmodel import select, and_
+from sqlmodel.ext.asyncio.session import AsyncSession
+from db.models import (Thread, ThreadStatus, ThreadTask, ThreadTaskStatus, ThreadMessage, ThreadTaskPlan,
+                       ThreadTaskPlanStatus, PlanSubtask, SubtaskStatus, ThreadTaskMemoryEntry)
+from utils.procedures import CustomError
+
+
+ACTION_HISTORY_LIMIT = 5
+MEMORY_TASKS_LIMIT = 5
+
+
+@dataclass(frozen=True)
+class StepContext:
+    """
+    Everything an agent step needs from the database, loaded in at most two round-trips.
+
+    thread/task/plan/subtask are the live ORM rows (the routers still update their status);
+    the history fields are already shaped the way they are sent to the model.
+    """
+    thread: Thread
+    task: ThreadTask
+    plan: Optional[ThreadTaskPlan] = None
+    subtask: Optional[PlanSubtask] = None
+    previous_subtasks: Tuple[dict, ...] = ()
+    action_history: Tuple[dict, ...] = ()
+    memory_items: Tuple[dict, ...] = ()
+    previous_tasks: Tuple[dict, ...] = ()
+
+
+def _user_tasks_query(user_id: str, *columns):
+    return select(*columns).select_from(ThreadTask).join(Thread, Thread.id == ThreadTask.thread_id).where(and_(
+        Thread.user_id == user_id,
+        Thread.status != ThreadStatus.DELETED,
+    ))
+
+
+def _history_row(kind: str, position, text, status_col=None):
+    return select(
+        literal_column(f"'{kind}'", String).label('kind'),
+        cast(position, Integer).label('position'),
+        text.label('text'),
+        (status_col if status_col is not None else cast(null(), String)).label('status'),
+    )
+
+
+def _previous_tasks_branch(user_id: str, limit: int, only_finished: bool):
+    query = _user_tasks_query(user_id, ThreadTask.task_text, ThreadTask.status, ThreadTask.created_at)
+    if only_finished:
+        query = query.where(ThreadTask.status != ThreadTaskStatus.WORKING)
+    recent = query.order_by(ThreadTask.created_at.desc()).limit(limit).subquery()
+    return _history_row(
+        'task', func.row_number().over(order_by=recent.c.created_at.desc()), recent.c.task_text, recent.c.status,
+    )
+
+
+async def load_previous_tasks(db: AsyncSession, user_id: str, limit: int = 10,
+                              only_finished: bool = False) -> Tuple[dict, ...]:
+    rows = (await db.exec(_previous_tasks_branch(user_id, limit, only_finished))).all()
+    return tuple({'task': row.text, 'status': row.status} for row in sorted(rows, key=lambda r: r.position))
+
+
+async def load_step_context(db: AsyncSession, tid: str, user_id: str,
+                            action_chat_type: Optional[str] = None,
+                            include_previous_subtasks: bool = False,
+                            include_memory: bool = False,
+                            previous_tasks_limit: int = 0,
+                            only_finished_previous_tasks: bool = False) -> StepContext:
+    """
+    Resolve the working thread, its running task, the active plan and the current subtask with a
+    single joined query, then fetch every requested history list with one UNION ALL query.
+    """
+    state_query = (
+        select(Thread, ThreadTask, ThreadTaskPlan, PlanSubtask)
+        .outerjoin(ThreadTask, and_(
+            ThreadTask.thread_id == Thread.id,
+            ThreadTask.status == ThreadTaskStatus.WORKING,
+        ))
+        .outerjoin(ThreadTaskPlan, and_(
+            ThreadTaskPlan.thread_task_id == ThreadTask.id,
+            ThreadTaskPlan.status == ThreadTaskPlanStatus.ACTIVE,
+        ))
+        .outerjoin(PlanSubtask, and_(
+            PlanSubtask.thread_task_plan_id == ThreadTaskPlan.id,
+            PlanSubtask.status == SubtaskStatus.ACTIVE,
+        ))
+        .where(and_(
+            Thread.id == tid,
+            Thread.user_id == user_id,
+            Thread.status == ThreadStatus.WORKING,
+        ))
+        .order_by(PlanSubtask.ordering.asc())
+        .limit(1)
+    )
+    row = (await db.exec(state_query)).first()
+
+    if not row:
+        raise CustomError(status.HTTP_404_NOT_FOUND, 'Thread not found')
+
+    instance, task, plan, subtask = row
+    if not task:
+        raise CustomError(status.HTTP_404_NOT_FOUND, 'Thread has no running task')
+
+    branches = []
+
+    if include_previous_subtasks:
+        branches.append(
+            _history_row(
+                'subtask', func.row_number().over(order_by=PlanSubtask.ordering.asc()),
+                PlanSubtask.subtask_text, PlanSubtask.status,
+            )
+            .select_from(PlanSubtask)
+            .join(ThreadTaskPlan, ThreadTaskPlan.id == PlanSubtask.thread_task_plan_id)
+            .where(and_(
+                PlanSubtask.status != SubtaskStatus.ACTIVE,
+                ThreadTaskPlan.thread_task_id == task.id,
+            ))
+        )
+
+    if action_chat_type:
+        recent_messages = (
+            select(ThreadMessage.text, ThreadMessage.created_at)
+            .where(and_(
+                ThreadMessage.thread_task_id == task.id,
+                ThreadMessage.thread_chat_type == action_chat_type,
+            ))
+            .order_by(ThreadMessage.created_at.desc())
+            .limit(ACTION_HISTORY_LIMIT)
+            .subquery()
+        )
+        branches.append(_history_row(
+            'action', func.row_number().over(order_by=recent_messages.c.created_at.desc()), recent_messages.c.text,
+        ))
+
+    if include_memory:
+        if task.needs_memory_from_previous_tasks is True:
+            memory_task_ids = (
+                _user_tasks_query(user_id, ThreadTask.id)
+                .order_by(ThreadTask.created_at.desc())
+                .limit(MEMORY_TASKS_LIMIT)
+            )
+            memory_filter = ThreadTaskMemoryEntry.thread_task_id.in_(memory_task_ids)
+        else:
+            memory_filter = ThreadTaskMemoryEntry.thread_task_id == task.id
+        branches.append(
+            _history_row(
+                'memory', func.row_number().over(order_by=ThreadTaskMemoryEntry.id.asc()), ThreadTaskMemoryEntry.text,
+            )
+            .select_from(ThreadTaskMemoryEntry)
+            .where(memory_filter)
+        )
+
+    if previous_tasks_limit > 0:
+        branches.append(_previous_tasks_branch(user_id, previous_tasks_limit, only_finished_previous_tasks))
+
+    grouped = {'subtask': [], 'action': [], 'memory': [], 'task': []}
+    if branches:
+        history_query = union_all(*branches) if len(branches) > 1 else branches[0]
+        for history_row in (await db.exec(history_query)).all():
+            grouped[history_row.kind].append(history_row)
+        for rows in grouped.values():
+            rows.sort(key=lambda r: r.position)
+
+    return StepContext(
+        thread=instance,
+        task=task,
+        plan=plan,
+        subtask=subtask,
+        previous_subtasks=tuple({'subtask_text': r.text, 'status': r.status} for r in grouped['subtask']),
+        action_history=tuple(json.loads(r.text) for r in grouped['action']),
+        memory_items=tuple({'memory_item_text': r.text} for r in grouped['memory']),
+        previous_tasks=tuple({'task': r.text, 'status': r.status} for r in grouped['task']),
+    )
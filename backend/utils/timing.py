@@ -0,0 +1,36 @@
+import time
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """
+    Collects per-stage durations of a request and renders them as a Server-Timing header,
+    so the client (and browser dev tools) can see where the time went.
+    """
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = time.perf_counter() - started
+
+    async def run(self, name: str, awaitable):
+        with self.stage(name):
+            return await awaitable
+
+    def total(self) -> float:
+        return time.perf_counter() - self._started
+
+    def as_dict(self) -> dict:
+        timings = {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+        timings['total'] = round(self.total() * 1000, 1)
+        return timings
+
+    def server_timing(self) -> str:
+        return ', '.join(f'{name};dur={ms}' for name, ms in self.as_dict().items())
@@ -4,12 +4,16 @@ import requests
 import os
 import subprocess
 from io import BytesIO
-from PIL import Image
+from PIL import Image, ImageChops
+import secrets
 import sys
 import io
 import asyncio
 import logging
 import urllib
+import gzip
+import json
+from urllib3 import encode_multipart_formdata
 
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
@@ -28,14 +32,139 @@ logging.basicConfig(
 
 screenshot_requested = False
 
-def take_screenshot_b64():
-    """Capture, resize, and return screenshot as base64 string without saving to disk."""
-    proc = subprocess.Popen(["scrot", "-q", "60", "-"], stdout=subprocess.PIPE)
-    image = Image.open(proc.stdout).convert("RGB")
-    # image = image.resize((800, 500))
+# jpeg | webp | png
+SCREENSHOT_FORMAT = os.getenv('NEURALAGENT_SCREENSHOT_FORMAT', 'jpeg').lower()
+SCREENSHOT_QUALITY = int(os.getenv('NEURALAGENT_SCREENSHOT_QUALITY', '60'))
+MEDIA_TYPES = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'png': 'image/png',
+}
+# Skip uploading frames that look the same as the last one sent; the backend reuses its copy
+SCREENSHOT_DEDUPE = os.getenv('NEURALAGENT_SCREENSHOT_DEDUPE', 'true').lower() == 'true'
+SCREENSHOT_DEDUPE_THRESHOLD = int(os.getenv('NEURALAGENT_SCREENSHOT_DEDUPE_THRESHOLD', '32'))
+# full: every changed frame is uploaded whole; tiles: only the changed tiles plus a thumbnail
+SCREENSHOT_MODE = os.getenv('NEURALAGENT_SCREENSHOT_MODE', 'full').lower()
+SCREENSHOT_TILE_SIZE = (160, 80)
+SCREENSHOT_TILE_MAX_FRACTION = float(os.getenv('NEURALAGENT_SCREENSHOT_TILE_MAX_FRACTION', '0.5'))
+SCREENSHOT_KEYFRAME_INTERVAL = int(os.getenv('NEURALAGENT_SCREENSHOT_KEYFRAME_INTERVAL', '10'))
+# Content-Encoding of request bodies: gzip | none
+REQUEST_ENCODING = os.getenv('NEURALAGENT_REQUEST_ENCODING', 'gzip').lower()
+# Send the screenshot as a binary multipart part instead of base64 inside the JSON
+MULTIPART_SCREENSHOTS = os.getenv('NEURALAGENT_MULTIPART_SCREENSHOTS', 'true').lower() == 'true'
+last_sent_screenshot = {'screenshot_id': None, 'signature': None, 'tiled_frames': 0}
+
+def frame_signature(image):
+    """Greyscale thumbnail, one pixel per 8x8 block, compared between frames instead of the full image."""
+    return image.convert("L").resize((max(1, image.width // 8), max(1, image.height // 8)), Image.BOX)
+
+def changed_mask(signature, other):
+    """White where the signatures differ by more than the threshold, None if they are not comparable."""
+    if signature.size != other.size:
+        return None
+    return ImageChops.difference(signature, other).point(lambda p: 255 if p > SCREENSHOT_DEDUPE_THRESHOLD else 0)
+
+def encode_image(image, image_format, quality):
     buffer = BytesIO()
-    image.save(buffer, format="JPEG", quality=60)
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    if image_format == 'jpeg':
+        image.save(buffer, format="JPEG", quality=quality)
+    elif image_format == 'webp':
+        image.save(buffer, format="WEBP", quality=quality, method=2)
+    else:
+        image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+def encode_tiles(image, mask, image_format):
+    """
+    The screenshot_tiles request field for the changed tiles of image (edge tiles may be partial),
+    or None when so much changed that a full frame is cheaper. Also returns the boxes sent.
+    """
+    tile_w, tile_h = SCREENSHOT_TILE_SIZE
+    boxes = []
+    total = 0
+    for row in range(-(-image.height // tile_h)):
+        for col in range(-(-image.width // tile_w)):
+            total += 1
+            box = (col * tile_w, row * tile_h, min(image.width, (col + 1) * tile_w), min(image.height, (row + 1) * tile_h))
+            if mask.crop(tuple(edge // 8 for edge in box)).getbbox():
+                boxes.append((col, row, box))
+    if len(boxes) > SCREENSHOT_TILE_MAX_FRACTION * total:
+        return None, []
+
+    tiles = [[col, row, base64.b64encode(encode_image(image.crop(box), image_format, SCREENSHOT_QUALITY)).decode("utf-8")]
+             for col, row, box in boxes]
+    thumbnail = encode_image(image.resize((320, max(1, 320 * image.height // image.width)), Image.BOX), 'jpeg', 50)
+    return {
+        'base': last_sent_screenshot['screenshot_id'],
+        'width': image.width,
+        'height': image.height,
+        'tile_width': tile_w,
+        'tile_height': tile_h,
+        'tiles': tiles,
+        'media_type': MEDIA_TYPES[image_format],
+        'thumbnail_b64': base64.b64encode(thumbnail).decode("utf-8"),
+        'thumbnail_media_type': 'image/jpeg',
+    }, [box for _, _, box in boxes]
+
+def take_screenshot():
+    """
+    Capture and encode the screen without saving to disk. Returns the request fields
+    {"screenshot_b64", "screenshot_media_type", "screenshot_id"} (or only {"screenshot_ref"} when
+    the screen is unchanged since the last frame sent, or {"screenshot_tiles", "screenshot_id"} in
+    tiles mode when only part of it changed) and the stage timings in milliseconds.
+    """
+    image_format = SCREENSHOT_FORMAT if SCREENSHOT_FORMAT in MEDIA_TYPES else 'jpeg'
+    timings = {}
+
+    started = time.perf_counter()
+    proc = subprocess.Popen(["scrot", "-q", str(SCREENSHOT_QUALITY), "-"], stdout=subprocess.PIPE)
+    image = Image.open(proc.stdout).convert("RGB")
+    timings['grab_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    signature = None
+    mask = None
+    if SCREENSHOT_DEDUPE:
+        signature = frame_signature(image)
+        if last_sent_screenshot['signature'] is not None:
+            mask = changed_mask(signature, last_sent_screenshot['signature'])
+        if mask is not None and mask.getbbox() is None:
+            timings['unchanged'] = True
+            print(f"📸 Screen unchanged, reusing screenshot {last_sent_screenshot['screenshot_id']}")
+            return {'screenshot_ref': last_sent_screenshot['screenshot_id']}, timings
+
+    if mask is not None and SCREENSHOT_MODE == 'tiles' and last_sent_screenshot['tiled_frames'] < SCREENSHOT_KEYFRAME_INTERVAL:
+        started = time.perf_counter()
+        screenshot_tiles, boxes = encode_tiles(image, mask, image_format)
+        if screenshot_tiles is not None:
+            timings['encode_ms'] = round((time.perf_counter() - started) * 1000, 1)
+            timings['tiles'] = len(boxes)
+            print(f"📸 Screenshot {len(boxes)} tiles: grab {timings['grab_ms']}ms, encode {timings['encode_ms']}ms")
+            # Track what the backend's frame now looks like: the old one with the sent tiles replaced
+            for box in boxes:
+                signature_box = tuple(edge // 8 for edge in box)
+                last_sent_screenshot['signature'].paste(signature.crop(signature_box), signature_box[:2])
+            screenshot_id = secrets.token_hex(8)
+            last_sent_screenshot['screenshot_id'] = screenshot_id
+            last_sent_screenshot['tiled_frames'] += 1
+            return {'screenshot_tiles': screenshot_tiles, 'screenshot_id': screenshot_id}, timings
+
+    started = time.perf_counter()
+    data = encode_image(image, image_format, SCREENSHOT_QUALITY)
+    timings['encode_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    timings['bytes'] = len(data)
+    print(f"📸 Screenshot {MEDIA_TYPES[image_format]} {timings['bytes'] // 1024}KB: "
+          f"grab {timings['grab_ms']}ms, encode {timings['encode_ms']}ms")
+
+    screenshot_id = secrets.token_hex(8)
+    if SCREENSHOT_DEDUPE:
+        last_sent_screenshot['screenshot_id'] = screenshot_id
+        last_sent_screenshot['signature'] = signature
+        last_sent_screenshot['tiled_frames'] = 0
+    return {
+        'screenshot_b64': base64.b64encode(data).decode("utf-8"),
+        'screenshot_media_type': MEDIA_TYPES[image_format],
+        'screenshot_id': screenshot_id,
+    }, timings
 
 def safe_coords(x, y, screen_width, screen_height):
     return max(1, min(screen_width - 1, x)), max(1, min(screen_height - 1, y))
@@ -184,13 +313,28 @@ def get_chrome_tabs():
         return []
 
 
+def encode_request_body(payload):
+    """Same wire format as the desktop agent's request_encoding module. Returns (body bytes, headers)."""
+    if MULTIPART_SCREENSHOTS and payload.get('screenshot_b64'):
+        fields = {key: value for key, value in payload.items() if key != 'screenshot_b64'}
+        body, content_type = encode_multipart_formdata({
+            'payload': json.dumps(fields, separators=(',', ':')),
+            'screenshot': ('screenshot', base64.b64decode(payload['screenshot_b64']), payload['screenshot_media_type']),
+        })
+    else:
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        content_type = 'application/json'
+
+    headers = {'Content-Type': content_type}
+    if REQUEST_ENCODING == 'gzip':
+        body = gzip.compress(body, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    return body, headers
+
+
 def get_next_step():
     global screenshot_requested
     url = os.getenv('NEURALAGENT_API_URL') + '/aiagent/background/' + os.getenv('NEURALAGENT_THREAD_ID') + '/next_step'
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer ' + os.getenv('NEURALAGENT_USER_ACCESS_TOKEN'),
-    }
 
     tabs = get_chrome_tabs()
     if tabs:
@@ -203,18 +347,26 @@ def get_next_step():
     else:
         print("No tabs found or Chrome not running.")
 
+    screenshot, _ = take_screenshot()
     payload = {
         'current_open_tabs': tabs,
         'current_url': current_url,
-        'screenshot_b64': take_screenshot_b64(),
+        **screenshot,
     }
 
     screenshot_requested = False
 
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        body, headers = encode_request_body(payload)
+        headers['Authorization'] = 'Bearer ' + os.getenv('NEURALAGENT_USER_ACCESS_TOKEN')
+        response = requests.post(url, data=body, headers=headers)
         if response.status_code in (200, 201, 202):
             return response.json()
+        if response.status_code == 409:
+            # The backend no longer has the last frame (restart, another worker): upload the next one in full
+            last_sent_screenshot['screenshot_id'] = None
+            last_sent_screenshot['signature'] = None
+            last_sent_screenshot['tiled_frames'] = 0
     except Exception as e:
         print(f"[❌] Error sending next step request: {e}")
     
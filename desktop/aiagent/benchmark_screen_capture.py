@@ -0,0 +1,135 @@
+"""
+Compares full-frame and tile screenshot modes of screen_capture on generated frame sequences, so it
+runs without a display. Each scenario draws a synthetic desktop and changes it frame by frame the
+way a step of the agent would (typing into a field, opening a menu, scrolling, switching pages);
+every frame then goes through take_screenshot with dedupe on, once per mode.
+
+Reported per mode: the image bytes sent (tiles include their thumbnail, reused frames count as 0),
+the total encode_ms and how many frames went out as a full frame, as tiles or as a reference.
+
+    python benchmark_screen_capture.py --frames 12 --format jpeg
+"""
+import argparse
+import contextlib
+import io
+import random
+from PIL import Image, ImageDraw
+import screen_capture
+
+WIDTH, HEIGHT = screen_capture.SCREENSHOT_SIZE
+
+
+def draw_desktop(rng, lines, highlight=None, menu=None):
+    img = Image.new('RGB', (WIDTH, HEIGHT), (32, 64, 112))
+    draw = ImageDraw.Draw(img)
+    # Taskbar, window frame, title bar and sidebar
+    draw.rectangle((0, HEIGHT - 40, WIDTH, HEIGHT), fill=(24, 24, 24))
+    for i in range(8):
+        draw.rectangle((12 + i * 48, HEIGHT - 34, 44 + i * 48, HEIGHT - 6), fill=(70 + i * 15, 90, 140))
+    draw.rectangle((80, 40, WIDTH - 80, HEIGHT - 80), fill=(250, 250, 250), outline=(160, 160, 160))
+    draw.rectangle((80, 40, WIDTH - 80, 72), fill=(225, 230, 240))
+    draw.text((92, 50), 'Synthetic window - Notes', fill=(20, 20, 20))
+    draw.rectangle((80, 72, 300, HEIGHT - 80), fill=(240, 242, 246))
+    for i in range(14):
+        draw.text((96, 90 + i * 28), f'Folder {i}', fill=(40, 40, 40))
+    if highlight is not None:
+        draw.rectangle((84, 84 + highlight * 28, 296, 108 + highlight * 28), outline=(0, 120, 215), width=2)
+
+    # Document body: one text line per entry, with a little colour noise for realism
+    for i, line in enumerate(lines):
+        y = 90 + i * 22
+        if y > HEIGHT - 110:
+            break
+        draw.text((320, y), line, fill=(30, 30, 30))
+    for _ in range(60):
+        x, y = rng.randrange(320, WIDTH - 100), rng.randrange(90, HEIGHT - 110)
+        draw.point((x, y), fill=(rng.randrange(200, 256),) * 3)
+
+    if menu is not None:
+        draw.rectangle((menu, 72, menu + 220, 72 + 10 * 26), fill=(255, 255, 255), outline=(120, 120, 120))
+        for i in range(10):
+            draw.text((menu + 12, 80 + i * 26), f'Menu item {i}', fill=(20, 20, 20))
+    return img
+
+
+def document(rng, count, offset=0):
+    words = ['agent', 'window', 'report', 'click', 'screen', 'budget', 'invoice', 'meeting', 'draft', 'review']
+    return [f'{offset + i:03d} ' + ' '.join(rng.choice(words) for _ in range(rng.randrange(4, 12)))
+            for i in range(count)]
+
+
+def typing(frames, seed):
+    """One word typed per step into the last line of the document."""
+    lines = document(random.Random(seed), 25)
+    for i in range(frames):
+        lines[10] = 'Typed: ' + ' '.join(f'word{j}' for j in range(i + 1))
+        yield draw_desktop(random.Random(seed), lines)
+
+
+def menu(frames, seed):
+    """A menu opens, then the selection moves down the sidebar."""
+    lines = document(random.Random(seed), 25)
+    for i in range(frames):
+        yield draw_desktop(random.Random(seed), lines, highlight=i % 14, menu=400 if i % 4 else None)
+
+
+def scrolling(frames, seed):
+    """The document scrolls by three lines per step, which changes most of the window."""
+    rng = random.Random(seed)
+    lines = document(rng, 25 + 3 * frames)
+    for i in range(frames):
+        yield draw_desktop(random.Random(seed), lines[i * 3:])
+
+
+def pages(frames, seed):
+    """A different document per step, as when switching between apps or web pages."""
+    for i in range(frames):
+        yield draw_desktop(random.Random(seed + i), document(random.Random(seed + i), 25, offset=i * 100))
+
+
+SCENARIOS = {'typing': typing, 'menu': menu, 'scrolling': scrolling, 'pages': pages}
+
+
+def run(frames, mode):
+    screen_capture.SCREENSHOT_MODE = mode
+    screen_capture.reset_reference()
+    sent_bytes = 0
+    encode_ms = 0.0
+    kinds = {'full': 0, 'tiles': 0, 'ref': 0}
+    for img in frames:
+        timings = {'grab_ms': 0.0, 'resize_ms': 0.0}
+        # take_screenshot prints a line per frame
+        with contextlib.redirect_stdout(io.StringIO()):
+            fields, timings = screen_capture.take_screenshot(dedupe=True, frame=img, timings=timings)
+        if 'screenshot_ref' in fields:
+            kinds['ref'] += 1
+            continue
+        kinds['tiles' if 'screenshot_tiles' in fields else 'full'] += 1
+        sent_bytes += timings['bytes']
+        encode_ms += timings['encode_ms']
+    return sent_bytes, encode_ms, kinds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=12)
+    parser.add_argument('--format', default=screen_capture.SCREENSHOT_FORMAT, choices=sorted(screen_capture.MEDIA_TYPES))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    screen_capture.SCREENSHOT_FORMAT = args.format
+
+    print(f'{args.frames} frames per scenario, {args.format}, {WIDTH}x{HEIGHT}, '
+          f'tiles {screen_capture.SCREENSHOT_TILE_SIZE[0]}x{screen_capture.SCREENSHOT_TILE_SIZE[1]}')
+    for name, scenario in SCENARIOS.items():
+        frames = list(scenario(args.frames, args.seed))
+        results = {mode: run(frames, mode) for mode in ('full', 'tiles')}
+        for mode, (sent_bytes, encode_ms, kinds) in results.items():
+            print(f'{name:>10} {mode:>5}: {sent_bytes / 1024:8.1f}KB  encode {encode_ms:7.1f}ms  '
+                  f'{kinds["full"]} full, {kinds["tiles"]} tiles, {kinds["ref"]} reused')
+        full_bytes, tile_bytes = results['full'][0], results['tiles'][0]
+        if full_bytes:
+            print(f'{"":>10}        tiles send {tile_bytes / full_bytes:.0%} of the full-frame bytes')
+
+
+if __name__ == '__main__':
+    main()
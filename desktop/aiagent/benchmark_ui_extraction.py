@@ -0,0 +1,174 @@
+"""
+Compares the two Windows UI Automation walks in ui_extraction on a synthetic tree, so it runs
+without a live UIA provider (on any OS where the desktop requirements are installed).
+
+Every fake cross-process call (a property read or child fetch on a live element, a
+BuildUpdatedCache) is counted and sleeps for --latency-ms, which stands in for the COM round-trip
+to the target application. The per-property walk makes four such calls per node, the cached walk one.
+
+    python benchmark_ui_extraction.py --nodes 2000 --latency-ms 0.3
+"""
+import argparse
+import random
+import time
+from types import SimpleNamespace
+import ui_extraction
+
+CONTROL_TYPES = {
+    50000: 'ButtonControl',
+    50004: 'EditControl',
+    50005: 'HyperlinkControl',
+    50020: 'TextControl',
+    50025: 'CustomControl',
+    50026: 'GroupControl',
+    50033: 'PaneControl',
+}
+CONTAINER_TYPES = [50026, 50033, 50025]
+LEAF_TYPES = [50000, 50004, 50005, 50020]
+
+
+class RemoteCalls:
+    def __init__(self, latency_seconds):
+        self.latency_seconds = latency_seconds
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+
+class Node:
+    def __init__(self, control_type, name, rect):
+        self.control_type = control_type
+        self.name = name
+        self.rect = rect
+        self.children = []
+
+
+def build_tree(total_nodes, branching, screen_w, screen_h, seed):
+    """Breadth-first tree of containers with leaf controls, all inside a screen-sized window."""
+    rng = random.Random(seed)
+    root = Node(50033, 'Synthetic window', SimpleNamespace(left=0, top=0, right=screen_w, bottom=screen_h))
+    frontier = [root]
+    created = 1
+    while frontier and created < total_nodes:
+        parent = frontier.pop(0)
+        for _ in range(min(branching, total_nodes - created)):
+            left = rng.randrange(0, screen_w - 100)
+            top = rng.randrange(0, screen_h - 30)
+            rect = SimpleNamespace(left=left, top=top, right=left + rng.randrange(20, 100),
+                                   bottom=top + rng.randrange(10, 30))
+            container = rng.random() < 0.3
+            control_type = rng.choice(CONTAINER_TYPES if container else LEAF_TYPES)
+            child = Node(control_type, f'Element {created}', rect)
+            parent.children.append(child)
+            created += 1
+            if container:
+                frontier.append(child)
+    return root
+
+
+class FakeControl:
+    """uiautomation Control: every property read is a cross-process call."""
+
+    def __init__(self, node, remote):
+        self._node = node
+        self._remote = remote
+
+    @property
+    def ControlTypeName(self):
+        self._remote()
+        return CONTROL_TYPES[self._node.control_type]
+
+    @property
+    def Name(self):
+        self._remote()
+        return self._node.name
+
+    @property
+    def BoundingRectangle(self):
+        self._remote()
+        return self._node.rect
+
+    def GetChildren(self):
+        self._remote()
+        return [FakeControl(child, self._remote) for child in self._node.children]
+
+    @property
+    def Element(self):
+        return FakeElement(self._node, self._remote)
+
+
+class FakeElementArray:
+    def __init__(self, elements):
+        self._elements = elements
+        self.Length = len(elements)
+
+    def GetElement(self, index):
+        return self._elements[index]
+
+
+class FakeElement:
+    """IUIAutomationElement: Cached* reads are local, BuildUpdatedCache is one cross-process call."""
+
+    def __init__(self, node, remote):
+        self._node = node
+        self._remote = remote
+        self.CachedControlType = node.control_type
+        self.CachedName = node.name
+        self.CachedBoundingRectangle = node.rect
+
+    def BuildUpdatedCache(self, request):
+        self._remote()
+        return FakeCachedSubtree(self._node, self._remote)
+
+
+class FakeCachedSubtree(FakeElement):
+    def GetCachedChildren(self):
+        return FakeElementArray([FakeElement(child, self._remote) for child in self._node.children])
+
+
+def run(walk, root, remote, screen_w, screen_h, repeat):
+    remote.count = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        elements, truncated = walk(FakeControl(root, remote), screen_w, screen_h)
+    elapsed_ms = (time.perf_counter() - started) * 1000 / repeat
+    return elapsed_ms, remote.count // repeat, len(elements), truncated
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--nodes', type=int, default=2000)
+    parser.add_argument('--branching', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=0.3, help='simulated cost of one cross-process call')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--budget', action='store_true',
+                        help='keep the NEURALAGENT_UI_* node/depth/deadline budget instead of walking the whole tree')
+    args = parser.parse_args()
+
+    screen_w, screen_h = 1920, 1080
+    root = build_tree(args.nodes, args.branching, screen_w, screen_h, args.seed)
+    remote = RemoteCalls(args.latency_ms / 1000)
+
+    ui_extraction.auto = SimpleNamespace(ControlTypeNames=CONTROL_TYPES)
+    ui_extraction._uia_cache_request = object()
+    # Same for both walks, and keeps pyautogui's screen query out of the measurement
+    ui_extraction.get_bounding_rect = lambda x, y, width, height: {'x': x, 'y': y, 'width': width, 'height': height}
+    if not args.budget:
+        ui_extraction.UI_MAX_NODES = args.nodes + 1
+        ui_extraction.UI_MAX_DEPTH = args.nodes
+        ui_extraction.UI_DEADLINE_SECONDS = float('inf')
+
+    print(f'{args.nodes} nodes, {args.latency_ms}ms per cross-process call')
+    for label, walk in (('per-property', ui_extraction._extract_ui_elements_windows_uncached),
+                        ('cached', ui_extraction._extract_ui_elements_windows_cached)):
+        elapsed_ms, calls, elements, truncated = run(walk, root, remote, screen_w, screen_h, args.repeat)
+        print(f'{label:>12}: {elapsed_ms:8.1f}ms  {calls:6d} calls ({calls / args.nodes:.2f}/node)  '
+              f'{elements} elements{"  truncated" if truncated else ""}')
+
+
+if __name__ == '__main__':
+    main()
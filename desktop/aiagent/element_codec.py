@@ -0,0 +1,84 @@
+import os
+import secrets
+from difflib import SequenceMatcher
+
+# verbose: the original list of dicts; compact: columnar rows; delta: only the rows that changed since
+# the previous observation of this run, which the backend keeps as the base
+ELEMENTS_FORMAT = os.getenv('NEURALAGENT_ELEMENTS_FORMAT', 'delta').lower()
+
+_previous = {'observation_id': None, 'keys': None}
+
+
+def _row_key(element):
+    bounding_box = element.get("bounding_box") or {}
+    return (
+        element.get("type"), element.get("label") or "",
+        bounding_box.get("x"), bounding_box.get("y"), bounding_box.get("width"), bounding_box.get("height"),
+    )
+
+
+def reset_base():
+    """Forget the previous observation, e.g. after the backend answered 409 Stale_Element_Base."""
+    _previous['observation_id'] = None
+    _previous['keys'] = None
+
+
+def encode_elements(elements, allow_delta=True):
+    """
+    Columnar payload for the backend's interactive_elements field. Rows are
+    [type index, label, x, y, width, height]; ids that differ from the 1-based position go in ids.
+    With allow_delta, rows already sent in the previous observation are referenced by ops instead:
+    a positive int keeps that many base rows, a negative int drops that many and a list inserts rows.
+    """
+    types = []
+    type_indexes = {}
+    keys = []
+    rows = []
+    ids = {}
+    for position, element in enumerate(elements, start=1):
+        key = _row_key(element)
+        element_type = key[0]
+        if element_type not in type_indexes:
+            type_indexes[element_type] = len(types)
+            types.append(element_type)
+        keys.append(key)
+        rows.append([type_indexes[element_type], *key[1:]])
+        if element.get("id") != position:
+            ids[position] = element.get("id")
+
+    payload = {'observation_id': secrets.token_hex(8), 'types': types, 'ids': ids}
+
+    base_keys = _previous['keys'] if allow_delta and ELEMENTS_FORMAT == 'delta' else None
+    ops = []
+    kept = 0
+    if base_keys:
+        matcher = SequenceMatcher(None, base_keys, keys, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                ops.append(i2 - i1)
+                kept += i2 - i1
+                continue
+            if i2 > i1:
+                ops.append(i1 - i2)
+            if j2 > j1:
+                ops.append(rows[j1:j2])
+
+    if kept:
+        payload['base'] = _previous['observation_id']
+        payload['ops'] = ops
+    else:
+        payload['rows'] = rows
+
+    if allow_delta:
+        _previous['observation_id'] = payload['observation_id']
+        _previous['keys'] = keys
+    return payload
+
+
+def add_elements(payload, elements, allow_delta=True):
+    """Put the elements into a request payload in the configured format."""
+    if ELEMENTS_FORMAT == 'verbose':
+        payload['current_interactive_elements'] = elements
+    else:
+        payload['interactive_elements'] = encode_elements(elements, allow_delta=allow_delta)
+    return payload
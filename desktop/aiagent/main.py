@@ -1,22 +1,27 @@
-import base64
 import time
 import requests
 import pyautogui
-import mss
 import os
 import subprocess
 import platform
-from io import BytesIO
-from PIL import Image
 import webbrowser
 import sys
 import io
 import pyperclip
 import unicodedata
 import json
+import random
 import asyncio
 import logging
 import ui_extraction
+import element_codec
+import screen_capture
+import request_encoding
+import websockets
+from urllib.parse import urlencode
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 
 
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
@@ -35,6 +40,101 @@ logging.basicConfig(
 )
 
 screenshot_requested = False
+# Execute actions as soon as the backend streams them instead of waiting for the full step
+STREAM_NEXT_STEP = os.getenv('NEURALAGENT_STREAM_NEXT_STEP', 'true').lower() == 'true'
+# Talk to the backend over one persistent WebSocket session instead of per-step HTTP requests
+USE_AGENT_SESSION = os.getenv('NEURALAGENT_USE_AGENT_SESSION', 'true').lower() == 'true'
+AGENT_SESSION_RETRIES = int(os.getenv('NEURALAGENT_AGENT_SESSION_RETRIES', '5'))
+# Session close codes for an invalid token or thread, where reconnecting would not help
+AGENT_SESSION_FATAL_CLOSE_CODES = (4401, 4404)
+# Actions that do not touch the UI and therefore keep the cached observation valid
+NON_UI_ACTIONS = {"wait", "tool_use", "request_screenshot", "subtask_completed", "subtask_failed", "task_completed"}
+# Jittered exponential backoff between failed requests, in seconds
+RETRY_BASE_SECONDS = float(os.getenv('NEURALAGENT_RETRY_BASE_SECONDS', '0.5'))
+RETRY_MAX_SECONDS = float(os.getenv('NEURALAGENT_RETRY_MAX_SECONDS', '30'))
+# Connect / read timeouts; the read timeout covers a full model call
+HTTP_TIMEOUT = (10, float(os.getenv('NEURALAGENT_HTTP_READ_TIMEOUT', '300')))
+
+_http_session = None
+
+def get_http_session():
+    """
+    One pooled keep-alive session for every backend call, so steps reuse the TCP+TLS connection
+    instead of opening a new one per request.
+    """
+    global _http_session
+    if _http_session is None:
+        _http_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=4)
+        _http_session.mount('https://', adapter)
+        _http_session.mount('http://', adapter)
+        _http_session.headers['Authorization'] = 'Bearer ' + os.getenv('NEURALAGENT_USER_ACCESS_TOKEN')
+    return _http_session
+
+def post_agent_request(path, payload, stream=False, headers=None):
+    """POST a payload to /aiagent/<thread id><path> through the shared session, compressed and with
+    the screenshot as a binary part as configured in request_encoding."""
+    url = os.getenv('NEURALAGENT_API_URL') + '/aiagent/' + os.getenv('NEURALAGENT_THREAD_ID') + path
+    body, request_headers = request_encoding.encode_request_body(payload)
+    request_headers.update(headers or {})
+    return get_http_session().post(url, data=body, headers=request_headers, stream=stream, timeout=HTTP_TIMEOUT)
+
+class Backoff:
+    """Full-jitter exponential backoff: a random delay up to base * 2^failures, capped."""
+
+    def __init__(self, base=None, cap=None):
+        self.base = RETRY_BASE_SECONDS if base is None else base
+        self.cap = RETRY_MAX_SECONDS if cap is None else cap
+        self.failures = 0
+
+    def reset(self):
+        self.failures = 0
+
+    def next_delay(self):
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** self.failures))
+        self.failures += 1
+        return delay
+
+    def sleep(self):
+        delay = self.next_delay()
+        print(f"⏳ Retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+    async def async_sleep(self):
+        delay = self.next_delay()
+        print(f"⏳ Retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+
+# observe: wall time until the request payload was ready. extract, capture and encode are the
+# worker-thread times of its parts; extract and capture run concurrently, so together they can
+# exceed observe. network: from sending the request to the step's final reply, model time
+# included; the step's actions already execute during it.
+STEP_STAGES = ('observe', 'extract', 'capture', 'encode', 'network', 'execute')
+
+# The accessibility walk always runs on the same thread, since UI Automation's COM state is
+# per thread; the frame grab and encode get their own so both proceed at once
+_ui_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='observe-ui',
+                                  initializer=ui_extraction.init_worker_thread)
+_screen_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='observe-screen')
+# One thread runs the actions in order while the event loop keeps reading the step's replies
+_action_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='act')
+
+def new_step_timings():
+    return {f'{stage}_ms': 0.0 for stage in STEP_STAGES}
+
+@contextmanager
+def timed(timings, stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[f'{stage}_ms'] = timings.get(f'{stage}_ms', 0.0) + (time.perf_counter() - started) * 1000
+
+def report_step_timings(timings, total_ms):
+    timings['total_ms'] = total_ms
+    print("⏱️ Step latency: " + ", ".join(f"{stage} {timings[f'{stage}_ms']:.0f}ms" for stage in STEP_STAGES)
+          + f", total {total_ms:.0f}ms")
 
 def type_unicode_smart(text: str, delay: float = 0.05) -> None:
     try:
@@ -165,22 +265,15 @@ def focus_app(app_name):
 
     return False
 
-def take_screenshot_b64():
-    with mss.mss() as sct:
-        monitor = sct.monitors[0]
-        shot = sct.grab(monitor)
-        img = Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
-        img = img.resize((1280, 720))
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
-
 def safe_coords(x, y, screen_width, screen_height):
     return max(1, min(screen_width - 1, x)), max(1, min(screen_height - 1, y))
 
 def perform_action(response):
+    for action in response.get("actions", []):
+        perform_single_action(action)
+
+def perform_single_action(action):
     global screenshot_requested
-    actions = response.get("actions", [])
     TARGET_W, TARGET_H = 1280, 720
     screen_w, screen_h = pyautogui.size()
     scale_x = screen_w / TARGET_W
@@ -191,184 +284,434 @@ def perform_action(response):
         y = int(coord["y"] * scale_y)
         return safe_coords(x, y, screen_w, screen_h)
 
-    for action in actions:
-        try:
-            act = action["action"]
-            params = action.get("params", {})
-
-            if act in ["left_click", "double_click", "triple_click", "right_click"]:
-                x, y = scale_coords(params)
-                pyautogui.moveTo(x, y)
-
-                click_config = {
-                    "left_click": ("left", 1),
-                    "double_click": ("left", 2),
-                    "triple_click": ("left", 3),
-                    "right_click": ("right", 1),
-                }
-
-                button, clicks = click_config[act]
-                pyautogui.click(button=button, clicks=clicks, interval=0.1)
-            
-            elif act == 'click':
-                # Consider it as left click
-                x, y = scale_coords(params)
-                pyautogui.moveTo(x, y)
-                pyautogui.click(button='left')
-
-            elif act == "mouse_move":
-                x, y = scale_coords(params)
-                pyautogui.moveTo(x, y, duration=0.1)
-
-            elif act == "left_click_drag":
-                x1, y1 = scale_coords(params["from"])
-                x2, y2 = scale_coords(params["to"])
-                pyautogui.moveTo(x1, y1)
-                pyautogui.mouseDown()
-                pyautogui.moveTo(x2, y2, duration=0.3)
-                pyautogui.mouseUp()
-
-            elif act == "left_mouse_down":
-                pyautogui.mouseDown()
-            elif act == "left_mouse_up":
-                pyautogui.mouseUp()
-
-            elif act == "key":
-                pyautogui.press(params["text"])
-            
-            elif act == "key_combo":
-                keys = params.get("keys", [])
-                if keys:
-                    pyautogui.hotkey(*keys)
-
-            elif act == "type":
-                if params.get("replace", False):
-                    pyautogui.hotkey("ctrl", "a" if sys.platform != "darwin" else "command")
-                    pyautogui.press("backspace")
-                
-                type_unicode_smart(params["text"], delay=0.05)
-
-            elif act == "hold_key":
-                pyautogui.keyDown(params["text"])
-                time.sleep(float(params.get("duration", 1.0)))
-                pyautogui.keyUp(params["text"])
-
-            elif act == "scroll":
-                x, y = scale_coords({"x": params["x"], "y": params["y"]})
-                pyautogui.moveTo(x, y, duration=0.1)
-                direction = params.get("scroll_direction", "down")
-                amount = params.get("scroll_amount", 3)
-                if direction == "down":
-                    pyautogui.scroll(-100 * amount)
-                elif direction == "up":
-                    pyautogui.scroll(100 * amount)
-                elif direction == "left":
-                    pyautogui.hscroll(-100 * amount)
-                elif direction == "right":
-                    pyautogui.hscroll(100 * amount)
-
-            elif act == "wait":
-                time.sleep(params.get("duration", 1))
-
-            elif act == "launch_browser":
-                webbrowser.open(params["url"])
-
-            elif act == "launch_app":
-                launch_application(params["app_name"])
-            
-            elif act == "focus_app":
-                focus_app(params["app_name"])
-
-            elif act == "tool_use":
-                print(f"🛠️ Tool requested: {params}")
+    try:
+        act = action["action"]
+        params = action.get("params", {})
+
+        if act in ["left_click", "double_click", "triple_click", "right_click"]:
+            x, y = scale_coords(params)
+            pyautogui.moveTo(x, y)
+
+            click_config = {
+                "left_click": ("left", 1),
+                "double_click": ("left", 2),
+                "triple_click": ("left", 3),
+                "right_click": ("right", 1),
+            }
+
+            button, clicks = click_config[act]
+            pyautogui.click(button=button, clicks=clicks, interval=0.1)
+        
+        elif act == 'click':
+            # Consider it as left click
+            x, y = scale_coords(params)
+            pyautogui.moveTo(x, y)
+            pyautogui.click(button='left')
+
+        elif act == "mouse_move":
+            x, y = scale_coords(params)
+            pyautogui.moveTo(x, y, duration=0.1)
+
+        elif act == "left_click_drag":
+            x1, y1 = scale_coords(params["from"])
+            x2, y2 = scale_coords(params["to"])
+            pyautogui.moveTo(x1, y1)
+            pyautogui.mouseDown()
+            pyautogui.moveTo(x2, y2, duration=0.3)
+            pyautogui.mouseUp()
+
+        elif act == "left_mouse_down":
+            pyautogui.mouseDown()
+        elif act == "left_mouse_up":
+            pyautogui.mouseUp()
+
+        elif act == "key":
+            pyautogui.press(params["text"])
+        
+        elif act == "key_combo":
+            keys = params.get("keys", [])
+            if keys:
+                pyautogui.hotkey(*keys)
+
+        elif act == "type":
+            if params.get("replace", False):
+                pyautogui.hotkey("ctrl", "a" if sys.platform != "darwin" else "command")
+                pyautogui.press("backspace")
             
-            elif act == "request_screenshot":
-                screenshot_requested = True
-
-            elif act == "subtask_completed":
-                print("✅ Subtask completed.")
-
-            elif act == "subtask_failed":
-                print("❌ Subtask failed.")
-
+            type_unicode_smart(params["text"], delay=0.05)
+
+        elif act == "hold_key":
+            pyautogui.keyDown(params["text"])
+            time.sleep(float(params.get("duration", 1.0)))
+            pyautogui.keyUp(params["text"])
+
+        elif act == "scroll":
+            x, y = scale_coords({"x": params["x"], "y": params["y"]})
+            pyautogui.moveTo(x, y, duration=0.1)
+            direction = params.get("scroll_direction", "down")
+            amount = params.get("scroll_amount", 3)
+            if direction == "down":
+                pyautogui.scroll(-100 * amount)
+            elif direction == "up":
+                pyautogui.scroll(100 * amount)
+            elif direction == "left":
+                pyautogui.hscroll(-100 * amount)
+            elif direction == "right":
+                pyautogui.hscroll(100 * amount)
+
+        elif act == "wait":
+            if params.get("until_screen_change"):
+                wait_for_screen_change(float(params.get("duration", 1)))
             else:
-                print(f"⚠️ Unknown action: {act}")
-        except Exception as e:
-            print("❌ Exception in perform_action:", e)
+                time.sleep(float(params.get("duration", 1)))
 
+        elif act == "launch_browser":
+            webbrowser.open(params["url"])
 
-def get_next_step():
-    global screenshot_requested
-    url = os.getenv('NEURALAGENT_API_URL') + '/aiagent/' + os.getenv('NEURALAGENT_THREAD_ID') + '/next_step'
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer ' + os.getenv('NEURALAGENT_USER_ACCESS_TOKEN'),
-    }
-
-    interactive_elements = ui_extraction.extract_interactive_elements()
-    running_apps = ui_extraction.get_running_apps()
+        elif act == "launch_app":
+            launch_application(params["app_name"])
+        
+        elif act == "focus_app":
+            focus_app(params["app_name"])
 
-    # Automatically trigger screenshot if WebView is present
-    has_webview = any(e.get("type") == "PossibleWebView" for e in interactive_elements)
-    should_send_screenshot = screenshot_requested or has_webview
+        elif act == "tool_use":
+            print(f"🛠️ Tool requested: {params}")
+        
+        elif act == "request_screenshot":
+            screenshot_requested = True
 
-    payload = {
-        'current_os': 'MacOS' if platform.system() == 'darwin' else platform.system(),
-        'current_interactive_elements': interactive_elements,
-        'current_running_apps': running_apps,
-    }
+        elif act == "subtask_completed":
+            print("✅ Subtask completed.")
 
-    if should_send_screenshot:
-        payload['screenshot_b64'] = take_screenshot_b64()
-        screenshot_requested = False
+        elif act == "subtask_failed":
+            print("❌ Subtask failed.")
 
+        else:
+            print(f"⚠️ Unknown action: {act}")
+    except Exception as e:
+        print("❌ Exception in perform_action:", e)
+    finally:
+        if action.get("action") not in NON_UI_ACTIONS:
+            ui_extraction.invalidate_observation()
+
+def wait_for_screen_change(duration, poll_interval=0.25, settle=0.5):
+    """
+    Waits up to duration seconds but returns early (after a short settle delay) once the
+    foreground window changes, e.g. when the app being waited for has opened. Only used for a
+    wait with until_screen_change, since a title change does not mean a page finished loading.
+    """
+    deadline = time.monotonic() + duration
+    baseline = ui_extraction.get_foreground_signature()
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        time.sleep(min(poll_interval, remaining))
+        if baseline is not None and ui_extraction.has_screen_changed(baseline):
+            time.sleep(min(settle, max(0, deadline - time.monotonic())))
+            return
+
+
+def read_ui(timings=None):
+    with timed(timings, 'extract'):
+        interactive_elements = ui_extraction.extract_interactive_elements()
+        running_apps = ui_extraction.get_running_apps()
+        payload = element_codec.add_elements({
+            'current_os': 'MacOS' if platform.system() == 'darwin' else platform.system(),
+            'current_running_apps': running_apps,
+        }, interactive_elements)
+    return payload, interactive_elements
+
+def grab_frame(timings=None):
+    capture_timings = {}
+    with timed(timings, 'capture'):
+        frame = screen_capture.capture_frame(capture_timings)
+    return frame, capture_timings
+
+def encode_screenshot(frame, capture_timings, timings=None):
+    with timed(timings, 'encode'):
+        screenshot, _ = screen_capture.take_screenshot(frame=frame, timings=capture_timings)
+    return screenshot
+
+async def observe(timings=None, with_screenshot=True):
+    """
+    Builds the next request payload. The accessibility walk and the frame grab run concurrently on
+    their worker threads. The frame is only encoded when the model asked for a screenshot or the UI
+    contains a web view; otherwise the grab is dropped, which costs less than waiting for the walk
+    before deciding whether to grab.
+    """
+    global screenshot_requested
+    loop = asyncio.get_running_loop()
+    with timed(timings, 'observe'):
+        ui = loop.run_in_executor(_ui_executor, read_ui, timings)
+        frame = loop.run_in_executor(_screen_executor, grab_frame, timings) if with_screenshot else None
+        payload, interactive_elements = await ui
+
+        # Automatically trigger screenshot if WebView is present
+        has_webview = any(e.get("type") == "PossibleWebView" for e in interactive_elements)
+        if frame is not None and (screenshot_requested or has_webview):
+            screenshot = await loop.run_in_executor(_screen_executor, encode_screenshot, *(await frame), timings)
+            payload.update(screenshot)
+            screenshot_requested = False
+
+    return payload
+
+def get_next_step(payload):
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        response = post_agent_request('/next_step', payload)
         if response.status_code in (200, 201, 202):
             return response.json()
+        check_observation_refs(response.status_code)
     except Exception as e:
         print(f"[❌] Error sending next step request: {e}")
     
     return None
 
-def get_current_subtask():
-    url = os.getenv('NEURALAGENT_API_URL') + '/aiagent/' + os.getenv('NEURALAGENT_THREAD_ID') + '/current_subtask'
-    headers = {
-        'Content-Type': 'application/json',
-        'Authorization': 'Bearer ' + os.getenv('NEURALAGENT_USER_ACCESS_TOKEN'),
-    }
-    payload = {
-        'current_os': 'MacOS' if platform.system() == 'darwin' else platform.system(),
-        'current_interactive_elements': ui_extraction.extract_interactive_elements(),
-        'current_running_apps': ui_extraction.get_running_apps(),
-    }
+def stream_step(payload):
+    """
+    Yields the NDJSON events of the combined streaming step endpoint as they arrive:
+    the current {"type": "subtask"}, {"type": "action", ...} for every action the model has
+    finished generating, then a single {"type": "done", "response": ...} or {"type": "error", ...}.
+    The server advances the plan itself, so one observation and one request cover the whole step.
+    """
     try:
-        response = requests.post(url, json=payload, headers=headers)
+        with post_agent_request('/step/stream', payload, stream=True,
+                                headers={'Accept': 'application/x-ndjson'}) as response:
+            if response.status_code not in (200, 201, 202):
+                print(f"[❌] Step stream failed with status {response.status_code}")
+                check_observation_refs(response.status_code)
+                return
+            for line in response.iter_lines(decode_unicode=True):
+                if line:
+                    yield json.loads(line)
+    except Exception as e:
+        print(f"[❌] Error streaming step: {e}")
+
+async def iterate_in_thread(make_iterator):
+    """Drives a blocking iterator on a worker thread and yields its items without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    end = object()
+
+    def pump():
+        try:
+            for item in make_iterator():
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, end)
+
+    pumping = loop.run_in_executor(None, pump)
+    while True:
+        item = await queue.get()
+        if item is end:
+            break
+        yield item
+    await pumping
+
+def run_action(action, timings=None):
+    with timed(timings, 'execute'):
+        perform_single_action(action)
+
+def queue_step_action(action, step_state):
+    if action.get('action') in ['task_completed', 'subtask_failed']:
+        step_state['finished'] = True
+    elif not step_state['finished']:
+        step_state['actions'].append(asyncio.get_running_loop().run_in_executor(
+            _action_executor, run_action, action, step_state['timings']))
+
+def handle_step_event(event, step_state):
+    """
+    Applies one streamed step event. Actions are queued on the action thread as they arrive;
+    step_state tracks whether the task ended or the subtask failed, the final response and which
+    actions were already queued.
+    """
+    if event.get('type') == 'action':
+        index = event.get('index', step_state['next_index'])
+        if index < step_state['next_index']:
+            # Replayed after a reconnect, already executed
+            return
+        step_state['next_index'] = index + 1
+        queue_step_action(event.get('action') or {}, step_state)
+    elif event.get('type') == 'done':
+        step_state['response'] = event.get('response')
+        # The final response is authoritative: run any action that was not streamed on its own
+        actions = (step_state['response'] or {}).get('actions') or []
+        for action in actions[step_state['next_index']:]:
+            step_state['next_index'] += 1
+            queue_step_action(action or {}, step_state)
+    elif event.get('type') == 'error':
+        print(f"[❌] Next step error: {event.get('message')}")
+        check_observation_refs(event.get('status'))
+
+def new_step_state():
+    return {'finished': False, 'response': None, 'next_index': 0, 'timings': new_step_timings(), 'actions': []}
+
+def start_step():
+    """New step state whose observation is already under way."""
+    step_state = new_step_state()
+    step_state['started'] = time.perf_counter()
+    step_state['observation'] = asyncio.create_task(observe(step_state['timings']))
+    return step_state
+
+async def run_step(events, step_state):
+    """
+    Executes actions while the model is still generating the rest of the step.
+    Returns (response, finished) once the final reply arrived and every queued action has run,
+    where finished is True once the task ended or the subtask failed.
+    """
+    with timed(step_state['timings'], 'network'):
+        async for event in events:
+            handle_step_event(event, step_state)
+    await asyncio.gather(*step_state['actions'])
+    return step_state['response'], step_state['finished']
+
+
+class AgentSession:
+    """
+    Long-lived WebSocket session with the backend: authenticated once, then one message per
+    request instead of a new HTTP request (and auth lookup) per step. Requests are numbered; after a
+    dropped connection the client reconnects with its session id and resends the pending request,
+    and the backend replays that step's result instead of running it again.
+    """
+
+    def __init__(self):
+        api_url = os.getenv('NEURALAGENT_API_URL')
+        self.base_url = api_url.replace('https://', 'wss://', 1).replace('http://', 'ws://', 1) \
+            + '/aiagent/' + os.getenv('NEURALAGENT_THREAD_ID') + '/session'
+        self.session_id = None
+        self.seq = 0
+        self.ws = None
+
+    async def connect(self):
+        params = {'token': os.getenv('NEURALAGENT_USER_ACCESS_TOKEN')}
+        if self.session_id:
+            params['session_id'] = self.session_id
+        self.ws = await websockets.connect(self.base_url + '?' + urlencode(params), max_size=None)
+        greeting = json.loads(await self.ws.recv())
+        self.session_id = greeting.get('session_id')
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+            self.ws = None
+
+    async def request(self, request_type, observation):
+        """Yields the replies to one request until its done/error reply."""
+        self.seq += 1
+        message = json.dumps({'type': request_type, 'seq': self.seq, 'observation': observation})
+        backoff = Backoff()
+
+        for attempt in range(AGENT_SESSION_RETRIES):
+            try:
+                if self.ws is None:
+                    await self.connect()
+                await self.ws.send(message)
+                while True:
+                    reply = json.loads(await self.ws.recv())
+                    if reply.get('seq') != self.seq:
+                        continue
+                    yield reply
+                    if reply.get('type') in ('done', 'error'):
+                        return
+            except (websockets.ConnectionClosed, OSError) as e:
+                print(f"[❌] Agent session connection lost: {e}")
+                self.ws = None
+                if isinstance(e, websockets.ConnectionClosed) and e.rcvd is not None \
+                        and e.rcvd.code in AGENT_SESSION_FATAL_CLOSE_CODES:
+                    break
+                await backoff.async_sleep()
+
+        yield {'type': 'error', 'message': 'Agent session unavailable'}
+
+
+def check_observation_refs(status_code):
+    # The backend lost the previous observation (restart, another worker): the next request sends it in full
+    if status_code == 409:
+        element_codec.reset_base()
+        screen_capture.reset_reference()
+
+def get_current_subtask(payload):
+    try:
+        response = post_agent_request('/current_subtask', payload)
         if response.status_code in (200, 201, 202):
             return response.json()
+        check_observation_refs(response.status_code)
     except:
         pass
     return None
 
-async def main_loop():
+async def pipelined_loop(send_step):
+    """
+    Observe, think, act with the stages overlapped: actions run as the model streams them, and
+    the next observation starts as soon as the step's actions are done, before this step's
+    bookkeeping. send_step(payload) returns the step's replies as an async iterator.
+    """
+    backoff = Backoff()
+    step_state = start_step()
     while True:
-        current_subtask_response = get_current_subtask()
+        action_response, finished = await run_step(send_step(await step_state['observation']), step_state)
+        next_step_state = start_step() if action_response is not None and not finished else None
+
+        report_step_timings(step_state['timings'], (time.perf_counter() - step_state['started']) * 1000)
+        print("NeuralAgent Next Step Response:", action_response)
+        if finished:
+            break
+        if next_step_state is None:
+            await backoff.async_sleep()
+            next_step_state = start_step()
+        else:
+            backoff.reset()
+        step_state = next_step_state
+
+async def session_loop():
+    session = AgentSession()
+    try:
+        await pipelined_loop(lambda payload: session.request('step', payload))
+    finally:
+        await session.close()
+
+async def polling_loop():
+    """Separate current_subtask and next_step requests, for backends without the combined step endpoint."""
+    loop = asyncio.get_running_loop()
+    backoff = Backoff()
+    while True:
+        timings = new_step_timings()
+        started = time.perf_counter()
+
+        payload = await observe(timings, with_screenshot=False)
+        with timed(timings, 'network'):
+            current_subtask_response = await asyncio.to_thread(get_current_subtask, payload)
         if not current_subtask_response:
+            await backoff.async_sleep()
             continue
 
         if current_subtask_response.get('action') == 'task_completed':
             break
 
-        action_response = get_next_step()
+        payload = await observe(timings)
+        with timed(timings, 'network'):
+            action_response = await asyncio.to_thread(get_next_step, payload)
         print("NeuralAgent Next Step Response:", action_response)
 
         if not action_response:
+            await backoff.async_sleep()
             continue
+        backoff.reset()
 
         if any(a['action'] in ['task_completed', 'subtask_failed'] for a in action_response.get('actions', [])):
             break
 
-        perform_action(action_response)
+        with timed(timings, 'execute'):
+            await loop.run_in_executor(_action_executor, perform_action, action_response)
+        report_step_timings(timings, (time.perf_counter() - started) * 1000)
+
+async def main_loop():
+    if USE_AGENT_SESSION:
+        await session_loop()
+    elif STREAM_NEXT_STEP:
+        await pipelined_loop(lambda payload: iterate_in_thread(lambda: stream_step(payload)))
+    else:
+        await polling_loop()
 
 if __name__ == "__main__":
     asyncio.run(main_loop())
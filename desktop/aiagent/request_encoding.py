@@ -0,0 +1,48 @@
+import base64
+import gzip
+import json
+import os
+from urllib3 import encode_multipart_formdata
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Content-Encoding of request bodies: gzip | zstd (needs the zstandard package) | none
+REQUEST_ENCODING = os.getenv('NEURALAGENT_REQUEST_ENCODING', 'gzip').lower()
+# Send the screenshot as a binary multipart part instead of base64 inside the JSON
+MULTIPART_SCREENSHOTS = os.getenv('NEURALAGENT_MULTIPART_SCREENSHOTS', 'true').lower() == 'true'
+
+
+def _compress(body):
+    if REQUEST_ENCODING == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3).compress(body), 'zstd'
+    if REQUEST_ENCODING in ('gzip', 'zstd'):
+        return gzip.compress(body, compresslevel=5), 'gzip'
+    return body, None
+
+
+def encode_request_body(payload):
+    """
+    Serialize a step payload for the backend. Returns (body bytes, headers).
+    With a screenshot and MULTIPART_SCREENSHOTS the JSON goes in a "payload" part and the image
+    bytes in a "screenshot" part; either way the body is then compressed per REQUEST_ENCODING.
+    """
+    screenshot_b64 = payload.get('screenshot_b64') if MULTIPART_SCREENSHOTS else None
+    if screenshot_b64:
+        fields = {key: value for key, value in payload.items() if key != 'screenshot_b64'}
+        media_type = payload.get('screenshot_media_type') or 'application/octet-stream'
+        body, content_type = encode_multipart_formdata({
+            'payload': json.dumps(fields, separators=(',', ':')),
+            'screenshot': ('screenshot', base64.b64decode(screenshot_b64), media_type),
+        })
+    else:
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        content_type = 'application/json'
+
+    headers = {'Content-Type': content_type}
+    body, encoding = _compress(body)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return body, headers
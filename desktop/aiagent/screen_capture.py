@@ -0,0 +1,237 @@
+import base64
+import os
+import secrets
+import threading
+import time
+from io import BytesIO
+import mss
+from PIL import Image, ImageChops
+
+# Size the model sees; action coordinates and element bounding boxes use the same space
+SCREENSHOT_SIZE = (1280, 720)
+# jpeg | webp | png
+SCREENSHOT_FORMAT = os.getenv('NEURALAGENT_SCREENSHOT_FORMAT', 'jpeg').lower()
+SCREENSHOT_QUALITY = int(os.getenv('NEURALAGENT_SCREENSHOT_QUALITY', '70'))
+# primary: the display actions are performed on; all: the whole virtual screen; or an mss monitor index
+SCREENSHOT_MONITOR = os.getenv('NEURALAGENT_SCREENSHOT_MONITOR', 'primary').lower()
+
+# Skip uploading frames that look the same as the last one sent; the backend reuses its copy
+SCREENSHOT_DEDUPE = os.getenv('NEURALAGENT_SCREENSHOT_DEDUPE', 'true').lower() == 'true'
+# Per-pixel grey level difference (0-255) on the signature thumbnail that counts as a change
+SCREENSHOT_DEDUPE_THRESHOLD = int(os.getenv('NEURALAGENT_SCREENSHOT_DEDUPE_THRESHOLD', '32'))
+# Each signature pixel averages an 8x8 block of the frame, so a blinking 1px text caret stays below the threshold
+SIGNATURE_SIZE = (SCREENSHOT_SIZE[0] // 8, SCREENSHOT_SIZE[1] // 8)
+
+# full: every changed frame is uploaded whole; tiles: only the changed tiles plus a thumbnail, the
+# backend pastes them onto its copy of the previous frame
+SCREENSHOT_MODE = os.getenv('NEURALAGENT_SCREENSHOT_MODE', 'full').lower()
+# Multiples of the signature block, so each tile maps onto whole signature pixels
+SCREENSHOT_TILE_SIZE = (160, 80)
+# Above this share of changed tiles a full frame is smaller than the tiles
+SCREENSHOT_TILE_MAX_FRACTION = float(os.getenv('NEURALAGENT_SCREENSHOT_TILE_MAX_FRACTION', '0.5'))
+SCREENSHOT_THUMBNAIL_SIZE = (320, 180)
+# A full frame after this many tiled ones bounds drift, and blur when the backend had lost the base
+SCREENSHOT_KEYFRAME_INTERVAL = int(os.getenv('NEURALAGENT_SCREENSHOT_KEYFRAME_INTERVAL', '10'))
+
+MEDIA_TYPES = {
+    'jpeg': 'image/jpeg',
+    'webp': 'image/webp',
+    'png': 'image/png',
+}
+
+# Reusing one mss instance avoids re-enumerating monitors and re-creating device contexts per shot.
+# mss handles are bound to the thread that created them.
+_sct = {}
+
+
+def _get_sct():
+    key = threading.get_ident()
+    if key not in _sct:
+        _sct[key] = mss.mss()
+    return _sct[key]
+
+
+def _select_monitor(monitors):
+    """
+    monitors[0] is the union of all displays; grabbing it on multi-monitor setups is slow and
+    squeezes several screens into one 1280x720 frame that no longer matches the click coordinates.
+    """
+    if SCREENSHOT_MONITOR == 'all':
+        return monitors[0]
+    if SCREENSHOT_MONITOR.isdigit() and int(SCREENSHOT_MONITOR) < len(monitors):
+        return monitors[int(SCREENSHOT_MONITOR)]
+    # pyautogui addresses the primary display, which is the one anchored at the origin
+    for monitor in monitors[1:]:
+        if monitor['left'] == 0 and monitor['top'] == 0:
+            return monitor
+    return monitors[1] if len(monitors) > 1 else monitors[0]
+
+
+def capture_frame(timings=None):
+    """Grab the selected monitor and scale it to SCREENSHOT_SIZE."""
+    timings = {} if timings is None else timings
+
+    started = time.perf_counter()
+    sct = _get_sct()
+    shot = sct.grab(_select_monitor(sct.monitors))
+    img = Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+    timings['grab_ms'] = round((time.perf_counter() - started) * 1000, 1)
+
+    started = time.perf_counter()
+    if img.size != SCREENSHOT_SIZE:
+        # reducing_gap does a cheap integer box reduction first on large (e.g. 4K) frames
+        img = img.resize(SCREENSHOT_SIZE, Image.BILINEAR, reducing_gap=2.0)
+    timings['resize_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    return img
+
+
+def encode_frame(img, image_format=None, quality=None, timings=None):
+    """Returns (encoded bytes, media type)."""
+    image_format = image_format or SCREENSHOT_FORMAT
+    if image_format not in MEDIA_TYPES:
+        image_format = 'jpeg'
+    quality = SCREENSHOT_QUALITY if quality is None else quality
+    timings = {} if timings is None else timings
+
+    started = time.perf_counter()
+    buffer = BytesIO()
+    if image_format == 'jpeg':
+        img.save(buffer, format="JPEG", quality=quality)
+    elif image_format == 'webp':
+        img.save(buffer, format="WEBP", quality=quality, method=2)
+    else:
+        img.save(buffer, format="PNG", compress_level=1)
+    timings['encode_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    timings['bytes'] = buffer.tell()
+    return buffer.getvalue(), MEDIA_TYPES[image_format]
+
+
+_last_sent = {'screenshot_id': None, 'signature': None, 'tiled_frames': 0}
+
+
+def frame_signature(img):
+    """Small greyscale thumbnail compared between frames instead of the full image."""
+    return img.convert("L").resize(SIGNATURE_SIZE, Image.BOX)
+
+
+def changed_mask(signature, other, threshold=None):
+    """Signature-sized mask, white where the frames differ by more than the threshold."""
+    threshold = SCREENSHOT_DEDUPE_THRESHOLD if threshold is None else threshold
+    return ImageChops.difference(signature, other).point(lambda p: 255 if p > threshold else 0)
+
+
+def frames_differ(signature, other, threshold=None):
+    return changed_mask(signature, other, threshold).getbbox() is not None
+
+
+def _tile_boxes():
+    tile_w, tile_h = SCREENSHOT_TILE_SIZE
+    for row in range(SCREENSHOT_SIZE[1] // tile_h):
+        for col in range(SCREENSHOT_SIZE[0] // tile_w):
+            yield col, row, (col * tile_w, row * tile_h, (col + 1) * tile_w, (row + 1) * tile_h)
+
+
+def _signature_box(box):
+    scale = SCREENSHOT_SIZE[0] // SIGNATURE_SIZE[0]
+    return tuple(edge // scale for edge in box)
+
+
+def encode_tiles(img, mask, base_id, timings=None):
+    """
+    The screenshot_tiles request field for the tiles of img whose part of mask is set, or None
+    when so much changed that a full frame is cheaper. Also returns the boxes of the tiles sent.
+    """
+    timings = {} if timings is None else timings
+    started = time.perf_counter()
+
+    boxes = [(col, row, box) for col, row, box in _tile_boxes() if mask.crop(_signature_box(box)).getbbox()]
+    total = (SCREENSHOT_SIZE[0] // SCREENSHOT_TILE_SIZE[0]) * (SCREENSHOT_SIZE[1] // SCREENSHOT_TILE_SIZE[1])
+    if len(boxes) > SCREENSHOT_TILE_MAX_FRACTION * total:
+        return None, []
+
+    tiles = []
+    size = 0
+    media_type = None
+    for col, row, box in boxes:
+        data, media_type = encode_frame(img.crop(box))
+        size += len(data)
+        tiles.append([col, row, base64.b64encode(data).decode("utf-8")])
+
+    thumbnail, thumbnail_media_type = encode_frame(img.resize(SCREENSHOT_THUMBNAIL_SIZE, Image.BOX),
+                                                   image_format='jpeg', quality=50)
+    size += len(thumbnail)
+
+    timings['encode_ms'] = round((time.perf_counter() - started) * 1000, 1)
+    timings['bytes'] = size
+    timings['tiles'] = len(tiles)
+    return {
+        'base': base_id,
+        'width': SCREENSHOT_SIZE[0],
+        'height': SCREENSHOT_SIZE[1],
+        'tile_width': SCREENSHOT_TILE_SIZE[0],
+        'tile_height': SCREENSHOT_TILE_SIZE[1],
+        'tiles': tiles,
+        'media_type': media_type,
+        'thumbnail_b64': base64.b64encode(thumbnail).decode("utf-8"),
+        'thumbnail_media_type': thumbnail_media_type,
+    }, [box for _, _, box in boxes]
+
+
+def reset_reference():
+    """Forget the last frame sent, e.g. after the backend answered 409 Stale_Screenshot_Ref."""
+    _last_sent['screenshot_id'] = None
+    _last_sent['signature'] = None
+
+
+def take_screenshot(dedupe=None, frame=None, timings=None):
+    """
+    Capture and encode one frame. Returns the request fields and the stage timings in milliseconds.
+    The fields are {"screenshot_b64", "screenshot_media_type", "screenshot_id"}, or only
+    {"screenshot_ref"} when dedupe is on and the screen looks unchanged since the last frame sent,
+    or {"screenshot_tiles", "screenshot_id"} in tiles mode when only part of the screen changed.
+    frame is an image already returned by capture_frame, with the timings it filled in; the grab is
+    then skipped.
+    """
+    dedupe = SCREENSHOT_DEDUPE if dedupe is None else dedupe
+    timings = {} if timings is None else timings
+    img = capture_frame(timings) if frame is None else frame
+
+    mask = None
+    if dedupe:
+        started = time.perf_counter()
+        signature = frame_signature(img)
+        if _last_sent['signature'] is not None:
+            mask = changed_mask(signature, _last_sent['signature'])
+        timings['signature_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if mask is not None and mask.getbbox() is None:
+            timings['unchanged'] = True
+            print(f"📸 Screen unchanged, reusing screenshot {_last_sent['screenshot_id']}")
+            return {'screenshot_ref': _last_sent['screenshot_id']}, timings
+
+    if mask is not None and SCREENSHOT_MODE == 'tiles' and _last_sent['tiled_frames'] < SCREENSHOT_KEYFRAME_INTERVAL:
+        screenshot_tiles, boxes = encode_tiles(img, mask, _last_sent['screenshot_id'], timings)
+        if screenshot_tiles is not None:
+            print(f"📸 Screenshot {timings['tiles']} tiles {timings['bytes'] // 1024}KB: grab {timings['grab_ms']}ms, "
+                  f"resize {timings['resize_ms']}ms, encode {timings['encode_ms']}ms")
+            screenshot_id = secrets.token_hex(8)
+            # Track what the backend's frame now looks like: the old one with the sent tiles replaced
+            for box in boxes:
+                signature_box = _signature_box(box)
+                _last_sent['signature'].paste(signature.crop(signature_box), signature_box[:2])
+            _last_sent['screenshot_id'] = screenshot_id
+            _last_sent['tiled_frames'] += 1
+            return {'screenshot_tiles': screenshot_tiles, 'screenshot_id': screenshot_id}, timings
+
+    data, media_type = encode_frame(img, timings=timings)
+    print(f"📸 Screenshot {media_type} {timings['bytes'] // 1024}KB: grab {timings['grab_ms']}ms, "
+          f"resize {timings['resize_ms']}ms, encode {timings['encode_ms']}ms")
+    screenshot_id = secrets.token_hex(8)
+    if dedupe:
+        _last_sent['screenshot_id'] = screenshot_id
+        _last_sent['signature'] = signature
+        _last_sent['tiled_frames'] = 0
+    return {
+        'screenshot_b64': base64.b64encode(data).decode("utf-8"),
+        'screenshot_media_type': media_type,
+        'screenshot_id': screenshot_id,
+    }, timings
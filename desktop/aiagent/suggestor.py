@@ -2,40 +2,27 @@ import os
 import platform
 import requests
 import ui_extraction
-import mss
-from io import BytesIO
-from PIL import Image
-import base64
+import element_codec
+import screen_capture
+import request_encoding
 import json
 
 
-def take_screenshot_b64():
-    with mss.mss() as sct:
-        monitor = sct.monitors[1]
-        shot = sct.grab(monitor)
-        img = Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
-        img = img.resize((1280, 720))
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        return base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-
 def get_suggestions():
     api_url = os.getenv("NEURALAGENT_API_URL") + '/aiagent/suggestor'
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": "Bearer " + os.getenv("NEURALAGENT_USER_ACCESS_TOKEN"),
-    }
 
-    payload = {
+    screenshot, _ = screen_capture.take_screenshot(dedupe=False)
+    # The suggestor is not tied to a thread, so there is no earlier observation to refer to
+    payload = element_codec.add_elements({
         "current_os": "MacOS" if platform.system() == "darwin" else platform.system(),
-        "current_interactive_elements": ui_extraction.extract_interactive_elements(),
         "current_running_apps": ui_extraction.get_running_apps(),
-        "screenshot_b64": take_screenshot_b64(),
-    }
+        **screenshot,
+    }, ui_extraction.extract_interactive_elements(), allow_delta=False)
 
     try:
-        response = requests.post(api_url, json=payload, headers=headers)
+        body, headers = request_encoding.encode_request_body(payload)
+        headers["Authorization"] = "Bearer " + os.getenv("NEURALAGENT_USER_ACCESS_TOKEN")
+        response = requests.post(api_url, data=body, headers=headers)
         if response.status_code in (200, 201):
             return response.json()
         else:
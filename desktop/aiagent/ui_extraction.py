@@ -2,6 +2,10 @@ import platform
 import pyautogui
 import psutil
 import os
+import heapq
+import subprocess
+import threading
+import time
 
 if platform.system() == "Windows":
     import win32gui
@@ -33,6 +37,29 @@ except ImportError:
     pyatspi = None
 
 
+# Traversal budget for the accessibility tree walk
+UI_MAX_NODES = int(os.getenv('NEURALAGENT_UI_MAX_NODES', '3000'))
+UI_MAX_DEPTH = int(os.getenv('NEURALAGENT_UI_MAX_DEPTH', '40'))
+UI_DEADLINE_SECONDS = float(os.getenv('NEURALAGENT_UI_DEADLINE', '1.5'))
+UI_PRIORITY_FOCUSED = 0
+UI_PRIORITY_VISIBLE = 1
+UI_PRIORITY_OTHER = 2
+
+# Extracted elements are reused until the foreground window changes, an action marks them stale
+# or they are older than this many seconds
+OBSERVATION_TTL_SECONDS = float(os.getenv('NEURALAGENT_OBSERVATION_TTL', '2.0'))
+
+_observation_lock = threading.Lock()
+_observation_cache = {
+    'signature': None,
+    'elements': None,
+    'captured_at': 0.0,
+    'stale': True,
+    # Bumped on every invalidation so an extraction that raced with one is not trusted
+    'generation': 0,
+}
+
+
 def get_bounding_rect(x, y, width, height):
     screen_w, screen_h = pyautogui.size()
     scale_x = 1280 / screen_w
@@ -171,119 +198,269 @@ def extract_desktop_icons_windows():
     return icons
 
 
+def traverse_ui_tree(roots, read_node, max_nodes=None, max_depth=None, deadline_seconds=None):
+    """
+    Budgeted best-first walk shared by the platform extractors.
+
+    read_node(node, depth) returns None to prune the node's whole subtree (offscreen, hidden,
+    zero-area), or (element, children, priority) where element is the interactive element to emit
+    (or None) and priority is 0 for focused, 1 for visible and 2 for other subtrees. Children inherit
+    the most urgent priority of their ancestors and are visited breadth-first within a priority.
+
+    Stops after max_nodes nodes, below max_depth or at the deadline and returns
+    (elements, truncated) where truncated tells whether part of the tree was skipped.
+    """
+    max_nodes = UI_MAX_NODES if max_nodes is None else max_nodes
+    max_depth = UI_MAX_DEPTH if max_depth is None else max_depth
+    deadline = time.monotonic() + (UI_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds)
+
+    heap = [(UI_PRIORITY_OTHER, 0, order, root) for order, root in enumerate(roots)]
+    order = len(heap)
+    elements = []
+    visited = 0
+    truncated = False
+
+    while heap:
+        if visited >= max_nodes or time.monotonic() >= deadline:
+            truncated = True
+            break
+
+        inherited_priority, depth, _, node = heapq.heappop(heap)
+        visited += 1
+        try:
+            result = read_node(node, depth)
+        except Exception:
+            continue
+        if result is None:
+            continue
+
+        element, children, priority = result
+        if element is not None:
+            element["depth"] = depth
+            elements.append(element)
+
+        if not children:
+            continue
+        if depth >= max_depth:
+            truncated = True
+            continue
+
+        child_priority = min(inherited_priority, priority)
+        for child in children:
+            heapq.heappush(heap, (child_priority, depth + 1, order, child))
+            order += 1
+
+    return elements, truncated
+
+
+def _on_screen(x, y, w, h, screen_w, screen_h):
+    return w > 0 and h > 0 and x < screen_w and y < screen_h and x + w > 0 and y + h > 0
+
+
+# UIA_* ids from UIAutomationClient.h, used with the raw IUIAutomation interfaces
+UIA_TREE_SCOPE_ELEMENT = 1
+UIA_TREE_SCOPE_CHILDREN = 2
+UIA_BOUNDING_RECTANGLE_PROPERTY_ID = 30001
+UIA_CONTROL_TYPE_PROPERTY_ID = 30003
+UIA_NAME_PROPERTY_ID = 30005
+
+WINDOWS_INTERACTIVE_CONTROLS = {
+    "ButtonControl", "EditControl", "CheckBoxControl", "ComboBoxControl",
+    "HyperlinkControl", "TabItemControl", "MenuItemControl"
+}
+
+_uia_cache_request = None
+# Cleared after the first failure so unsupported setups go straight to the per-property walk
+_uia_cache_supported = True
+
+
+def _get_uia_cache_request():
+    """
+    One CacheRequest for the whole process: control type, name and bounding rectangle are fetched
+    for the element and its children in a single cross-process call, control view only.
+    """
+    global _uia_cache_request
+    if _uia_cache_request is None:
+        uia = auto._AutomationClient.instance().IUIAutomation
+        request = uia.CreateCacheRequest()
+        for property_id in (UIA_CONTROL_TYPE_PROPERTY_ID, UIA_NAME_PROPERTY_ID, UIA_BOUNDING_RECTANGLE_PROPERTY_ID):
+            request.AddProperty(property_id)
+        request.TreeScope = UIA_TREE_SCOPE_ELEMENT | UIA_TREE_SCOPE_CHILDREN
+        request.TreeFilter = uia.ControlViewCondition
+        _uia_cache_request = request
+    return _uia_cache_request
+
+
+def _windows_element(control_type, name, left, top, right, bottom, depth, screen_w, screen_h):
+    """Shared by the cached and the per-property walks. Returns False to prune the subtree."""
+    w = right - left
+    h = bottom - top
+    if depth > 0 and not _on_screen(left, top, w, h, screen_w, screen_h):
+        return False
+    if control_type in WINDOWS_INTERACTIVE_CONTROLS and w > 0 and h > 0:
+        return {
+            "type": control_type.replace('Control', ''),
+            "label": name,
+            "bounding_box": get_bounding_rect(left, top, w, h),
+        }
+    return None
+
+
+def _extract_ui_elements_windows_cached(foreground, screen_w, screen_h):
+    """
+    Walks raw IUIAutomationElements built with the shared CacheRequest. Expanding a node is one
+    BuildUpdatedCache call that returns its children with their properties already cached, so the
+    Cached* reads below never leave the process.
+    """
+    request = _get_uia_cache_request()
+
+    def read_node(element, depth):
+        rect = element.CachedBoundingRectangle
+        control_type = auto.ControlTypeNames.get(element.CachedControlType, "")
+        found = _windows_element(control_type, element.CachedName or "", rect.left, rect.top, rect.right,
+                                 rect.bottom, depth, screen_w, screen_h)
+        if found is False:
+            return None
+
+        # Children arrive with Cached* properties only; re-fetch with the request to cache grandchildren
+        cached_children = element.BuildUpdatedCache(request).GetCachedChildren()
+        children = [cached_children.GetElement(i) for i in range(cached_children.Length)] if cached_children else []
+        return found, children, UI_PRIORITY_FOCUSED if depth == 0 else UI_PRIORITY_VISIBLE
+
+    return traverse_ui_tree([foreground.Element.BuildUpdatedCache(request)], read_node)
+
+
+def _extract_ui_elements_windows_uncached(foreground, screen_w, screen_h):
+    """Per-property walk through uiautomation Controls: four cross-process calls per node."""
+
+    def read_node(control, depth):
+        rect = control.BoundingRectangle
+        found = _windows_element(control.ControlTypeName, control.Name or "", rect.left, rect.top, rect.right,
+                                 rect.bottom, depth, screen_w, screen_h)
+        if found is False:
+            return None
+        return found, control.GetChildren(), UI_PRIORITY_FOCUSED if depth == 0 else UI_PRIORITY_VISIBLE
+
+    return traverse_ui_tree([foreground], read_node)
+
+
 def extract_ui_elements_windows():
     """
     Extract UI Automation interactive elements from the active foreground window.
+    Returns (elements, truncated).
     """
     if not auto:
-        return []
+        return [], False
     
     try:
         foreground = auto.GetForegroundControl()
-        elements = []
+        screen_w, screen_h = pyautogui.size()
+    except:
+        return [], False
 
-        def recurse(control, depth=0):
-            try:
-                control_type = control.ControlTypeName
-                name = control.Name or ""
-                rect = control.BoundingRectangle
-            except Exception:
-                return
-            w = rect.right - rect.left
-            h = rect.bottom - rect.top
-            if w > 0 and h > 0:
-                interactive = {
-                    "ButtonControl", "EditControl", "CheckBoxControl", "ComboBoxControl",
-                    "HyperlinkControl", "TabItemControl", "MenuItemControl"
-                }
-                if control_type in interactive:
-                    elements.append({
-                        "type": control_type.replace('Control', ''),
-                        "label": name,
-                        "bounding_box": get_bounding_rect(rect.left, rect.top, w, h),
-                        "depth": depth
-                    })
-            for child in control.GetChildren():
-                recurse(child, depth + 1)
+    global _uia_cache_supported
+    if _uia_cache_supported:
+        try:
+            return _extract_ui_elements_windows_cached(foreground, screen_w, screen_h)
+        except Exception as e:
+            # Older uiautomation/comtypes builds without cache request support
+            print('UIA cache request walk failed, falling back to per-property reads: ', e)
+            _uia_cache_supported = False
 
-        recurse(foreground)
-        return elements
+    try:
+        return _extract_ui_elements_windows_uncached(foreground, screen_w, screen_h)
     except:
-        return []
+        return [], False
 
 
 def extract_ui_elements_macos():
     """
-    Extract macOS Accessibility interactive elements globally.
+    Extract macOS Accessibility interactive elements globally, frontmost application first.
+    Returns (elements, truncated).
     """
     if not AXUIElementCreateSystemWide:
-        return []
+        return [], False
 
     system = AXUIElementCreateSystemWide()
-    elements = []
+    screen_w, screen_h = pyautogui.size()
+    interactive = {"AXButton", "AXTextField", "AXCheckBox", "AXComboBox", "AXMenuItem", "AXTabGroup"}
+
+    def read_node(element, depth):
+        role = AXUIElementCopyAttributeValue(element, kAXRoleAttribute)
+        title = AXUIElementCopyAttributeValue(element, kAXTitleAttribute) or ""
+        value = AXUIElementCopyAttributeValue(element, kAXValueAttribute) or ""
+        children = AXUIElementCopyAttributeValue(element, kAXChildrenAttribute) or []
 
-    def recurse(element, depth=0):
+        priority = UI_PRIORITY_VISIBLE
+        if role == "AXApplication" and AXUIElementCopyAttributeValue(element, 'AXFrontmost'):
+            priority = UI_PRIORITY_FOCUSED
+
+        frame = None
         try:
-            role = AXUIElementCopyAttributeValue(element, kAXRoleAttribute)
-            title = AXUIElementCopyAttributeValue(element, kAXTitleAttribute) or ""
-            value = AXUIElementCopyAttributeValue(element, kAXValueAttribute) or ""
-            children = AXUIElementCopyAttributeValue(element, kAXChildrenAttribute) or []
+            f = AXUIElementCopyAttributeValue(element, 'AXFrame')
+            frame = (f.x, f.y, f.width, f.height)
         except Exception:
-            return
-
-        interactive = {"AXButton", "AXTextField", "AXCheckBox", "AXComboBox", "AXMenuItem", "AXTabGroup"}
-        if role in interactive:
-            try:
-                f = AXUIElementCopyAttributeValue(element, 'AXFrame')
-                x, y, w, h = f.x, f.y, f.width, f.height
-                if w > 0 and h > 0:
-                    elements.append({
-                        "type": role.replace('AX', ''),
-                        "label": title or value,
-                        "bounding_box": scaled_bounding_rect(x, y, w, h),
-                        "depth": depth
-                    })
-            except Exception:
-                pass
+            pass
+        if frame is not None and role not in ("AXApplication", "AXSystemWide") \
+                and not _on_screen(*frame, screen_w, screen_h):
+            return None
 
-        for child in children:
-            recurse(child, depth + 1)
+        found = None
+        if role in interactive and frame is not None and frame[2] > 0 and frame[3] > 0:
+            found = {
+                "type": role.replace('AX', ''),
+                "label": title or value,
+                "bounding_box": get_bounding_rect(*frame),
+            }
+        return found, children, priority
 
-    recurse(system)
-    return elements
+    return traverse_ui_tree([system], read_node)
 
 
 def extract_ui_elements_linux():
     """
-    Extract AT-SPI interactive elements on Linux desktop.
+    Extract AT-SPI interactive elements on Linux desktop, active application first.
+    Returns (elements, truncated).
     """
     if not pyatspi:
-        return []
+        return [], False
 
     desktop = pyatspi.Registry.getDesktop(0)
-    elements = []
-
-    def recurse(obj, depth=0):
-        try:
-            role = obj.getRoleName()
-            name = obj.name or ""
-        except Exception:
-            return
+    screen_w, screen_h = pyautogui.size()
+    interactive = {"push button", "check box", "combo box", "text", "hyperlink", "menu item"}
+
+    def read_node(obj, depth):
+        role = obj.getRoleName()
+        name = obj.name or ""
+        state = obj.getState()
+
+        priority = UI_PRIORITY_VISIBLE
+        if state.contains(pyatspi.STATE_ACTIVE) or state.contains(pyatspi.STATE_FOCUSED):
+            priority = UI_PRIORITY_FOCUSED
+
+        # The desktop and application nodes carry no geometry or SHOWING state of their own
+        bounding_box = None
+        if role not in ("desktop frame", "application"):
+            if not state.contains(pyatspi.STATE_SHOWING):
+                return None
+            try:
+                extents = obj.queryComponent().getExtents(pyatspi.DESKTOP_COORDS)
+                if not _on_screen(extents.x, extents.y, extents.width, extents.height, screen_w, screen_h):
+                    return None
+                bounding_box = get_bounding_rect(extents.x, extents.y, extents.width, extents.height)
+            except NotImplementedError:
+                pass
 
-        interactive = {"push button", "check box", "combo box", "text", "hyperlink", "menu item"}
+        element = None
         if role.lower() in interactive:
-            elements.append({
+            element = {
                 "type": role.title().replace(' ', ''),
                 "label": name,
-                "bounding_box": None,
-                "depth": depth
-            })
-
-        for i in range(obj.childCount):
-            recurse(obj.getChildAtIndex(i), depth + 1)
+                "bounding_box": bounding_box,
+            }
+        return element, [obj.getChildAtIndex(i) for i in range(obj.childCount)], priority
 
-    recurse(desktop)
-    return elements
+    return traverse_ui_tree([desktop], read_node)
 
 
 def detect_possible_webview(bounding_boxes, screen_w, screen_h, threshold=0.5):
@@ -317,7 +494,99 @@ def detect_possible_webview(bounding_boxes, screen_w, screen_h, threshold=0.5):
     return None
 
 
-def extract_interactive_elements():
+def get_foreground_signature():
+    """
+    Cheap identity of what is on screen: the foreground window (handle, title and geometry) plus the
+    screen size. Much cheaper than walking the accessibility tree, so it is used to validate the cache.
+    """
+    system = platform.system()
+    screen_size = tuple(pyautogui.size())
+    try:
+        if system == "Windows":
+            hwnd = win32gui.GetForegroundWindow()
+            return (hwnd, win32gui.GetWindowText(hwnd), win32gui.GetWindowRect(hwnd), screen_size)
+
+        elif system == "Darwin":
+            active = subprocess.check_output(
+                ["osascript", "-e", 'tell application "System Events" to get name of first process whose frontmost is true']
+            ).decode().strip()
+            return (active, screen_size)
+
+        elif system == "Linux":
+            window_id = subprocess.check_output(["xdotool", "getactivewindow"]).decode().strip()
+            title = subprocess.check_output(["xdotool", "getwindowname", window_id]).decode().strip()
+            geometry = subprocess.check_output(["xdotool", "getwindowgeometry", window_id]).decode().strip()
+            return (window_id, title, geometry, screen_size)
+    except Exception:
+        pass
+    return None
+
+
+_worker_state = threading.local()
+
+
+def init_worker_thread():
+    """
+    Prepare a thread that runs extractions. UI Automation is COM, which has to be initialized on
+    each thread that calls it; the initializer is kept for the lifetime of the thread.
+    """
+    if auto is not None:
+        _worker_state.uia = auto.UIAutomationInitializerInThread()
+
+
+def invalidate_observation():
+    """Mark the cached elements as stale, e.g. after an action that changes the UI."""
+    with _observation_lock:
+        _observation_cache['stale'] = True
+        _observation_cache['generation'] += 1
+
+
+def has_screen_changed(since_signature=None):
+    """
+    Cheap check that never walks the accessibility tree. With since_signature (a value returned by
+    get_foreground_signature) it compares against that; otherwise it is True when the UI may differ
+    from the last extraction: an action invalidated it, the foreground window changed, or there is
+    no extraction yet.
+    """
+    if since_signature is not None:
+        return get_foreground_signature() != since_signature
+
+    with _observation_lock:
+        if _observation_cache['stale'] or _observation_cache['elements'] is None:
+            return True
+        signature = _observation_cache['signature']
+    return signature is None or get_foreground_signature() != signature
+
+
+def extract_interactive_elements(max_age=None):
+    """
+    Cached front of the accessibility-tree walk. A cached tree is returned while it is younger than
+    max_age (default NEURALAGENT_OBSERVATION_TTL), no action invalidated it and the foreground window
+    is unchanged. Pass max_age=0 to force a fresh extraction.
+    """
+    max_age = OBSERVATION_TTL_SECONDS if max_age is None else max_age
+    signature = get_foreground_signature()
+
+    with _observation_lock:
+        cached = _observation_cache['elements']
+        if (cached is not None and not _observation_cache['stale'] and signature is not None
+                and signature == _observation_cache['signature']
+                and time.monotonic() - _observation_cache['captured_at'] < max_age):
+            return list(cached)
+        generation = _observation_cache['generation']
+
+    elements = _extract_interactive_elements_uncached()
+
+    with _observation_lock:
+        _observation_cache['signature'] = signature
+        _observation_cache['elements'] = elements
+        _observation_cache['captured_at'] = time.monotonic()
+        _observation_cache['stale'] = generation != _observation_cache['generation']
+
+    return list(elements)
+
+
+def _extract_interactive_elements_uncached():
     """
     Combine native elements on Windows (and only include desktop icons when no window is active),
     or fallback native on macOS/Linux.
@@ -326,8 +595,10 @@ def extract_interactive_elements():
     system = platform.system()
     raw = []
 
+    truncated = False
+
     if system == "Windows":
-        ui = extract_ui_elements_windows()
+        ui, truncated = extract_ui_elements_windows()
         icons = []
         # only show icons when no UI controls found (i.e., desktop is active)
         if not ui:
@@ -335,10 +606,10 @@ def extract_interactive_elements():
         raw = ui + icons
 
     elif system == "Darwin":
-        raw = extract_ui_elements_macos()
+        raw, truncated = extract_ui_elements_macos()
 
     elif system == "Linux":
-        raw = extract_ui_elements_linux()
+        raw, truncated = extract_ui_elements_linux()
 
     else:
         raise NotImplementedError(f"Unsupported platform: {system}")
@@ -357,4 +628,12 @@ def extract_interactive_elements():
     if webview_hint:
         interactive.append(webview_hint)
 
+    if truncated:
+        interactive.append({
+            "id": -2,
+            "type": "TruncatedTree",
+            "label": "UI tree exceeded the extraction budget; focused and visible elements were listed first",
+            "bounding_box": None,
+        })
+
     return interactive
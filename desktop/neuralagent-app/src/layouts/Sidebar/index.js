@@ -38,7 +38,7 @@ export default function Sidebar() {
     if (isPrivateMode) {
       // En modo privado podríamos tener un endpoint libre; si no, mostrar lista vacía sin error
       axios.get('/threads', {}).then((response) => {
-        setThreads(response.data);
+        setThreads(response.data.items);
       }).catch(() => {});
       return;
     }
@@ -48,7 +48,7 @@ export default function Sidebar() {
         'Authorization': 'Bearer ' + accessToken,
       }
     }).then((response) => {
-      setThreads(response.data);
+      setThreads(response.data.items);
       dispatch(setLoadingDialog(false));
     }).catch((error) => {
       dispatch(setLoadingDialog(false));
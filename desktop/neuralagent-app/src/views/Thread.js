@@ -80,6 +80,7 @@ export default function Thread() {
   
   const [thread, setThread] = useState(null);
   const [messages, setMessages] = useState([]);
+  const [earlierMessagesCursor, setEarlierMessagesCursor] = useState(null);
   const [messageText, setMessageText] = useState('');
   const [isSendingMessage, setSendingMessage] = useState(false);
   const [backgroundMode, setBackgroundMode] = useState(false);
@@ -97,6 +98,9 @@ export default function Thread() {
   const { tid } = useParams();
 
   const bottomRef = useRef(null);
+  const messagesSinceRef = useRef(null);
+  const skipScrollRef = useRef(false);
+  const threadSocketRef = useRef(null);
   const recognitionRef = useRef(null);
   const fileInputRef = useRef(null);
   const silenceTimerRef = useRef(null);
@@ -122,10 +126,12 @@ export default function Thread() {
 
   const getThreadMessages = () => {
     dispatch(setLoadingDialog(true));
-    axios.get(`/threads/${tid}/thread_messages`, {
+    return axios.get(`/threads/${tid}/thread_messages`, {
       headers: { 'Authorization': 'Bearer ' + accessToken }
     }).then(response => {
-      setMessages(response.data);
+      setMessages(response.data.items);
+      setEarlierMessagesCursor(response.data.next_cursor);
+      messagesSinceRef.current = response.data.since;
       dispatch(setLoadingDialog(false));
     }).catch(error => {
       dispatch(setLoadingDialog(false));
@@ -135,6 +141,84 @@ export default function Thread() {
     });
   };
 
+  const getNewThreadMessages = () => {
+    if (!messagesSinceRef.current) {
+      getThreadMessages();
+      return;
+    }
+    axios.get(`/threads/${tid}/thread_messages`, {
+      params: { since: messagesSinceRef.current },
+      headers: { 'Authorization': 'Bearer ' + accessToken }
+    }).then(response => {
+      messagesSinceRef.current = response.data.since;
+      if (response.data.items.length > 0) {
+        // The thread event socket may already have delivered some of these
+        setMessages(prevMessages => {
+          const knownIds = new Set(prevMessages.map(msg => msg.id));
+          const newMessages = response.data.items.filter(msg => !knownIds.has(msg.id));
+          return newMessages.length > 0 ? [...prevMessages, ...newMessages] : prevMessages;
+        });
+      }
+    }).catch(error => {
+      if (error.response?.status === constants.status.UNAUTHORIZED) {
+        window.location.reload();
+      }
+    });
+  };
+
+  const connectThreadEvents = (attempt = 0) => {
+    const params = new URLSearchParams({ token: accessToken || '' });
+    if (messagesSinceRef.current) {
+      params.append('since', messagesSinceRef.current);
+    }
+    const socket = new WebSocket(`${constants.WEBSOCKET_URL}/threads/${tid}/ws?${params.toString()}`);
+    threadSocketRef.current = socket;
+
+    socket.onopen = () => {
+      attempt = 0;
+    };
+    socket.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      if (data.type === 'thread_message') {
+        messagesSinceRef.current = data.cursor;
+        setMessages(prevMessages => prevMessages.some(msg => msg.id === data.message.id)
+          ? prevMessages : [...prevMessages, data.message]);
+      } else if (data.type === 'thread_status') {
+        setThread(prevThread => ({ ...prevThread, status: data.status }));
+      }
+    };
+    socket.onclose = (event) => {
+      // 4401/4404: invalid token or thread, reconnecting would not help
+      if (threadSocketRef.current !== socket || event.code === 4401 || event.code === 4404) {
+        return;
+      }
+      // Reconnect with backoff; the since cursor makes the server replay anything missed meanwhile
+      setTimeout(() => {
+        if (threadSocketRef.current === socket) {
+          connectThreadEvents(attempt + 1);
+        }
+      }, Math.min(30000, 1000 * 2 ** attempt));
+    };
+  };
+
+  const getEarlierThreadMessages = () => {
+    if (!earlierMessagesCursor) {
+      return;
+    }
+    axios.get(`/threads/${tid}/thread_messages`, {
+      params: { before: earlierMessagesCursor },
+      headers: { 'Authorization': 'Bearer ' + accessToken }
+    }).then(response => {
+      skipScrollRef.current = true;
+      setMessages(prevMessages => [...response.data.items, ...prevMessages]);
+      setEarlierMessagesCursor(response.data.next_cursor);
+    }).catch(error => {
+      if (error.response?.status === constants.status.UNAUTHORIZED) {
+        window.location.reload();
+      }
+    });
+  };
+
   const sendMessage = () => {
     if (messageText.length === 0 || isSendingMessage || thread.status === 'working') {
       return;
@@ -170,7 +254,7 @@ export default function Thread() {
       }
       // TODO Remove
       getThread();
-      getThreadMessages();
+      getNewThreadMessages();
     }).catch((error) => {
       dispatch(setLoadingDialog(false));
       setSendingMessage(false);
@@ -226,7 +310,7 @@ export default function Thread() {
       dispatch(setLoadingDialog(false));
       window.electronAPI.stopAIAgent();
       // TODO Remove
-      getThreadMessages();
+      getNewThreadMessages();
       getThread();
     }).catch((error) => {
       dispatch(setLoadingDialog(false));
@@ -368,10 +452,20 @@ export default function Thread() {
 
   useEffect(() => {
     getThread();
-    getThreadMessages();
+    getThreadMessages().then(() => connectThreadEvents());
+
+    return () => {
+      const socket = threadSocketRef.current;
+      threadSocketRef.current = null;
+      socket?.close();
+    };
   }, [tid]);
 
   useEffect(() => {
+    if (skipScrollRef.current) {
+      skipScrollRef.current = false;
+      return;
+    }
     bottomRef.current?.scrollIntoView({ behavior: 'smooth' });
   }, [messages]);
 
@@ -387,7 +481,7 @@ export default function Thread() {
     if (window.electronAPI?.onAIAgentExit) {
       window.electronAPI.onAIAgentExit(() => {
         getThread();
-        getThreadMessages();
+        getNewThreadMessages();
       });
     }
   }, []);
@@ -442,6 +536,13 @@ export default function Thread() {
           </div>
         </Header>
         <ChatContainer>
+          {earlierMessagesCursor && (
+            <div style={{ display: 'flex', justifyContent: 'center', marginBottom: '10px' }}>
+              <ModeToggle onClick={getEarlierThreadMessages}>
+                Load earlier messages
+              </ModeToggle>
+            </div>
+          )}
           {messages.map((msg) => (
             <ChatMessage key={'thread_message__' + msg.id} message={msg} />
           ))}